@@ -0,0 +1,190 @@
+from typing import Tuple
+import numpy as np
+from config import Config
+
+
+def _verified_pairs(matrix: np.ndarray, ids: np.ndarray, threshold: float, other_ids: np.ndarray = None,
+                    block_rows: int = 1024) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    对候选集合做精确余弦校验，返回相似度大于阈值的下标对
+    other_ids为None时在ids内部两两比较
+    """
+    if other_ids is None:
+        other_ids = ids
+    rows_out = []
+    cols_out = []
+    others = matrix[other_ids]
+    for start in range(0, len(ids), block_rows):
+        part = ids[start:start + block_rows]
+        rows, cols = np.nonzero(matrix[part] @ others.T > threshold)
+        rows_out.append(part[rows])
+        cols_out.append(other_ids[cols])
+    if not rows_out:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(rows_out), np.concatenate(cols_out)
+
+
+def _unique_pairs(rows: np.ndarray, cols: np.ndarray, n: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    规范化为 i < j 的形式并去重
+    """
+    low = np.minimum(rows, cols).astype(np.int64)
+    high = np.maximum(rows, cols).astype(np.int64)
+    keep = low != high
+    keys = np.unique(low[keep] * n + high[keep])
+    return keys // n, keys % n
+
+
+class LSHIndex:
+    """
+    随机超平面LSH，同一哈希桶内的项作为候选对
+    num_tables越大召回越高，num_bits越大桶越小、速度越快
+    """
+    def __init__(self, num_tables: int = None, num_bits: int = None, seed: int = None):
+        self.num_tables = num_tables or Config.ANN_LSH_TABLES
+        self.num_bits = num_bits or Config.ANN_LSH_BITS
+        self.seed = Config.ANN_SEED if seed is None else seed
+
+    def similar_pairs(self, matrix: np.ndarray, threshold: float) -> Tuple[np.ndarray, np.ndarray]:
+        n, dim = matrix.shape
+        rng = np.random.default_rng(self.seed)
+        weights = 1 << np.arange(self.num_bits, dtype=np.int64)
+        rows_out = []
+        cols_out = []
+        for _ in range(self.num_tables):
+            planes = rng.standard_normal((dim, self.num_bits)).astype(np.float32)
+            codes = ((matrix @ planes) > 0) @ weights
+            order = np.argsort(codes, kind='stable')
+            bounds = np.flatnonzero(np.diff(codes[order])) + 1
+            for bucket in np.split(order, bounds):
+                if len(bucket) < 2:
+                    continue
+                rows, cols = _verified_pairs(matrix, bucket, threshold)
+                rows_out.append(rows)
+                cols_out.append(cols)
+        if not rows_out:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return _unique_pairs(np.concatenate(rows_out), np.concatenate(cols_out), n)
+
+
+class IVFIndex:
+    """
+    倒排文件索引：球面k-means粗聚类，每项在最近的num_probes个簇内查找候选
+    num_probes越大召回越高，num_cells越大每个簇越小、速度越快
+    """
+    def __init__(self, num_cells: int = None, num_probes: int = None, iterations: int = 10, seed: int = None):
+        self.num_cells = num_cells or Config.ANN_IVF_CELLS
+        self.num_probes = num_probes or Config.ANN_IVF_PROBES
+        self.iterations = iterations
+        self.seed = Config.ANN_SEED if seed is None else seed
+        self.centroids = None
+        self.assignments = np.zeros(0, dtype=np.int64)
+
+    def _train(self, matrix: np.ndarray, num_cells: int) -> np.ndarray:
+        rng = np.random.default_rng(self.seed)
+        # 在样本上训练聚类中心
+        sample_size = min(len(matrix), num_cells * 40)
+        sample = matrix[rng.choice(len(matrix), sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, num_cells, replace=False)].copy()
+        for _ in range(self.iterations):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            filled = norms[:, 0] > 0
+            centroids[filled] = sums[filled] / norms[filled]
+        return centroids
+
+    def _probe(self, matrix: np.ndarray, centroids: np.ndarray, probes: int, block_rows: int = 4096) -> np.ndarray:
+        """
+        返回每项最近的probes个簇，第0列为最近的簇
+        """
+        result = np.empty((len(matrix), probes), dtype=np.int64)
+        for start in range(0, len(matrix), block_rows):
+            sims = matrix[start:start + block_rows] @ centroids.T
+            top = np.argpartition(-sims, probes - 1, axis=1)[:, :probes]
+            order = np.argsort(-np.take_along_axis(sims, top, axis=1), axis=1)
+            result[start:start + block_rows] = np.take_along_axis(top, order, axis=1)
+        return result
+
+    def fit(self, matrix: np.ndarray):
+        """
+        在matrix上训练聚类中心，并将每一行归入最近的簇
+        """
+        num_cells = min(len(matrix), self.num_cells or max(1, int(np.sqrt(len(matrix)))))
+        self.centroids = self._train(matrix, num_cells)
+        self.assignments = self._probe(matrix, self.centroids, 1)[:, 0]
+        return self
+
+    def add(self, vectors: np.ndarray):
+        """
+        追加新行，按已有聚类中心归簇，不重新训练
+        """
+        if len(vectors):
+            self.assignments = np.concatenate([self.assignments, self._probe(vectors, self.centroids, 1)[:, 0]])
+
+    def __len__(self):
+        return len(self.assignments)
+
+    def _iter_cells(self, probed: np.ndarray):
+        """
+        按簇生成 (簇内成员, 探测该簇的查询)
+        """
+        num_cells, probes = len(self.centroids), probed.shape[1]
+        members = np.argsort(self.assignments, kind='stable')
+        member_bounds = np.searchsorted(self.assignments[members], np.arange(num_cells + 1))
+        queries = np.argsort(probed.ravel(), kind='stable')
+        query_bounds = np.searchsorted(probed.ravel()[queries], np.arange(num_cells + 1))
+        queries //= probes
+        for cell in range(num_cells):
+            cell_members = members[member_bounds[cell]:member_bounds[cell + 1]]
+            cell_queries = queries[query_bounds[cell]:query_bounds[cell + 1]]
+            if len(cell_members) and len(cell_queries):
+                yield cell_members, cell_queries
+
+    def search(self, matrix: np.ndarray, queries: np.ndarray, threshold: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        在已索引的matrix中为每个查询查找最相似的一行
+        Returns:
+            (最相似行下标, 相似度)，相似度不大于阈值的查询下标为-1
+        """
+        best = np.full(len(queries), -1, dtype=np.int64)
+        best_sims = np.full(len(queries), -np.inf, dtype=np.float32)
+        probed = self._probe(queries, self.centroids, min(len(self.centroids), self.num_probes))
+        for cell_members, cell_queries in self._iter_cells(probed):
+            sims = queries[cell_queries] @ matrix[cell_members].T
+            top = np.argmax(sims, axis=1)
+            top_sims = sims[np.arange(len(cell_queries)), top]
+            better = top_sims > best_sims[cell_queries]
+            best[cell_queries[better]] = cell_members[top[better]]
+            best_sims[cell_queries[better]] = top_sims[better]
+        best[best_sims <= threshold] = -1
+        return best, best_sims
+
+    def similar_pairs(self, matrix: np.ndarray, threshold: float) -> Tuple[np.ndarray, np.ndarray]:
+        self.fit(matrix)
+        # 每项归入最近的簇，并在其探测的所有簇中查找
+        probed = self._probe(matrix, self.centroids, min(len(self.centroids), self.num_probes))
+        rows_out = []
+        cols_out = []
+        for cell_members, cell_queries in self._iter_cells(probed):
+            rows, cols = _verified_pairs(matrix, cell_queries, threshold, cell_members)
+            rows_out.append(rows)
+            cols_out.append(cols)
+        if not rows_out:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return _unique_pairs(np.concatenate(rows_out), np.concatenate(cols_out), len(matrix))
+
+
+def create_ann_index(kind: str = None):
+    """
+    按配置创建近似最近邻索引，kind为none时返回None表示使用精确计算
+    """
+    kind = kind or Config.DEDUP_ANN_INDEX
+    if kind == 'none':
+        return None
+    if kind == 'lsh':
+        return LSHIndex()
+    if kind == 'ivf':
+        return IVFIndex()
+    raise ValueError(f"未知的ANN索引类型: {kind}")
@@ -0,0 +1,72 @@
+"""
+ANN候选生成的召回率与耗时基准
+
+在合成数据上对比精确分块计算与LSH/IVF索引找到的相似对，报告召回率和耗时
+用法(在项目根目录执行):
+    python -m benchmarks.ann_recall --items 20000 --dim 256
+"""
+import argparse
+import time
+import numpy as np
+from ann_index import LSHIndex, IVFIndex
+from dedup import normalize_rows, _iter_blocks
+
+
+def make_dataset(items: int, dim: int, duplicate_ratio: float, noise: float, seed: int) -> np.ndarray:
+    """
+    生成合成embedding：随机基向量加上围绕部分基向量的近似重复项
+    """
+    rng = np.random.default_rng(seed)
+    base_count = max(1, int(items * (1 - duplicate_ratio)))
+    base = rng.standard_normal((base_count, dim)).astype(np.float32)
+    parents = rng.integers(0, base_count, items - base_count)
+    duplicates = base[parents] + noise * rng.standard_normal((len(parents), dim)).astype(np.float32)
+    matrix = np.vstack([base, duplicates])
+    return normalize_rows(matrix[rng.permutation(items)])
+
+
+def exact_pairs(matrix: np.ndarray, threshold: float) -> set:
+    pairs = set()
+    for r0, r1, above in _iter_blocks(matrix, threshold, 256):
+        rows, cols = np.nonzero(np.triu(above, k=1))
+        pairs.update(zip((rows + r0).tolist(), (cols + r0).tolist()))
+    return pairs
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ANN候选生成召回率基准')
+    parser.add_argument('--items', type=int, default=20000)
+    parser.add_argument('--dim', type=int, default=256)
+    parser.add_argument('--threshold', type=float, default=0.9)
+    parser.add_argument('--duplicate-ratio', type=float, default=0.3)
+    parser.add_argument('--noise', type=float, default=0.02)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    matrix = make_dataset(args.items, args.dim, args.duplicate_ratio, args.noise, args.seed)
+
+    start = time.perf_counter()
+    truth = exact_pairs(matrix, args.threshold)
+    exact_seconds = time.perf_counter() - start
+    print(f"exact: pairs={len(truth)} time={exact_seconds:.2f}s")
+
+    indexes = {
+        'lsh(tables=8,bits=12)': LSHIndex(num_tables=8, num_bits=12),
+        'lsh(tables=16,bits=12)': LSHIndex(num_tables=16, num_bits=12),
+        'lsh(tables=32,bits=10)': LSHIndex(num_tables=32, num_bits=10),
+        'ivf(probes=1)': IVFIndex(num_probes=1),
+        'ivf(probes=4)': IVFIndex(num_probes=4),
+        'ivf(probes=8)': IVFIndex(num_probes=8),
+    }
+    for name, index in indexes.items():
+        start = time.perf_counter()
+        rows, cols = index.similar_pairs(matrix, args.threshold)
+        seconds = time.perf_counter() - start
+        found = set(zip(rows.tolist(), cols.tolist()))
+        recall = len(found & truth) / len(truth) if truth else 1.0
+        print(f"{name}: pairs={len(found)} recall={recall:.4f} time={seconds:.2f}s "
+              f"speedup={exact_seconds / seconds:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
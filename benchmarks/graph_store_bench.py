@@ -0,0 +1,105 @@
+"""
+图存储后端的内存与遍历基准
+
+在合成的幂律图上对比 networkx 与 compact 后端的构建耗时、常驻内存、
+CSR快照构建耗时，以及k跳扩展和两跳邻域遍历的延迟
+用法(在项目根目录执行):
+    python -m benchmarks.graph_store_bench --nodes 200000 --edges 1000000
+"""
+import argparse
+import gc
+import statistics
+import time
+import tracemalloc
+import numpy as np
+from config import Config
+from graph_retrieval import expand_subgraph
+from knowledge_graph import create_knowledge_graph
+
+
+def make_graph_data(nodes: int, edges: int, relations: int, seed: int):
+    """
+    生成合成实体和关系，端点按Zipf分布抽取，形成少量高度数枢纽节点
+    """
+    rng = np.random.default_rng(seed)
+    entities = [{'entity': f"实体{i}", 'type': f"类型{i % 5}", 'aliases': []} for i in range(nodes)]
+    heads = (rng.zipf(1.5, edges) - 1) % nodes
+    tails = rng.integers(0, nodes, edges)
+    relation_ids = rng.integers(0, relations, edges)
+    triples = [(f"实体{h}", f"关系{r}", f"实体{t}") for h, r, t in zip(heads.tolist(), relation_ids.tolist(), tails.tolist())]
+    return entities, triples
+
+
+def two_hop_networkx(graph, name: str) -> int:
+    seen = {name}
+    for neighbor in graph.graph.adj[name]:
+        seen.add(neighbor)
+        seen.update(graph.graph.adj[neighbor])
+    return len(seen)
+
+
+def two_hop_csr(snapshot, name: str) -> int:
+    node_id = snapshot.lookup(name)
+    first = snapshot.indices[snapshot.neighbors(node_id)]
+    seen = np.zeros(snapshot.num_nodes, dtype=bool)
+    seen[node_id] = True
+    seen[first] = True
+    seen[snapshot.gather_neighbors(first)] = True
+    return int(seen.sum())
+
+
+def report(label: str, func, queries):
+    latencies = []
+    for name in queries:
+        start = time.perf_counter()
+        func(name)
+        latencies.append((time.perf_counter() - start) * 1000)
+    print(f"  {label}: p50={statistics.median(latencies):.2f}ms max={max(latencies):.2f}ms")
+
+
+def bench_backend(graph_type: str, entities, triples, queries):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    graph = create_knowledge_graph(graph_type)
+    graph.add_entities(entities)
+    graph.add_relations(triples)
+    build_seconds = time.perf_counter() - start
+    graph_memory = tracemalloc.get_traced_memory()[0] / 1024 / 1024
+
+    start = time.perf_counter()
+    snapshot = graph.csr_snapshot()
+    snapshot_seconds = time.perf_counter() - start
+    total_memory = tracemalloc.get_traced_memory()[0] / 1024 / 1024
+    tracemalloc.stop()
+
+    print(f"{graph_type}: nodes={graph.number_of_nodes():,} edges={graph.number_of_edges():,}")
+    print(f"  build: {build_seconds:.2f}s memory={graph_memory:.1f}MB")
+    print(f"  csr snapshot: {snapshot_seconds:.2f}s memory with snapshot={total_memory:.1f}MB")
+
+    report('k-hop expand', lambda name: expand_subgraph(snapshot, [(name, 1.0)]), queries)
+    if graph_type == 'networkx':
+        report('2-hop traversal (dict-of-dicts)', lambda name: two_hop_networkx(graph, name), queries)
+    report('2-hop traversal (CSR)', lambda name: two_hop_csr(snapshot, name), queries)
+
+def main():
+    parser = argparse.ArgumentParser(description='图存储后端内存与遍历基准')
+    parser.add_argument('--nodes', type=int, default=100000)
+    parser.add_argument('--edges', type=int, default=500000)
+    parser.add_argument('--relations', type=int, default=50)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--backends', nargs='+', choices=['networkx', 'compact'], default=['networkx', 'compact'])
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    entities, triples = make_graph_data(args.nodes, args.edges, args.relations, args.seed)
+    rng = np.random.default_rng(args.seed + 1)
+    # 查询种子中包含度数最高的枢纽节点
+    queries = ["实体0"] + [f"实体{i}" for i in rng.integers(0, args.nodes, args.queries - 1).tolist()]
+    print(f"graph: {args.nodes:,} nodes, {args.edges:,} relations (GRAPH_BATCH_SIZE={Config.GRAPH_BATCH_SIZE})")
+    for graph_type in args.backends:
+        bench_backend(graph_type, entities, triples, queries)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+"""
+端到端导入与查询基准，使用本地确定性替身代替线上模型服务
+
+对多个语料规模分别测量 Preprocessor.process、KnowledgeGraph构建、
+Flask /analyze 与 /query 接口，报告吞吐、各阶段耗时和峰值内存
+用法(在项目根目录执行):
+    python -m benchmarks.ingest_bench --sizes 20000 100000 --chat-latency 0.05
+"""
+import argparse
+import functools
+import random
+import statistics
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from config import Config
+
+# 各阶段需要计时的Preprocessor方法
+STAGES = ['extract_entities', 'extract_relations', 'extract_joint_batch',
+          'deduplicate_entities', 'deduplicate_relations', 'resolve_entities', 'embed_entities']
+
+
+def make_corpus(chars: int, vocabulary: int = 2000, seed: int = 0) -> str:
+    """
+    生成合成中文语料：由固定词表随机组成句子
+    """
+    rng = random.Random(seed)
+    words = [''.join(chr(0x4e00 + rng.randrange(0x5000)) for _ in range(2)) for _ in range(vocabulary)]
+    parts = []
+    size = 0
+    while size < chars:
+        sentence = ''.join(rng.choice(words) for _ in range(rng.randint(5, 15))) + rng.choice('，。；！？')
+        parts.append(sentence)
+        size += len(sentence)
+    return ''.join(parts)[:chars]
+
+
+class StageTimer:
+    """
+    包装实例方法，累计每个阶段的调用次数和耗时(并发时为各线程耗时之和)
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+
+    def instrument(self, obj, names):
+        for name in names:
+            method = getattr(obj, name, None)
+            if method is not None:
+                setattr(obj, name, self._wrap(name, method))
+
+    def _wrap(self, name, method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                with self.lock:
+                    self.seconds[name] += time.perf_counter() - start
+                    self.calls[name] += 1
+        return wrapper
+
+    def report(self):
+        for name in STAGES:
+            if self.calls[name]:
+                print(f"    {name:<24} calls={self.calls[name]:<6} total={self.seconds[name]:.3f}s "
+                      f"avg={self.seconds[name] / self.calls[name] * 1000:.2f}ms")
+
+
+def measure(func):
+    """
+    运行func并返回 (结果, 耗时秒, 峰值内存MB)
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = func()
+    finally:
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        tracemalloc.stop()
+    return result, seconds, peak
+
+
+def bench_preprocess(text: str):
+    from preprocessor import Preprocessor
+    from knowledge_graph import create_knowledge_graph
+
+    preprocessor = Preprocessor()
+    timer = StageTimer()
+    timer.instrument(preprocessor, STAGES)
+    result, seconds, peak = measure(lambda: preprocessor.process(text))
+    entities, relations = result
+    print(f"  preprocess: {seconds:.3f}s {len(text) / seconds:,.0f} chars/s peak={peak:.1f}MB "
+          f"entities={len(entities)} relations={len(relations)}")
+    timer.report()
+
+    def build():
+        graph = create_knowledge_graph()
+        graph.add_entities(entities, embeddings=preprocessor.embed_entities(entities))
+        graph.add_relations(relations)
+        return graph
+    graph, seconds, peak = measure(build)
+    print(f"  graph build: {seconds:.3f}s nodes={graph.number_of_nodes()} "
+          f"edges={graph.number_of_edges()} peak={peak:.1f}MB")
+
+
+def bench_flask(text: str, queries: int):
+    import flask_app
+
+    client = flask_app.flask_app.test_client()
+    base = flask_app.FLASK_BASE_PATH
+
+    def analyze():
+        response = client.post(f'{base}/analyze', data={'text': text})
+        assert response.status_code == 200, response.get_data(as_text=True)
+        while True:
+            status = client.get(f'{base}/progress').get_json()
+            if not status['is_running']:
+                return status
+            time.sleep(0.01)
+    _, seconds, peak = measure(analyze)
+    print(f"  /analyze: {seconds:.3f}s {len(text) / seconds:,.0f} chars/s peak={peak:.1f}MB")
+
+    latencies = []
+    for i in range(queries):
+        start = time.perf_counter()
+        response = client.post(f'{base}/query', json={'query': f"问题{i % 20}"})
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.get_data(as_text=True)
+    latencies.sort()
+    print(f"  /query: n={queries} p50={statistics.median(latencies):.2f}ms "
+          f"p95={latencies[int(len(latencies) * 0.95) - 1]:.2f}ms max={latencies[-1]:.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='端到端导入与查询基准')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[20000, 100000, 500000], help='语料字符数')
+    parser.add_argument('--chat-latency', type=float, default=0.0, help='替身Chat调用注入的延迟(秒)')
+    parser.add_argument('--embedding-latency', type=float, default=0.0, help='替身Embedding调用注入的延迟(秒)')
+    parser.add_argument('--concurrency', type=int, default=Config.EXTRACTION_CONCURRENCY)
+    parser.add_argument('--mode', choices=['separate', 'joint'], default=Config.EXTRACTION_MODE)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--use-cache', action='store_true', help='启用embedding和抽取结果缓存')
+    parser.add_argument('--skip-flask', action='store_true')
+    args = parser.parse_args()
+
+    Config.LLM_BACKEND = 'fake'
+    Config.FAKE_LLM_CHAT_LATENCY = args.chat_latency
+    Config.FAKE_LLM_EMBEDDING_LATENCY = args.embedding_latency
+    Config.EXTRACTION_CONCURRENCY = args.concurrency
+    Config.EXTRACTION_MODE = args.mode
+    Config.EMBEDDING_CACHE_ENABLED = args.use_cache
+    Config.EXTRACTION_CACHE_ENABLED = args.use_cache
+
+    for size in args.sizes:
+        text = make_corpus(size)
+        print(f"corpus {size:,} chars (concurrency={args.concurrency}, mode={args.mode})")
+        bench_preprocess(text)
+        if not args.skip_flask:
+            bench_flask(text, args.queries)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+import math
+import re
+import threading
+import weakref
+from collections import Counter
+from typing import Dict, List, Tuple
+import numpy as np
+from config import Config
+from chunk_store import ChunkStore
+from dedup import normalize_rows
+from entity_linker import normalize_mention
+
+_CJK_RANGES = '\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff'
+# CJK以外的文字按词(不含下划线)切分
+_WORD_PATTERN = re.compile(f'[^\\W_{_CJK_RANGES}]+')
+# CJK二元组的词键为 c1 << 21 | c2 (小于2^42)，单字为其码点，其他词取字符串哈希的低42位并置第42位
+_WORD_FLAG = 1 << 42
+# 一次分词的文本数，词键与批内行号打包为一个int64排序计数
+_ROW_BITS = 20
+_TOKENIZE_BATCH = 1 << 12
+
+
+def _is_cjk(codes: np.ndarray) -> np.ndarray:
+    return ((codes >= 0x3400) & (codes <= 0x4dbf)) | ((codes >= 0x4e00) & (codes <= 0x9fff)) \
+        | ((codes >= 0xf900) & (codes <= 0xfaff))
+
+
+def token_keys(texts: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    BM25分词：规范化后连续的CJK字符切分为重叠的二元组(不与相邻字符成对的单字保留单字)，其他文字按词切分
+    词以整数词键表示，CJK部分按码点向量化计算；词键仅在进程内有效
+    Returns:
+        (词所属文本的序号, 词键)
+    """
+    normalized = [normalize_mention(text) for text in texts]
+    codes = np.frombuffer('\n'.join(normalized).encode('utf-32-le'), dtype=np.uint32).astype(np.int64)
+    rows = np.repeat(np.arange(len(texts)), [len(text) + 1 for text in normalized])[:len(codes)]
+    cjk = _is_cjk(codes)
+    pairs = cjk[:-1] & cjk[1:]
+    paired = np.zeros(len(codes), dtype=bool)
+    paired[:-1] |= pairs
+    paired[1:] |= pairs
+    singles = cjk & ~paired
+
+    word_rows, word_keys = [], []
+    for row, text in enumerate(normalized):
+        for word in _WORD_PATTERN.findall(text):
+            word_rows.append(row)
+            word_keys.append(hash(word) & (_WORD_FLAG - 1) | _WORD_FLAG)
+    return (np.concatenate([rows[:-1][pairs], rows[singles], np.array(word_rows, dtype=np.int64)]),
+            np.concatenate([(codes[:-1][pairs] << 21) | codes[1:][pairs], codes[singles],
+                            np.array(word_keys, dtype=np.int64)]))
+
+
+def reciprocal_rank_fusion(rankings: List[List[int]], k: int = None) -> List[Tuple[int, float]]:
+    """
+    倒数排名融合：每个条目的得分为其在各排名中 1 / (k + 名次) 之和，按得分降序返回
+    """
+    k = Config.CHUNK_RRF_K if k is None else k
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, 1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+
+class _Postings:
+    """
+    按词键排序的倒排表：词键为keys[i]的词出现在第rows[i]个chunk中，词频为tfs[i]
+    """
+    def __init__(self, keys: np.ndarray, rows: np.ndarray, tfs: np.ndarray, presorted: bool = False):
+        order = slice(None) if presorted else np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.rows = rows[order]
+        self.tfs = tfs[order]
+
+    @classmethod
+    def empty(cls) -> '_Postings':
+        return cls(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32))
+
+    @classmethod
+    def from_texts(cls, texts: List[str], start_row: int) -> Tuple['_Postings', np.ndarray]:
+        """
+        为从start_row开始编号的一批文本建立倒排表，同时返回每个文本的词数
+        """
+        parts = []
+        lengths = []
+        for batch_start in range(0, len(texts), _TOKENIZE_BATCH):
+            batch = texts[batch_start:batch_start + _TOKENIZE_BATCH]
+            rows, keys = token_keys(batch)
+            lengths.append(np.bincount(rows, minlength=len(batch)))
+            # 词键与批内行号打包后排序计数，同一 (词, 行) 的个数即词频
+            packed, tfs = np.unique((keys << _ROW_BITS) | rows, return_counts=True)
+            parts.append(cls(packed >> _ROW_BITS,
+                             ((packed & ((1 << _ROW_BITS) - 1)) + start_row + batch_start).astype(np.int32),
+                             tfs.astype(np.float32), presorted=True))
+        postings = cls.empty()
+        for part in parts:
+            postings = postings.merge(part) if len(postings) else part
+        lengths = np.concatenate(lengths).astype(np.float32) if lengths else np.zeros(0, dtype=np.float32)
+        return postings, lengths
+
+    def __len__(self):
+        return len(self.rows)
+
+    def lookup(self, keys: np.ndarray) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+        """
+        返回每个词键的 (行, 词频)
+        """
+        starts = np.searchsorted(self.keys, keys)
+        ends = np.searchsorted(self.keys, keys, side='right')
+        return ([self.rows[start:end] for start, end in zip(starts, ends)],
+                [self.tfs[start:end] for start, end in zip(starts, ends)])
+
+    def merge(self, other: '_Postings') -> '_Postings':
+        return _Postings(np.concatenate([self.keys, other.keys]), np.concatenate([self.rows, other.rows]),
+                         np.concatenate([self.tfs, other.tfs]))
+
+
+class ChunkIndex:
+    """
+    chunk的混合检索索引，线程安全，在多次查询之间复用：
+    BM25倒排索引(CJK二元组分词)、归一化的chunk embedding矩阵以及实体到chunk的映射，
+    各路排名经倒数排名融合(RRF)合并。新增chunk写入增量倒排表，超过主倒排表的CHUNK_INDEX_MERGE_RATIO时合并
+    """
+    def __init__(self, store: ChunkStore):
+        self.store = store
+        self.lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.generation = self.store.generation
+        self.last_id = 0
+        self.chunk_ids = np.zeros(0, dtype=np.int64)  # 行 -> chunk ID
+        self.doc_lengths = np.zeros(0, dtype=np.float32)
+        self.main = _Postings.empty()
+        self.delta = _Postings.empty()
+        self.embeddings = None  # 没有embedding的chunk对应零向量
+        self.entity_rows: Dict[str, List[int]] = {}
+
+    def refresh(self):
+        """
+        同步chunk存储中新增的chunk，存储被清空时重建
+        """
+        with self.lock:
+            if self.generation != self.store.generation:
+                self._reset()
+            if self.last_id == self.store.last_id:
+                return
+            chunks = self.store.load_since(self.last_id)
+            if not chunks.ids:
+                return
+            start_row = len(self.chunk_ids)
+
+            postings, lengths = _Postings.from_texts(chunks.texts, start_row)
+            self.delta = self.delta.merge(postings)
+            if len(self.delta) > len(self.main) * Config.CHUNK_INDEX_MERGE_RATIO:
+                self.main = self.main.merge(self.delta)
+                self.delta = _Postings.empty()
+
+            self._append_embeddings(chunks.embeddings)
+            for row, names in enumerate(chunks.entities, start_row):
+                for name in names:
+                    self.entity_rows.setdefault(name, []).append(row)
+            self.chunk_ids = np.concatenate([self.chunk_ids, np.array(chunks.ids, dtype=np.int64)])
+            self.doc_lengths = np.concatenate([self.doc_lengths, lengths])
+            self.last_id = chunks.ids[-1]
+
+    def _append_embeddings(self, embeddings: List[np.ndarray]):
+        dim = next((len(vector) for vector in embeddings if vector is not None), None)
+        if self.embeddings is not None:
+            dim = self.embeddings.shape[1]
+        if dim is None:
+            return
+        # 维度不一致(如更换了embedding模型)的行按零向量处理
+        matrix = np.zeros((len(embeddings), dim), dtype=np.float32)
+        for i, vector in enumerate(embeddings):
+            if vector is not None and len(vector) == dim:
+                matrix[i] = vector
+        matrix = normalize_rows(matrix)
+        if self.embeddings is None:
+            matrix = np.vstack([np.zeros((len(self.chunk_ids), dim), dtype=np.float32), matrix])
+        else:
+            matrix = np.vstack([self.embeddings, matrix])
+        self.embeddings = matrix
+
+    def _bm25_ranking(self, query: str, limit: int) -> List[int]:
+        keys = np.unique(token_keys([query])[1])
+        if not len(keys) or not len(self.doc_lengths):
+            return []
+        k1, b = Config.CHUNK_BM25_K1, Config.CHUNK_BM25_B
+        count = len(self.doc_lengths)
+        norms = k1 * (1 - b + b * self.doc_lengths / max(float(self.doc_lengths.mean()), 1.0))
+        scores = np.zeros(count, dtype=np.float32)
+        main_rows, main_tfs = self.main.lookup(keys)
+        delta_rows, delta_tfs = self.delta.lookup(keys)
+        for rows, tfs in zip(map(np.concatenate, zip(main_rows, delta_rows)),
+                             map(np.concatenate, zip(main_tfs, delta_tfs))):
+            if not len(rows):
+                continue
+            idf = math.log(1 + (count - len(rows) + 0.5) / (len(rows) + 0.5))
+            scores[rows] += idf * tfs * (k1 + 1) / (tfs + norms[rows])
+        return self._top_rows(scores, limit)
+
+    def _vector_ranking(self, query_embedding: np.ndarray, limit: int) -> List[int]:
+        if self.embeddings is None or query_embedding is None or len(query_embedding) != self.embeddings.shape[1]:
+            return []
+        return self._top_rows(self.embeddings @ normalize_rows(np.asarray(query_embedding)[None, :])[0], limit)
+
+    def _entity_ranking(self, entities: List[str], limit: int) -> List[int]:
+        # 提及越多查询实体的chunk排名越靠前
+        counts = Counter(row for name in dict.fromkeys(entities) for row in self.entity_rows.get(name, []))
+        return [row for row, _ in sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:limit]]
+
+    @staticmethod
+    def _top_rows(scores: np.ndarray, limit: int) -> List[int]:
+        positive = np.flatnonzero(scores > 0)
+        if len(positive) > limit:
+            positive = positive[np.argpartition(-scores[positive], limit - 1)[:limit]]
+        return positive[np.argsort(-scores[positive], kind='stable')].tolist()
+
+    def search(self, query: str, query_embedding: np.ndarray = None, entities: List[str] = None,
+               top_k: int = None) -> List[Dict]:
+        """
+        检索与查询及实体相关的chunk，返回原文、偏移、抽取结果和融合得分
+        Args:
+            entities: 查询链接到的实体名称(含别名)，提及这些实体的chunk单独作为一路排名
+        """
+        top_k = top_k or Config.EVIDENCE_TOP_K
+        limit = Config.CHUNK_SEARCH_CANDIDATES
+        self.refresh()
+        with self.lock:
+            rankings = [self._bm25_ranking(query, limit), self._vector_ranking(query_embedding, limit),
+                        self._entity_ranking(entities or [], limit)]
+            fused = reciprocal_rank_fusion(rankings)[:top_k]
+            chunk_ids = [int(self.chunk_ids[row]) for row, _ in fused]
+        chunks = self.store.get_chunks(chunk_ids)
+        return [{**chunks[chunk_id], 'score': score}
+                for chunk_id, (_, score) in zip(chunk_ids, fused) if chunk_id in chunks]
+
+
+_indexes = weakref.WeakKeyDictionary()
+_indexes_lock = threading.Lock()
+
+
+def get_chunk_index(store: ChunkStore) -> ChunkIndex:
+    """
+    获取chunk存储对应的混合检索索引，在多次查询之间复用
+    """
+    with _indexes_lock:
+        index = _indexes.get(store)
+        if index is None:
+            index = ChunkIndex(store)
+            _indexes[store] = index
+        return index
@@ -0,0 +1,195 @@
+import os
+import sqlite3
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import numpy as np
+from config import Config
+from chunker import Chunk
+
+
+class StoredChunks(NamedTuple):
+    """
+    按ID升序排列的一批chunk，embeddings与ids逐行对齐，没有embedding的行为None
+    """
+    ids: List[int]
+    texts: List[str]
+    embeddings: List[Optional[np.ndarray]]
+    entities: List[List[str]]
+
+
+class ChunkStore:
+    """
+    基于sqlite持久化保存chunk原文、在原文中的偏移以及从每个chunk抽取的实体和关系，
+    供查询时引用证据原文。
+    chunk按任务追加：重新分析的结果替换当前图时用retain()只保留新图的chunk，
+    结果未写入图的任务用remove()删除其chunk；每次删除都递增generation，下游索引据此重建。
+    chunk ID自增且不复用，已删除的ID不会指向其他任务的chunk
+    """
+    def __init__(self, path: str = None):
+        path = path or Config.CHUNK_STORE_PATH
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self._create_chunks_table()
+        self.conn.execute('CREATE TABLE IF NOT EXISTS chunk_entities (chunk_id INTEGER NOT NULL, entity TEXT NOT NULL)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS chunk_entities_chunk ON chunk_entities(chunk_id)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS chunk_entities_entity ON chunk_entities(entity)')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS chunk_relations ('
+            'chunk_id INTEGER NOT NULL, head TEXT NOT NULL, relation TEXT NOT NULL, tail TEXT NOT NULL)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS chunk_relations_chunk ON chunk_relations(chunk_id)')
+        self.conn.commit()
+        self.last_id = self.conn.execute('SELECT COALESCE(MAX(id), 0) FROM chunks').fetchone()[0]
+        # 每次删除chunk后递增，下游索引据此判断是否需要重建
+        self.generation = 0
+
+    def _create_chunks_table(self):
+        schema = ('id INTEGER PRIMARY KEY AUTOINCREMENT, document TEXT NOT NULL, start_offset INTEGER NOT NULL, '
+                  'end_offset INTEGER NOT NULL, text TEXT NOT NULL, embedding BLOB')
+        row = self.conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'chunks'").fetchone()
+        if row is None:
+            self.conn.execute(f'CREATE TABLE chunks ({schema})')
+        elif 'AUTOINCREMENT' not in row[0].upper():
+            # 旧版本的表会复用已删除的最大ID，迁移为AUTOINCREMENT并保留已有的chunk
+            self.conn.execute('ALTER TABLE chunks RENAME TO chunks_old')
+            self.conn.execute(f'CREATE TABLE chunks ({schema})')
+            self.conn.execute('INSERT INTO chunks SELECT id, document, start_offset, end_offset, text, embedding '
+                              'FROM chunks_old')
+            self.conn.execute('DROP TABLE chunks_old')
+
+    def add_chunks(self, document: str, chunks: List[Chunk], results: List[Tuple[List[Dict], List[Tuple]]],
+                   embeddings: np.ndarray = None) -> List[int]:
+        """
+        保存一批chunk及其抽取结果，返回chunk ID
+        Args:
+            results: 与chunks逐项对齐的 (实体列表, 关系列表)
+            embeddings: 与chunks逐行对齐的embedding矩阵，可选
+        """
+        with self.lock:
+            ids = []
+            for i, (chunk, (entities, relations)) in enumerate(zip(chunks, results)):
+                embedding = None if embeddings is None else np.asarray(embeddings[i], dtype=np.float32).tobytes()
+                cursor = self.conn.execute(
+                    'INSERT INTO chunks (document, start_offset, end_offset, text, embedding) VALUES (?, ?, ?, ?, ?)',
+                    (document or '', chunk.start, chunk.end, chunk.text, embedding)
+                )
+                chunk_id = cursor.lastrowid
+                names = dict.fromkeys(entity['entity'] for entity in entities)
+                self.conn.executemany('INSERT INTO chunk_entities VALUES (?, ?)',
+                                      [(chunk_id, name) for name in names])
+                self.conn.executemany('INSERT INTO chunk_relations VALUES (?, ?, ?, ?)',
+                                      [(chunk_id, *map(str, relation)) for relation in relations])
+                ids.append(chunk_id)
+            self.conn.commit()
+            self.last_id = max([self.last_id] + ids)
+            return ids
+
+    def load_since(self, last_id: int) -> StoredChunks:
+        """
+        读取ID大于last_id的chunk，用于下游索引增量同步
+        """
+        with self.lock:
+            rows = self.conn.execute('SELECT id, text, embedding FROM chunks WHERE id > ? ORDER BY id',
+                                     (last_id,)).fetchall()
+            entity_rows = self.conn.execute('SELECT chunk_id, entity FROM chunk_entities WHERE chunk_id > ?',
+                                            (last_id,)).fetchall()
+        entities = {}
+        for chunk_id, entity in entity_rows:
+            entities.setdefault(chunk_id, []).append(entity)
+        return StoredChunks(
+            ids=[row[0] for row in rows],
+            texts=[row[1] for row in rows],
+            embeddings=[None if row[2] is None else np.frombuffer(row[2], dtype=np.float32) for row in rows],
+            entities=[entities.get(row[0], []) for row in rows]
+        )
+
+    def get_chunks(self, ids: List[int]) -> Dict[int, Dict]:
+        """
+        返回chunk的原文、偏移及抽取的实体和关系
+        """
+        if not ids:
+            return {}
+        placeholders = ','.join('?' * len(ids))
+        with self.lock:
+            rows = self.conn.execute(
+                f'SELECT id, document, start_offset, end_offset, text FROM chunks WHERE id IN ({placeholders})', ids
+            ).fetchall()
+            entity_rows = self.conn.execute(
+                f'SELECT chunk_id, entity FROM chunk_entities WHERE chunk_id IN ({placeholders})', ids
+            ).fetchall()
+            relation_rows = self.conn.execute(
+                f'SELECT chunk_id, head, relation, tail FROM chunk_relations WHERE chunk_id IN ({placeholders})', ids
+            ).fetchall()
+        chunks = {
+            chunk_id: {'chunk_id': chunk_id, 'document': document, 'start': start, 'end': end, 'text': text,
+                       'entities': [], 'relations': []}
+            for chunk_id, document, start, end, text in rows
+        }
+        for chunk_id, entity in entity_rows:
+            chunks[chunk_id]['entities'].append(entity)
+        for chunk_id, head, relation, tail in relation_rows:
+            chunks[chunk_id]['relations'].append([head, relation, tail])
+        return chunks
+
+    def count(self) -> int:
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM chunks').fetchone()[0]
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute('DELETE FROM chunks')
+            self.conn.execute('DELETE FROM chunk_entities')
+            self.conn.execute('DELETE FROM chunk_relations')
+            self.conn.commit()
+            self.last_id = 0
+            self.generation += 1
+
+    def retain(self, ids: List[int]):
+        """
+        只保留指定ID的chunk，用于重新分析的结果替换当前图时删除旧图的chunk
+        """
+        with self.lock:
+            self.conn.execute('CREATE TEMP TABLE IF NOT EXISTS retained_chunks (id INTEGER PRIMARY KEY)')
+            self.conn.execute('DELETE FROM retained_chunks')
+            self.conn.executemany('INSERT OR IGNORE INTO retained_chunks VALUES (?)', [(i,) for i in ids])
+            self.conn.execute('DELETE FROM chunks WHERE id NOT IN (SELECT id FROM retained_chunks)')
+            self.conn.execute('DELETE FROM chunk_entities WHERE chunk_id NOT IN (SELECT id FROM retained_chunks)')
+            self.conn.execute('DELETE FROM chunk_relations WHERE chunk_id NOT IN (SELECT id FROM retained_chunks)')
+            self.conn.execute('DELETE FROM retained_chunks')
+            self.conn.commit()
+            self.generation += 1
+
+    def remove(self, ids: List[int]):
+        """
+        删除指定ID的chunk，用于结果未写入图的任务(取消或失败)清理其已保存的chunk
+        """
+        if not ids:
+            return
+        rows = [(i,) for i in ids]
+        with self.lock:
+            self.conn.executemany('DELETE FROM chunks WHERE id = ?', rows)
+            self.conn.executemany('DELETE FROM chunk_entities WHERE chunk_id = ?', rows)
+            self.conn.executemany('DELETE FROM chunk_relations WHERE chunk_id = ?', rows)
+            self.conn.commit()
+            self.generation += 1
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_chunk_store() -> Optional[ChunkStore]:
+    """
+    获取进程内共享的chunk存储，未启用时返回None
+    """
+    global _default_store
+    if not Config.CHUNK_STORE_ENABLED:
+        return None
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = ChunkStore()
+        return _default_store
@@ -0,0 +1,138 @@
+from typing import Iterable, Iterator, NamedTuple, Union
+import numpy as np
+from config import Config
+from token_utils import char_token_weights
+
+# 多语言句子分隔符，多字符分隔符(\r\n、...)以其末字符匹配
+SENTENCE_DELIMITERS = [
+    '.', '。', '．',  # 句号
+    '?', '？',       # 问号
+    '!', '！',       # 感叹号
+    ';', '；',       # 分号
+    '\n',            # 换行符
+    '…',             # 省略号
+    '—', '―',        # 破折号
+    '·', '•',        # 项目符号
+    '、', '，',      # 逗号
+    '：', ':'        # 冒号
+]
+
+# 找不到句子分隔符时退而在空白处分割
+WORD_DELIMITERS = [' ', '\t', '　']
+
+# 每次读入的字符数，缓冲区只保留未输出的尾部和一个窗口，内存占用有界
+_WINDOW_CHARS = 65536
+
+_SENTENCE_CODES = np.array([ord(ch) for ch in SENTENCE_DELIMITERS], dtype=np.uint32)
+_WORD_CODES = np.array([ord(ch) for ch in WORD_DELIMITERS], dtype=np.uint32)
+
+
+class Chunk(NamedTuple):
+    text: str
+    start: int  # chunk在原文中的起始字符偏移
+    end: int    # chunk在原文中的结束字符偏移(不含)
+
+
+class _Window:
+    """
+    缓冲区文本及其累计token数和分隔符位置
+    """
+    def __init__(self, text: str):
+        self.text = text
+        codepoints = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+        self.cumulative = np.concatenate([[0.0], np.cumsum(char_token_weights(codepoints))])
+        self.sentences = np.flatnonzero(np.isin(codepoints, _SENTENCE_CODES))
+        self.words = np.flatnonzero(np.isin(codepoints, _WORD_CODES))
+
+    def last_delimiter(self, positions: np.ndarray, floor: int, limit: int) -> int:
+        """
+        返回[floor, limit)中最后一个分隔符的位置，没有时返回-1
+        """
+        i = np.searchsorted(positions, limit) - 1
+        return int(positions[i]) if i >= 0 and positions[i] >= floor else -1
+
+
+def _iter_windows(source: Union[str, Iterable[str]]) -> Iterator[str]:
+    """
+    将输入切成不超过窗口大小的片段
+    """
+    segments = [source] if isinstance(source, str) else source
+    for segment in segments:
+        for i in range(0, len(segment), _WINDOW_CHARS):
+            yield segment[i:i + _WINDOW_CHARS]
+
+
+def iter_chunks(source: Union[str, Iterable[str]], max_tokens: int = None,
+                overlap_tokens: int = None) -> Iterator[Chunk]:
+    """
+    单遍扫描将文本切分为chunk的生成器，按token数控制大小，优先在句子分隔符处分割
+    全程基于偏移处理，不反复复制剩余文本，可在读入全部输入前产出第一个chunk
+    Args:
+        source: 完整文本，或按顺序产出文本片段的可迭代对象（流式输入）
+        max_tokens: 每个chunk的最大token数
+        overlap_tokens: 相邻chunk之间重叠的token数，须小于max_tokens
+    Raises:
+        ValueError: overlap_tokens不小于max_tokens，此时每个chunk只前进一个字符，chunk数接近字符数
+    """
+    max_tokens = max_tokens or Config.CHUNK_MAX_TOKENS
+    overlap_tokens = Config.CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+    if overlap_tokens >= max_tokens:
+        raise ValueError(f"chunk重叠的token数({overlap_tokens})必须小于chunk的最大token数({max_tokens})")
+    pieces = _iter_windows(source)
+
+    window = _Window('')
+    offset = 0     # window.text[0]在原文中的偏移
+    start = 0      # 当前chunk在窗口中的起点
+    floor = 0      # 分割点不得早于该位置，保证每个chunk都有新内容
+    exhausted = False
+
+    while True:
+        # 当前chunk达到max_tokens的位置
+        limit = int(np.searchsorted(window.cumulative, window.cumulative[start] + max_tokens))
+        if limit >= len(window.cumulative):
+            if exhausted:
+                break
+            # 丢弃已输出的部分并读入下一个窗口
+            piece = next(pieces, None)
+            if piece is None:
+                exhausted = True
+                continue
+            offset += start
+            floor -= start
+            window = _Window(window.text[start:] + piece)
+            start = 0
+            continue
+
+        # 优先在句子分隔符后分割，其次在空白处，都没有时在上限处分割
+        cut = window.last_delimiter(window.sentences, floor, limit)
+        if cut < 0:
+            cut = window.last_delimiter(window.words, floor, limit)
+        cut = cut + 1 if cut >= 0 else limit
+        chunk = _make_chunk(window.text, start, cut, offset)
+        if chunk:
+            yield chunk
+
+        # 下一个chunk从分割点回退overlap_tokens开始
+        next_start = cut
+        if overlap_tokens > 0:
+            back = int(np.searchsorted(window.cumulative, window.cumulative[cut] - overlap_tokens, side='right')) - 1
+            next_start = max(start + 1, min(cut, back))
+        start = next_start
+        floor = cut
+
+    chunk = _make_chunk(window.text, start, len(window.text), offset)
+    if chunk and chunk.end > offset + floor:
+        yield chunk
+
+
+def _make_chunk(text: str, start: int, end: int, offset: int) -> Chunk:
+    """
+    去除首尾空白并换算为原文偏移，内容为空时返回None
+    """
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    if start == end:
+        return None
+    return Chunk(text[start:end], offset + start, offset + end)
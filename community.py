@@ -0,0 +1,151 @@
+from typing import List, Set
+import networkx as nx
+import numpy as np
+from config import Config
+from csr_snapshot import CSRSnapshot
+
+
+class CommunityHierarchy:
+    """
+    图的层次社区划分，level 0为最粗的一层，每一层的社区都是下一层若干社区的并集
+    membership[level][node_id] 为节点在该层所属的社区ID，全量检测时同一层的社区按规模降序编号，
+    增量更新中新建的社区在已有ID之后追加编号
+    """
+    def __init__(self, snapshot: CSRSnapshot, membership: np.ndarray):
+        self.snapshot = snapshot
+        self.version = snapshot.version
+        self.membership = membership
+        # 每条邻接边的起点，与snapshot.indices逐项对齐
+        self.sources = np.repeat(np.arange(snapshot.num_nodes, dtype=np.int32), snapshot.degrees)
+        # 增量更新后社区ID可能不连续，不存在的ID对应空数组
+        self.members: List[List[np.ndarray]] = []
+        for level_membership in membership:
+            order = np.argsort(level_membership, kind='stable')
+            ids = np.arange(level_membership.max() + 1 if len(level_membership) else 0)
+            starts = np.searchsorted(level_membership[order], ids)
+            ends = np.searchsorted(level_membership[order], ids, side='right')
+            self.members.append([order[start:end] for start, end in zip(starts.tolist(), ends.tolist())])
+
+    @property
+    def num_levels(self) -> int:
+        return len(self.membership)
+
+    def num_communities(self, level: int) -> int:
+        return len(self.members[level])
+
+    def children(self, level: int, community: int) -> List[int]:
+        """
+        返回社区在下一层的子社区ID
+        """
+        if level + 1 >= self.num_levels:
+            return []
+        return np.unique(self.membership[level + 1][self.members[level][community]]).tolist()
+
+
+def _louvain(snapshot: CSRSnapshot, nodes: np.ndarray, resolution: float, seed: int) -> List[List[Set[int]]]:
+    """
+    对nodes的导出子图运行Louvain，按由细到粗的顺序返回每一层的划分
+    """
+    sources = np.repeat(np.arange(snapshot.num_nodes, dtype=np.int32), snapshot.degrees)
+    selected = np.zeros(snapshot.num_nodes, dtype=bool)
+    selected[nodes] = True
+    mask = (sources < snapshot.indices) & selected[sources] & selected[snapshot.indices]
+    graph = nx.Graph()
+    graph.add_nodes_from(nodes.tolist())
+    graph.add_weighted_edges_from(zip(sources[mask].tolist(), snapshot.indices[mask].tolist(),
+                                      snapshot.edge_weights[mask].tolist()))
+    if not graph.number_of_edges():
+        return [[{node} for node in graph]] if len(nodes) else []
+    return list(nx.community.louvain_partitions(graph, weight='weight', resolution=resolution, seed=seed))
+
+
+def _sorted_communities(partition: List[Set[int]]) -> List[Set[int]]:
+    return sorted(partition, key=lambda nodes: (-len(nodes), min(nodes)))
+
+
+def detect_communities(snapshot: CSRSnapshot, max_levels: int = None, resolution: float = None,
+                       seed: int = None) -> CommunityHierarchy:
+    """
+    在CSR快照上以边权重运行Louvain算法，保留最粗的max_levels层划分
+    """
+    max_levels = max_levels or Config.COMMUNITY_MAX_LEVELS
+    resolution = resolution or Config.COMMUNITY_RESOLUTION
+    seed = Config.COMMUNITY_SEED if seed is None else seed
+
+    partitions = _louvain(snapshot, np.arange(snapshot.num_nodes), resolution, seed)
+    kept = partitions[-max_levels:][::-1]
+    membership = np.zeros((len(kept), snapshot.num_nodes), dtype=np.int32)
+    for level, partition in enumerate(kept):
+        for community, nodes in enumerate(_sorted_communities(partition)):
+            membership[level, list(nodes)] = community
+    return CommunityHierarchy(snapshot, membership)
+
+
+def _changed_nodes(previous: CSRSnapshot, snapshot: CSRSnapshot) -> np.ndarray:
+    """
+    返回新快照中新增的节点、类型变化的节点以及有新增或变化邻接边的节点(图只增不删)
+    """
+    def signatures(csr: CSRSnapshot):
+        sources = np.repeat(np.arange(csr.num_nodes, dtype=np.int64), csr.degrees)
+        keys = (sources << 32) | csr.indices.astype(np.int64)
+        values = (csr.edge_relations.astype(np.int64) << 33) | (csr.edge_weights.astype(np.int64) << 1) \
+            | csr.edge_forward.astype(np.int64)
+        order = np.argsort(keys)
+        return sources, keys[order], values[order], order
+
+    changed = np.zeros(snapshot.num_nodes, dtype=bool)
+    changed[previous.num_nodes:] = True
+    old_types = np.array([str(node_type) for node_type in previous.node_types[:previous.num_nodes]], dtype=object)
+    new_types = np.array([str(node_type) for node_type in snapshot.node_types[:previous.num_nodes]], dtype=object)
+    changed[:previous.num_nodes] |= old_types != new_types
+
+    _, old_keys, old_values, _ = signatures(previous)
+    sources, keys, values, order = signatures(snapshot)
+    positions = np.minimum(np.searchsorted(old_keys, keys), max(len(old_keys) - 1, 0))
+    if len(old_keys):
+        differs = (old_keys[positions] != keys) | (old_values[positions] != values)
+    else:
+        differs = np.ones(len(keys), dtype=bool)
+    # 无向边在两个端点各有一条邻接记录，两端都会被标记
+    changed[sources[order[differs]]] = True
+    return changed
+
+
+def update_communities(previous: CommunityHierarchy, snapshot: CSRSnapshot, rebuild_ratio: float = None,
+                       resolution: float = None, seed: int = None) -> CommunityHierarchy:
+    """
+    在上一版本划分的基础上增量更新，已有节点在每一层保持原社区不变：
+    新增节点先在其导出子图上运行Louvain分组，每组整体并入与其连接权重最大的已有最细层社区
+    (较粗各层随之确定)，与已有节点没有连接的组在各层新建社区
+    变化节点(新增、类型变化或有新增/变化的边)超过rebuild_ratio或层数配置变化时全量重新检测
+    """
+    rebuild_ratio = Config.COMMUNITY_REBUILD_RATIO if rebuild_ratio is None else rebuild_ratio
+    resolution = resolution or Config.COMMUNITY_RESOLUTION
+    seed = Config.COMMUNITY_SEED if seed is None else seed
+
+    if previous.num_levels == 0 or previous.snapshot.num_nodes == 0 \
+            or previous.num_levels > Config.COMMUNITY_MAX_LEVELS \
+            or _changed_nodes(previous.snapshot, snapshot).sum() > rebuild_ratio * snapshot.num_nodes:
+        return detect_communities(snapshot, resolution=resolution, seed=seed)
+
+    finest = previous.num_levels - 1
+    membership = np.full((previous.num_levels, snapshot.num_nodes), -1, dtype=np.int32)
+    membership[:, :previous.snapshot.num_nodes] = previous.membership
+    next_ids = previous.membership.max(axis=1) + 1
+
+    new_nodes = np.arange(previous.snapshot.num_nodes, snapshot.num_nodes)
+    groups = _louvain(snapshot, new_nodes, resolution, seed)
+    for nodes in _sorted_communities(groups[-1]) if groups else []:
+        nodes = np.fromiter(nodes, dtype=np.int64)
+        # 与已归属节点之间的边按其最细层社区累加权重
+        edges = snapshot.neighbor_positions(nodes)
+        edges = edges[membership[finest][snapshot.indices[edges]] >= 0]
+        if len(edges):
+            targets = snapshot.indices[edges]
+            weights = np.bincount(membership[finest][targets], weights=snapshot.edge_weights[edges])
+            anchor = targets[membership[finest][targets] == int(np.argmax(weights))][0]
+            membership[:, nodes] = membership[:, anchor][:, None]
+        else:
+            membership[:, nodes] = next_ids[:, None]
+            next_ids += 1
+    return CommunityHierarchy(snapshot, membership)
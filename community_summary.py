@@ -0,0 +1,287 @@
+"""
+社区摘要：图构建完成后为层次社区划分中的每个社区生成一段LLM摘要，供全局查询使用
+
+摘要由细到粗逐层生成，同一层的社区在有界线程池中并发调用LLM；
+较粗的社区原始内容超出token预算时改用其子社区的摘要作为输入。
+摘要按社区输入内容的哈希缓存在内存和抽取结果缓存中，增量导入后只有内容变化的社区重新生成
+"""
+import logging
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, NamedTuple, Tuple
+import numpy as np
+from config import Config
+from community import CommunityHierarchy
+from extraction_cache import ExtractionCache, get_extraction_cache
+from knowledge_graph import KnowledgeGraph
+from llm_clients import chat_completion, get_chat_client
+from progress import ProgressThrottle
+from rate_limiter import get_chat_concurrency_limiter
+from token_utils import estimate_tokens
+
+# prompt模板版本，修改prompt时递增，使已缓存的摘要失效
+COMMUNITY_PROMPT_VERSION = 1
+# 报告中列出的代表实体数
+REPORT_TOP_ENTITIES = 10
+
+
+class CommunityReport(NamedTuple):
+    level: int
+    community: int
+    size: int
+    entities: List[str]  # 度数最高的若干实体
+    summary: str
+
+
+def _take_lines(lines: List[str], budget: int) -> Tuple[List[str], bool]:
+    """
+    按顺序取出token总数不超过budget的行，返回 (取出的行, 是否有行被截断)
+    """
+    taken = []
+    for line in lines:
+        budget -= estimate_tokens(line) + 1
+        if budget < 0:
+            return taken, True
+        taken.append(line)
+    return taken, False
+
+
+class CommunityIndex:
+    """
+    图的社区摘要索引，线程安全，同一个图在多次查询之间复用
+    """
+    def __init__(self, graph: KnowledgeGraph):
+        self.graph = graph
+        self.chat_client = get_chat_client()
+        self.concurrency_limiter = get_chat_concurrency_limiter()
+        self.extraction_cache = get_extraction_cache()
+        self.lock = threading.Lock()  # 保护已生成的报告和统计，只短暂持有
+        self.refresh_lock = threading.Lock()  # 同一时间只有一次生成，生成期间查询使用上一次的报告
+        self.refreshing = False  # 是否有等待或正在进行的后台生成
+        self.version = None
+        self.reports: List[List[CommunityReport]] = []  # 按层保存，规模不足COMMUNITY_MIN_SIZE的社区没有报告
+        self.summaries: Dict[str, str] = {}  # 社区输入的缓存键 -> 摘要
+        self.generated = 0
+        self.reused = 0
+        self.failed = 0
+
+    def refresh(self, progress_callback=None, should_stop=None, llm_owner=None) -> bool:
+        """
+        图版本变化时重新划分社区，内容未变化的社区沿用已有摘要
+        Args:
+            should_stop: 返回是否停止生成的函数，默认检查图的停止标记
+            llm_owner: LLM并发名额的使用方(如任务ID)，与分析任务的抽取公平分配CHAT_MAX_CONCURRENCY
+        Returns:
+            是否已与图的当前版本同步，分析被停止或有社区的摘要生成失败时为False
+            (已生成的摘要保留，下次只生成缺少的部分；生成失败的社区没有报告)
+        """
+        should_stop = should_stop or (lambda: self.graph.should_stop)
+        # 调用LLM期间不持有self.lock，stats和get_reports返回上一次生成的结果；
+        # self.summaries只在持有refresh_lock时被替换，生成期间可以直接读取
+        with self.refresh_lock:
+            version = self.graph.version
+            with self.lock:
+                if self.version == version:
+                    return True
+            hierarchy = self.graph.communities()
+            eligible = sum(len(members) >= Config.COMMUNITY_MIN_SIZE
+                           for level_members in hierarchy.members for members in level_members)
+            throttle = ProgressThrottle(progress_callback)
+            reports: List[List[CommunityReport]] = [[] for _ in range(hierarchy.num_levels)]
+            summaries = {}
+            done = 0
+            failed = 0
+
+            executor = ThreadPoolExecutor(max_workers=Config.COMMUNITY_SUMMARY_CONCURRENCY)
+            try:
+                # 由细到粗，较粗的社区可能需要子社区的摘要
+                for level in reversed(range(hierarchy.num_levels)):
+                    children = {report.community: report for report in reports[level + 1]} \
+                        if level + 1 < hierarchy.num_levels else {}
+                    pending = {}
+                    for community, entities, context in self._level_contexts(hierarchy, level, children):
+                        key = ExtractionCache.make_key('community', Config.OPENAI_MODEL, COMMUNITY_PROMPT_VERSION,
+                                                       context)
+                        size = len(hierarchy.members[level][community])
+                        summary = summaries.get(key) or self.summaries.get(key)
+                        if summary is None:
+                            pending[executor.submit(self._summarize, key, context, llm_owner)] = (community, entities, key)
+                            continue
+                        with self.lock:
+                            self.reused += 1
+                        summaries[key] = summary
+                        reports[level].append(CommunityReport(level, community, size, entities, summary))
+                        done += 1
+
+                    for future in as_completed(pending):
+                        community, entities, key = pending[future]
+                        done += 1
+                        try:
+                            summaries[key] = future.result()
+                        except Exception:
+                            # 单个社区失败(如API错误、超时)不影响其他社区
+                            logging.exception(f"生成社区摘要失败: 第{level}层社区{community}")
+                            failed += 1
+                            with self.lock:
+                                self.failed += 1
+                            continue
+                        size = len(hierarchy.members[level][community])
+                        reports[level].append(CommunityReport(level, community, size, entities, summaries[key]))
+                        with self.lock:
+                            self.generated += 1
+                        throttle.update(done / eligible * 100)
+                        if should_stop():
+                            return False
+                    reports[level].sort(key=lambda report: report.community)
+            finally:
+                # 停止或出错时取消尚未开始的摘要，已生成的摘要保留
+                executor.shutdown(wait=False, cancel_futures=True)
+                with self.lock:
+                    self.summaries = {**self.summaries, **summaries}
+
+            with self.lock:
+                self.reports = reports
+                if failed:
+                    # 未标记为已同步，下次刷新时重试失败的社区
+                    return False
+                # 全部成功时只保留当前划分用到的摘要
+                self.summaries = summaries
+                self.version = version
+            return True
+
+    def is_current(self) -> bool:
+        """
+        摘要是否已与图的当前版本同步
+        """
+        with self.lock:
+            return self.version == self.graph.version
+
+    def refresh_in_background(self, llm_owner=None):
+        """
+        摘要落后于图的当前版本且没有等待中的后台生成时，在后台线程中生成，不阻塞调用方
+        """
+        with self.lock:
+            if self.refreshing or self.version == self.graph.version:
+                return
+            self.refreshing = True
+
+        def run():
+            try:
+                self.refresh(llm_owner=llm_owner)
+            except Exception:
+                logging.exception("生成社区摘要失败")
+            finally:
+                with self.lock:
+                    self.refreshing = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def _level_contexts(self, hierarchy: CommunityHierarchy, level: int, children: Dict[int, CommunityReport]):
+        """
+        依次返回该层每个社区的 (社区ID, 代表实体, 摘要输入)
+        摘要输入为按度数排序的实体和按权重排序的内部关系；内容超出预算且有子社区摘要时改用子社区摘要
+        """
+        snapshot = hierarchy.snapshot
+        membership = hierarchy.membership[level]
+        budget = Config.COMMUNITY_SUMMARY_MAX_TOKENS
+
+        # 社区内部的边(每条无向边取一次)按社区分组，组内按权重降序
+        sources, targets = hierarchy.sources, snapshot.indices
+        positions = np.flatnonzero((sources < targets) & (membership[sources] == membership[targets]))
+        edge_communities = membership[sources[positions]]
+        order = np.lexsort((-snapshot.edge_weights[positions], edge_communities))
+        positions, edge_communities = positions[order], edge_communities[order]
+        starts = np.searchsorted(edge_communities, np.arange(hierarchy.num_communities(level)))
+        ends = np.searchsorted(edge_communities, np.arange(hierarchy.num_communities(level)), side='right')
+
+        for community, members in enumerate(hierarchy.members[level]):
+            if len(members) < Config.COMMUNITY_MIN_SIZE:
+                continue
+            members = members[np.argsort(-snapshot.degrees[members], kind='stable')].tolist()
+            entities = [snapshot.node_names[node_id] for node_id in members[:REPORT_TOP_ENTITIES]]
+
+            entity_lines, truncated = _take_lines(
+                (f"- {snapshot.node_names[node_id]}（{snapshot.node_types[node_id]}）" for node_id in members),
+                budget // 2
+            )
+            edge_positions = positions[starts[community]:ends[community]].tolist()
+            edge_lines, edges_truncated = _take_lines(
+                (self._format_edge(hierarchy, position) for position in edge_positions),
+                budget - sum(estimate_tokens(line) + 1 for line in entity_lines)
+            )
+
+            child_reports = [children[child] for child in hierarchy.children(level, community) if child in children]
+            if (truncated or edges_truncated) and len(child_reports) > 1:
+                child_reports.sort(key=lambda report: report.size, reverse=True)
+                lines, _ = _take_lines((f"- {report.summary}" for report in child_reports), budget)
+                yield community, entities, '\n'.join(["子社区摘要："] + lines)
+                continue
+            yield community, entities, '\n'.join(["实体："] + entity_lines + ["关系："] + edge_lines)
+
+    @staticmethod
+    def _format_edge(hierarchy: CommunityHierarchy, position: int) -> str:
+        snapshot = hierarchy.snapshot
+        head, tail = int(hierarchy.sources[position]), int(snapshot.indices[position])
+        if not snapshot.edge_forward[position]:
+            head, tail = tail, head
+        relation = snapshot.relation_names[snapshot.edge_relations[position]]
+        return f"- {snapshot.node_names[head]} -[{relation}]-> {snapshot.node_names[tail]}"
+
+    def _summarize(self, key: str, context: str, llm_owner=None) -> str:
+        if self.extraction_cache is not None:
+            cached = self.extraction_cache.get(key)
+            if cached is not None:
+                return cached
+        prompt = f"""
+        请根据以下知识图谱社区的实体和关系，用一段话概括该社区的主题、核心实体及其之间的关系，不返回任何提示文本和解释文本：
+        {context}
+        """
+        with self.concurrency_limiter.slot(llm_owner):
+            summary = chat_completion(self.chat_client, prompt).strip()
+        if self.extraction_cache is not None:
+            self.extraction_cache.put(key, summary)
+        return summary
+
+    def get_reports(self, level: int = None) -> Tuple[int, List[CommunityReport], int]:
+        """
+        返回已生成的某一层的社区报告，level默认为GLOBAL_SEARCH_LEVEL，超出层数时取最细的一层；
+        该层的社区都小于COMMUNITY_MIN_SIZE而没有报告时(小图中常见)，取最近的有报告的较粗一层
+        Returns:
+            (实际使用的层, 报告列表, 报告对应的图版本)，尚未生成过时图版本为None
+        """
+        level = Config.GLOBAL_SEARCH_LEVEL if level is None else level
+        with self.lock:
+            if not self.reports:
+                return level, [], self.version
+            level = min(max(level, 0), len(self.reports) - 1)
+            for candidate in range(level, -1, -1):
+                if self.reports[candidate]:
+                    return candidate, list(self.reports[candidate]), self.version
+            return level, [], self.version
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {
+                "graph_version": self.version,
+                "levels": [len(level_reports) for level_reports in self.reports],
+                "generated": self.generated,
+                "reused": self.reused,
+                "failed": self.failed
+            }
+
+
+_indexes = weakref.WeakKeyDictionary()
+_indexes_lock = threading.Lock()
+
+
+def get_community_index(graph: KnowledgeGraph) -> CommunityIndex:
+    """
+    获取图对应的社区摘要索引，同一个图的摘要在多次查询和增量导入之间复用
+    """
+    with _indexes_lock:
+        index = _indexes.get(graph)
+        if index is None:
+            index = CommunityIndex(graph)
+            _indexes[graph] = index
+        return index
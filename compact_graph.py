@@ -0,0 +1,245 @@
+from typing import List, Dict, Optional, Tuple
+import numpy as np
+from config import Config
+from csr_snapshot import CSRSnapshot
+from embedding_store import EmbeddingStore
+from graph_arrays import AliasTable, GraphArrays, NameTable
+from knowledge_graph import KnowledgeGraph
+
+
+class _GrowableArray:
+    """
+    按容量倍增追加的一维NumPy数组
+    """
+    def __init__(self, dtype, data: np.ndarray = None):
+        self.data = np.zeros(0, dtype=dtype) if data is None else data
+        self.size = len(self.data)
+
+    def __len__(self):
+        return self.size
+
+    def view(self) -> np.ndarray:
+        return self.data[:self.size]
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=self.data.dtype)
+        needed = self.size + len(values)
+        if needed > len(self.data):
+            grown = np.zeros(max(needed, len(self.data) * 2, 1024), dtype=self.data.dtype)
+            grown[:self.size] = self.view()
+            self.data = grown
+        self.data[self.size:needed] = values
+        self.size = needed
+
+    def clear(self):
+        self.data = np.zeros(0, dtype=self.data.dtype)
+        self.size = 0
+
+
+class CompactKnowledgeGraph(KnowledgeGraph):
+    """
+    基于NumPy数组的紧凑图存储，接口与KnowledgeGraph一致
+    节点名、类型和关系名驻留为整数ID；每条无向边以 (较小节点ID << 32 | 较大节点ID) 为键，
+    已合并的边按键有序存放在定长数组中，新写入的边先追加到缓冲区，
+    积累到一定数量后合并(compaction)：重复边的权重累加，关系和方向取最后一次写入的值
+    """
+    def __init__(self):
+        super().__init__()
+        self.graph = None
+        self.node_names = NameTable()
+        self.node_types = _GrowableArray(np.int32)  # 类型ID，-1表示未设置
+        self.type_names = NameTable()
+        self.aliases = AliasTable()
+        self.relation_names = NameTable()
+
+        # 已合并的边，edge_forward表示关系的头实体是否为键中ID较小的节点
+        self.edge_keys = np.zeros(0, dtype=np.int64)
+        self.edge_relations = np.zeros(0, dtype=np.int32)
+        self.edge_weights = np.zeros(0, dtype=np.int32)
+        self.edge_forward = np.zeros(0, dtype=bool)
+
+        # 待合并的边
+        self._pending_keys = _GrowableArray(np.int64)
+        self._pending_relations = _GrowableArray(np.int32)
+        self._pending_forward = _GrowableArray(bool)
+
+    def _intern_node(self, name: str) -> int:
+        node_id = self.node_names.intern(name)
+        if node_id == len(self.node_types):
+            self.node_types.extend([-1])
+        return node_id
+
+    def _insert_entity_batch(self, entities: List[Dict]):
+        for entity in entities:
+            name = entity['entity']
+            count = len(self.node_types)
+            node_id = self._intern_node(name)
+            # 追加节点可能使数组扩容，每次重新取视图
+            types = self.node_types.view()
+            if types[node_id] < 0:
+                types[node_id] = self.type_names.intern(entity['type'])
+            aliases = [alias for alias in entity.get('aliases', []) if alias != name]
+            if aliases:
+                merged = self.aliases.get(node_id, []) + aliases
+                self.aliases[node_id] = list(dict.fromkeys(merged))
+                if node_id < count:
+                    self.alias_updates.append(name)
+
+    def _insert_relation_batch(self, relations: List[Tuple]):
+        # 按关系顺序依次驻留头尾实体，节点ID顺序与networkx的插入顺序一致
+        endpoints = np.array([(self._intern_node(relation[0]), self._intern_node(relation[2]))
+                              for relation in relations], dtype=np.int64).reshape(-1, 2)
+        heads, tails = endpoints[:, 0], endpoints[:, 1]
+        self._pending_keys.extend((np.minimum(heads, tails) << 32) | np.maximum(heads, tails))
+        self._pending_relations.extend([self.relation_names.intern(relation[1]) for relation in relations])
+        self._pending_forward.extend(heads <= tails)
+        if len(self._pending_keys) >= max(Config.COMPACT_GRAPH_MIN_PENDING,
+                                          len(self.edge_keys) * Config.COMPACT_GRAPH_PENDING_RATIO):
+            self._compact_locked()
+
+    def compact(self):
+        """
+        将缓冲区中的边合并到有序边数组
+        """
+        with self.lock:
+            self._compact_locked()
+
+    def _compact_locked(self):
+        if not len(self._pending_keys):
+            return
+        keys = np.concatenate([self.edge_keys, self._pending_keys.view()])
+        relations = np.concatenate([self.edge_relations, self._pending_relations.view()])
+        weights = np.concatenate([self.edge_weights, np.ones(len(self._pending_keys), dtype=np.int32)])
+        forward = np.concatenate([self.edge_forward, self._pending_forward.view()])
+
+        # 稳定排序保证同一条边的多次写入保持原顺序，组内最后一条即最新写入
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        latest = order[np.r_[starts[1:], len(keys)] - 1]
+
+        self.edge_keys = keys[starts]
+        self.edge_weights = np.add.reduceat(weights[order], starts).astype(np.int32)
+        self.edge_relations = relations[latest]
+        self.edge_forward = forward[latest]
+        self._pending_keys.clear()
+        self._pending_relations.clear()
+        self._pending_forward.clear()
+
+    def _node_attrs(self, node_id: int) -> Dict:
+        type_id = self.node_types.view()[node_id]
+        attrs = {'aliases': list(self.aliases.get(node_id, []))}
+        if type_id >= 0:
+            attrs['type'] = self.type_names[type_id]
+        return attrs
+
+    def node_items(self) -> List[Tuple[str, Dict]]:
+        """
+        返回所有节点及其属性
+        """
+        with self.lock:
+            return [(name, self._node_attrs(node_id)) for node_id, name in enumerate(self.node_names)]
+
+    def _node_names_from(self, start: int) -> List[str]:
+        return [self.node_names[node_id] for node_id in range(start, len(self.node_names))]
+
+    def _node_count_locked(self) -> int:
+        return len(self.node_names)
+
+    def _node_attrs_locked(self, name: str) -> Optional[Dict]:
+        node_id = self.node_names.get(name)
+        return None if node_id is None else self._node_attrs(node_id)
+
+    def number_of_nodes(self) -> int:
+        with self.lock:
+            return len(self.node_names)
+
+    def number_of_edges(self) -> int:
+        with self.lock:
+            self._compact_locked()
+            return len(self.edge_keys)
+
+    def _edge_endpoints(self) -> Tuple[np.ndarray, np.ndarray]:
+        return (self.edge_keys >> 32).astype(np.int32), (self.edge_keys & 0xFFFFFFFF).astype(np.int32)
+
+    def _build_csr_snapshot(self) -> CSRSnapshot:
+        self._compact_locked()
+        low, high = self._edge_endpoints()
+        src = np.concatenate([low, high])
+        order = np.argsort(src, kind='stable')
+        indptr = np.zeros(len(self.node_names) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=len(self.node_names)), out=indptr[1:])
+        types = self.node_types.view()
+        return CSRSnapshot(
+            self.node_names,
+            [self.type_names[type_id] if type_id >= 0 else None for type_id in types.tolist()],
+            indptr,
+            np.concatenate([high, low])[order],
+            np.tile(self.edge_relations, 2)[order],
+            np.tile(self.edge_weights.astype(np.float32), 2)[order],
+            np.concatenate([self.edge_forward, ~self.edge_forward])[order],
+            list(self.relation_names),
+            self.version,
+            self.node_names
+        )
+
+    def export_arrays(self) -> GraphArrays:
+        """
+        导出图的数组表示，用于保存快照
+        """
+        with self.lock:
+            self._compact_locked()
+            # 名称表和别名表在锁内固化，导出后的写入不影响导出结果
+            return GraphArrays(
+                version=self.version,
+                node_names=NameTable.from_arrays(self.node_names.to_arrays()),
+                node_types=self.node_types.view().copy(),
+                type_names=NameTable.from_arrays(self.type_names.to_arrays()),
+                aliases=AliasTable.from_arrays(self.aliases.to_arrays(len(self.node_names))),
+                relation_names=NameTable.from_arrays(self.relation_names.to_arrays()),
+                edge_keys=self.edge_keys,
+                edge_relations=self.edge_relations,
+                edge_weights=self.edge_weights,
+                edge_forward=self.edge_forward,
+                embedding_names=NameTable.from_arrays(self.embeddings.names.to_arrays()),
+                embeddings=self.embeddings.matrix.copy()
+            )
+
+    @classmethod
+    def from_arrays(cls, arrays: GraphArrays) -> 'CompactKnowledgeGraph':
+        """
+        直接引用快照数组(可以是内存映射)，不复制数据
+        """
+        graph = cls()
+        graph.version = arrays.version
+        graph.node_names = arrays.node_names
+        graph.node_types = _GrowableArray(np.int32, arrays.node_types)
+        graph.type_names = arrays.type_names
+        graph.aliases = arrays.aliases
+        graph.relation_names = arrays.relation_names
+        graph.edge_keys = arrays.edge_keys
+        graph.edge_relations = arrays.edge_relations
+        graph.edge_weights = arrays.edge_weights
+        graph.edge_forward = arrays.edge_forward
+        graph.embeddings = EmbeddingStore.from_arrays(arrays.embedding_names, arrays.embeddings)
+        return graph
+
+    def to_dict(self):
+        """
+        导出与 nx.node_link_data(graph, edges="links") 相同结构的字典
+        """
+        with self.lock:
+            self._compact_locked()
+            nodes = [{**self._node_attrs(node_id), 'id': name} for node_id, name in enumerate(self.node_names)]
+            low, high = self._edge_endpoints()
+            links = []
+            for u, v, relation, weight, forward in zip(low.tolist(), high.tolist(), self.edge_relations.tolist(),
+                                                       self.edge_weights.tolist(), self.edge_forward.tolist()):
+                links.append({
+                    'relation': self.relation_names[relation],
+                    'weight': weight,
+                    'head': self.node_names[u if forward else v],
+                    'source': self.node_names[u],
+                    'target': self.node_names[v]
+                })
+        return {'directed': False, 'multigraph': False, 'graph': {}, 'nodes': nodes, 'links': links}
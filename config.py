@@ -18,14 +18,122 @@ class Config:
     OPENAI_MODEL = os.getenv('CHAT_MODEL', "gpt-4")  # 可根据需要调整
     CHAT_MODEL_HOST = os.getenv('CHAT_MODEL_HOST', "https://api.openai.com/v1")  # Chat模型host
     
+    # 并发与限流配置
+    EXTRACTION_CONCURRENCY = int(os.getenv('EXTRACTION_CONCURRENCY', 8))  # 并发处理chunk的线程数，1为顺序处理
+    CHAT_REQUESTS_PER_MINUTE = int(os.getenv('CHAT_REQUESTS_PER_MINUTE', 0))  # Chat模型每分钟请求数上限，0为不限制
+    CHAT_TOKENS_PER_MINUTE = int(os.getenv('CHAT_TOKENS_PER_MINUTE', 0))  # Chat模型每分钟token数上限，0为不限制
+    CHAT_MAX_CONCURRENCY = int(os.getenv('CHAT_MAX_CONCURRENCY', 16))  # 所有分析任务合计的抽取LLM并发上限，在任务间公平分配，0为不限制
+    LLM_MAX_RETRIES = 5  # 429/5xx错误的最大重试次数
+    LLM_RETRY_BASE_DELAY = 1.0  # 重试退避的初始等待秒数
+    LLM_RETRY_MAX_DELAY = 30.0  # 重试退避的最大等待秒数
+    
+    # 离线替身配置
+    LLM_BACKEND = os.getenv('LLM_BACKEND', "openai")  # openai - 调用配置的模型服务, fake - 使用本地确定性替身
+    FAKE_LLM_CHAT_LATENCY = float(os.getenv('FAKE_LLM_CHAT_LATENCY', 0))  # 替身Chat调用注入的延迟(秒)
+    FAKE_LLM_EMBEDDING_LATENCY = float(os.getenv('FAKE_LLM_EMBEDDING_LATENCY', 0))  # 替身Embedding调用注入的延迟(秒)
+    FAKE_LLM_EMBEDDING_DIM = 256  # 替身embedding维度
+    
     # 图配置
-    GRAPH_TYPE = "networkx"  # 当前使用networkx
+    GRAPH_TYPE = os.getenv('GRAPH_TYPE', "networkx")  # networkx - 基于networkx, compact - 基于NumPy数组的紧凑存储
+    GRAPH_BATCH_SIZE = 10000  # 批量写入图时每批的条数，每批检查一次停止标记并上报进度
+    PROGRESS_MIN_INTERVAL = 0.5  # 进度回调的最小时间间隔(秒)
+    PROGRESS_MIN_STEP = 1.0  # 进度增长达到该百分比时不受时间间隔限制立即上报
+    COMPACT_GRAPH_MIN_PENDING = 100000  # 紧凑存储中待合并边达到该数量才触发合并
+    COMPACT_GRAPH_PENDING_RATIO = 0.5  # 待合并边超过已合并边的该比例时触发合并
+    GRAPH_SNAPSHOT_ENABLED = True  # 分析完成后保存图快照，Flask启动时加载最新快照
+    GRAPH_SNAPSHOT_DIR = os.getenv('GRAPH_SNAPSHOT_DIR', "snapshots")  # 图快照目录
+    GRAPH_SNAPSHOT_KEEP = 3  # 保留的快照数量
+    GRAPH_SNAPSHOT_VERIFY = False  # 加载时校验所有文件的sha256，需要完整读取文件
     
     # 预处理配置
+    CHUNK_MAX_TOKENS = 2000  # 每个chunk的最大token数
+    CHUNK_OVERLAP_TOKENS = 0  # 相邻chunk之间重叠的token数，须小于CHUNK_MAX_TOKENS
+    EXTRACTION_MODE = os.getenv('EXTRACTION_MODE', "separate")  # separate - 实体和关系分两次抽取, joint - 一次调用合并抽取
+    EXTRACTION_PACK_MAX_TOKENS = 0  # 合并抽取时将多个小chunk打包进一个prompt的token预算，0为不打包
     ENTITY_SIMILARITY_THRESHOLD = 0.9  # 实体去重相似度阈值
     RELATION_SIMILARITY_THRESHOLD = 0.8  # 关系去重相似度阈值
+    DEDUP_MERGE_STRATEGY = "greedy"  # 去重合并策略: greedy - 按顺序合并, union_find - 传递合并
+    DEDUP_BLOCK_MEMORY_MB = 64  # 分块相似度矩阵的内存上限(MB)
+    DEDUP_ANN_INDEX = "ivf"  # 大规模去重的候选生成索引: none - 精确计算, lsh - 随机超平面LSH, ivf - 倒排聚类
+    DEDUP_ANN_MIN_ITEMS = 20000  # 待去重数量达到该值时启用ANN索引
+    ANN_LSH_TABLES = 16  # LSH哈希表数量，越大召回越高
+    ANN_LSH_BITS = 12  # 每个LSH哈希表的位数，越大候选越少、速度越快
+    ANN_IVF_CELLS = 0  # IVF聚类簇数，0表示取sqrt(n)
+    ANN_IVF_PROBES = 4  # IVF每项探测的簇数，越大召回越高
+    ANN_SEED = 42  # ANN索引的随机种子
     
     # 向量配置
     EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', "text-embedding-3-small")  # OpenAI embedding模型
     EMBEDDING_MODEL_HOST = os.getenv('EMBEDDING_MODEL_HOST', "https://api.openai.com/v1")  # Embedding模型host
-    EMBEDDING_API_KEY = os.getenv('EMBEDDING_API_KEY')  # Embedding API key
\ No newline at end of file
+    EMBEDDING_API_KEY = os.getenv('EMBEDDING_API_KEY')  # Embedding API key
+    EMBEDDING_BATCH_SIZE = 64  # 单次embedding请求的最大输入条数
+    EMBEDDING_BATCH_MAX_TOKENS = 8000  # 单次embedding请求的最大token预算
+
+    # 缓存配置
+    CACHE_DIR = os.getenv('CACHE_DIR', "cache")  # 持久化缓存目录
+    EMBEDDING_CACHE_ENABLED = True  # 是否启用embedding缓存
+    EMBEDDING_CACHE_PATH = os.path.join(CACHE_DIR, "embeddings.sqlite3")  # embedding磁盘缓存文件
+    EMBEDDING_CACHE_MEMORY_ITEMS = 100000  # 内存LRU缓存的最大条数
+    EMBEDDING_CACHE_DISK_MAX_MB = 1024  # 磁盘缓存容量上限(MB)
+    EXTRACTION_CACHE_ENABLED = True  # 是否启用LLM抽取结果缓存
+    EXTRACTION_CACHE_PATH = os.path.join(CACHE_DIR, "extractions.sqlite3")  # 抽取结果缓存文件
+    EXTRACTION_CACHE_MAX_MB = 512  # 抽取结果缓存容量上限(MB)
+    # 证据片段配置
+    CHUNK_STORE_ENABLED = True  # 保存chunk原文、偏移及其抽取结果，查询时返回引用的原文片段
+    CHUNK_STORE_PATH = os.path.join(GRAPH_SNAPSHOT_DIR, "chunks.sqlite3")  # chunk存储文件，与图快照放在一起
+    CHUNK_EMBEDDING_ENABLED = True  # 为每个chunk计算embedding，用于混合检索中的向量检索
+    CHUNK_BM25_K1 = 1.5  # BM25词频饱和参数
+    CHUNK_BM25_B = 0.75  # BM25文档长度归一化参数
+    CHUNK_INDEX_MERGE_RATIO = 0.2  # 增量倒排表超过主倒排表的该比例时合并
+    CHUNK_SEARCH_CANDIDATES = 50  # BM25、向量和实体每路参与融合的候选数
+    CHUNK_RRF_K = 60  # 倒数排名融合的平滑常数
+    EVIDENCE_TOP_K = 3  # 查询结果中返回的证据片段数
+
+    # 社区摘要配置
+    COMMUNITY_SUMMARY_ENABLED = True  # 分析完成后检测层次社区并生成社区摘要，供全局查询使用
+    COMMUNITY_MAX_LEVELS = 3  # 保留的社区层数(从最粗的一层算起)
+    COMMUNITY_RESOLUTION = 1.0  # Louvain分辨率，越大社区越小
+    COMMUNITY_SEED = 42  # Louvain的随机种子，固定后未变化的图得到相同划分
+    COMMUNITY_REBUILD_RATIO = 0.2  # 增量导入中变化的节点超过该比例时全量重新检测社区
+    COMMUNITY_MIN_SIZE = 3  # 节点数少于该值的社区不生成摘要
+    COMMUNITY_SUMMARY_CONCURRENCY = int(os.getenv('COMMUNITY_SUMMARY_CONCURRENCY', 8))  # 并发生成摘要和全局查询map的线程数
+    COMMUNITY_SUMMARY_MAX_TOKENS = 3000  # 单个社区摘要输入的token预算
+    GLOBAL_SEARCH_LEVEL = 1  # 全局查询使用的社区层，0为最粗的一层
+    GLOBAL_SEARCH_MAP_MAX_TOKENS = 6000  # 全局查询map阶段每批社区摘要的token预算
+    GLOBAL_SEARCH_REDUCE_MAX_TOKENS = 6000  # 全局查询reduce阶段要点的token预算
+
+    # 文档读取配置
+    DOCUMENT_READER_WORKERS = int(os.getenv('DOCUMENT_READER_WORKERS', 2))  # 解析上传的docx/xlsx的进程数
+    DOCUMENT_READ_BLOCK_CHARS = 65536  # 流式读取文本时每块的字符数
+
+    # 分析任务配置
+    JOB_MAX_WORKERS = int(os.getenv('JOB_MAX_WORKERS', 4))  # 同时运行的分析任务数
+    JOB_MAX_QUEUED = 32  # 排队等待的分析任务数上限，超出时拒绝提交
+    JOB_RETENTION_SECONDS = 3600  # 结束的任务保留的时间(秒)，之后从任务列表中清除
+
+    # 事件流配置
+    EVENT_STREAM_MIN_INTERVAL = 0.5  # 向每个订阅者推送两批事件的最小间隔(秒)，期间同类型的更新合并为最新值
+    EVENT_STREAM_KEEPALIVE = 15.0  # 没有事件时发送保活注释的间隔(秒)
+
+    # 图导出配置
+    GRAPH_EXPORT_CACHE_SIZE = 32  # 每个图缓存的序列化导出结果数，图版本变化时清空
+    GRAPH_EXPORT_MAX_LIMIT = 10000  # 分页导出时每页的最大节点数
+    GRAPH_EXPORT_MAX_HOPS = 3  # 按节点导出子图时的最大邻域跳数
+
+    # 查询服务配置
+    QUERY_CACHE_SIZE = 1024  # 查询结果LRU缓存的条数，0为不缓存
+    QUERY_BATCH_MAX_SIZE = 500  # 批量查询接口单次请求的最大查询数
+    QUERY_BATCH_TIMEOUT = 60.0  # 批量查询整批的处理时限(秒)，超时后剩余的查询返回超时错误
+
+    # 查询时的实体链接配置
+    ENTITY_LINK_ENABLED = True  # 查询时先用名称和别名匹配种子节点，再用向量检索补足
+    ENTITY_LINK_MIN_LENGTH = 2  # 参与匹配的名称和别名的最小长度(字符)
+    ENTITY_LINK_REBUILD_RATIO = 0.1  # 增量自动机的模式数超过主自动机的该比例时合并重建
+
+    # 查询时的子图扩展配置
+    RETRIEVAL_SEED_TOP_K = 5  # 向量检索得到的种子节点数
+    RETRIEVAL_HOPS = 2  # 从种子节点向外扩展的跳数
+    RETRIEVAL_FANOUT = 10  # 每个节点每跳最多保留的邻居数
+    RETRIEVAL_NODE_BUDGET = 50  # 上下文子图的最大节点数
+    RETRIEVAL_DEGREE_PENALTY = 0.5  # 高度数枢纽节点的惩罚指数，0表示不惩罚
+    RETRIEVAL_MIN_SCORE = 0.02  # 低于该得分的扩展节点被剪枝
\ No newline at end of file
@@ -0,0 +1,86 @@
+from typing import Dict, List, Optional
+import networkx as nx
+import numpy as np
+
+
+class CSRSnapshot:
+    """
+    图的只读CSR邻接快照：节点和关系名称映射为整数ID，
+    indptr/indices 为无向邻接表，每条邻接边带关系ID、权重以及是否与关系原方向一致
+    """
+    def __init__(self, node_names: List[str], node_types: List[str], indptr: np.ndarray, indices: np.ndarray,
+                 edge_relations: np.ndarray, edge_weights: np.ndarray, edge_forward: np.ndarray,
+                 relation_names: List[str], version: int = 0, node_ids: Dict[str, int] = None):
+        # node_names/node_ids可以是图中持续追加的映射，ID超出快照范围的节点视为不存在
+        self.node_names = node_names
+        self.node_types = node_types
+        self.node_ids = {name: i for i, name in enumerate(node_names)} if node_ids is None else node_ids
+        self.indptr = indptr
+        self.indices = indices
+        self.edge_relations = edge_relations
+        self.edge_weights = edge_weights
+        self.edge_forward = edge_forward
+        self.relation_names = relation_names
+        self.degrees = np.diff(indptr).astype(np.int32)
+        self.version = version
+
+    @classmethod
+    def from_networkx(cls, graph: nx.Graph, version: int = 0) -> 'CSRSnapshot':
+        node_names = list(graph.nodes)
+        node_ids = {name: i for i, name in enumerate(node_names)}
+        node_types = [graph.nodes[name].get('type') for name in node_names]
+
+        relation_ids: Dict[str, int] = {}
+        heads, tails, relations, weights, forward = [], [], [], [], []
+        for u, v, attrs in graph.edges(data=True):
+            heads.append(node_ids[u])
+            tails.append(node_ids[v])
+            relations.append(relation_ids.setdefault(attrs.get('relation', ''), len(relation_ids)))
+            weights.append(attrs.get('weight', 1.0))
+            forward.append(attrs.get('head', u) == u)
+
+        # 无向图的每条边在两个端点的邻接表中各记录一次
+        src = np.array(heads + tails, dtype=np.int32)
+        dst = np.array(tails + heads, dtype=np.int32)
+        relations = np.tile(np.array(relations, dtype=np.int32), 2)
+        weights = np.tile(np.array(weights, dtype=np.float32), 2)
+        forward = np.array(forward, dtype=bool)
+        forward = np.concatenate([forward, ~forward])
+
+        order = np.argsort(src, kind='stable')
+        indptr = np.zeros(len(node_names) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=len(node_names)), out=indptr[1:])
+        return cls(node_names, node_types, indptr, dst[order], relations[order], weights[order], forward[order],
+                   list(relation_ids), version, node_ids)
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.indptr) - 1
+
+    def lookup(self, name: str) -> Optional[int]:
+        """
+        返回节点在快照中的ID，不存在时返回None
+        """
+        node_id = self.node_ids.get(name)
+        return node_id if node_id is not None and node_id < self.num_nodes else None
+
+    def neighbor_positions(self, node_ids: np.ndarray) -> np.ndarray:
+        """
+        一次取出多个节点全部邻接边在indices及各edge_*数组中的位置(拼接后返回)
+        """
+        node_ids = np.asarray(node_ids, dtype=np.int64)
+        starts = self.indptr[node_ids]
+        lengths = self.indptr[node_ids + 1] - starts
+        return np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(lengths.sum())
+
+    def gather_neighbors(self, node_ids: np.ndarray) -> np.ndarray:
+        """
+        一次取出多个节点的全部邻居(拼接后返回，可能有重复)
+        """
+        return self.indices[self.neighbor_positions(node_ids)]
+
+    def neighbors(self, node_id: int) -> slice:
+        """
+        返回节点邻接边在indices及各edge_*数组中的区间
+        """
+        return slice(self.indptr[node_id], self.indptr[node_id + 1])
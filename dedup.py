@@ -0,0 +1,175 @@
+from typing import List
+import numpy as np
+from config import Config
+from ann_index import create_ann_index
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """
+    将embedding矩阵逐行归一化为连续的float32矩阵，归一化后点积即余弦相似度
+    """
+    matrix = np.ascontiguousarray(vectors, dtype=np.float32)
+    if matrix.size == 0:
+        return matrix
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(matrix / norms)
+
+
+def _block_rows(n: int, block_memory_mb: float) -> int:
+    """
+    根据内存预算计算每个分块的行数，保证分块相似度矩阵不超过预算
+    """
+    budget = int(block_memory_mb * 1024 * 1024)
+    # 相似度矩阵(float32)和阈值结果(bool)每个元素共占5字节
+    return max(1, min(n, budget // (5 * max(n, 1))))
+
+
+def similarity_groups(matrix: np.ndarray, threshold: float, strategy: str = None,
+                      block_memory_mb: float = None, ann_index=None) -> List[List[int]]:
+    """
+    分块计算相似度并按阈值分组
+    Args:
+        matrix: 已归一化的embedding矩阵
+        threshold: 相似度大于该值的两项视为重复
+        strategy: greedy - 按顺序由代表项吸收其后所有相似项（与逐对比较的结果一致）
+                  union_find - 相似关系传递合并
+        block_memory_mb: 单个分块相似度矩阵的内存上限
+        ann_index: 用于生成候选对的近似最近邻索引，为None时数量达到DEDUP_ANN_MIN_ITEMS才按配置启用
+    Returns:
+        分组列表，每组第一个元素为代表项，组按代表项下标升序排列
+    """
+    strategy = strategy or Config.DEDUP_MERGE_STRATEGY
+    block_memory_mb = block_memory_mb or Config.DEDUP_BLOCK_MEMORY_MB
+    n = matrix.shape[0]
+    if n == 0:
+        return []
+    if strategy not in ('greedy', 'union_find'):
+        raise ValueError(f"未知的去重合并策略: {strategy}")
+
+    # 数据量大时只对ANN索引给出的候选对做精确校验
+    if ann_index is None and n >= Config.DEDUP_ANN_MIN_ITEMS:
+        ann_index = create_ann_index()
+    if ann_index is not None:
+        rows, cols = ann_index.similar_pairs(matrix, threshold)
+        return _groups_from_pairs(n, rows, cols, strategy)
+
+    if strategy == 'greedy':
+        return _greedy_groups(matrix, threshold, block_memory_mb)
+    return _union_find_groups(matrix, threshold, block_memory_mb)
+
+
+def _iter_blocks(matrix: np.ndarray, threshold: float, block_memory_mb: float):
+    """
+    逐块生成阈值化后的相似度矩阵，第r0块只与下标>=r0的列相乘
+    """
+    n = matrix.shape[0]
+    block = _block_rows(n, block_memory_mb)
+    for r0 in range(0, n, block):
+        r1 = min(n, r0 + block)
+        yield r0, r1, (matrix[r0:r1] @ matrix[r0:].T) > threshold
+
+
+def _greedy_groups(matrix: np.ndarray, threshold: float, block_memory_mb: float) -> List[List[int]]:
+    n = matrix.shape[0]
+    assigned = np.zeros(n, dtype=bool)
+    groups = []
+    for r0, r1, above in _iter_blocks(matrix, threshold, block_memory_mb):
+        for i in range(r0, r1):
+            if assigned[i]:
+                continue
+            candidates = np.flatnonzero(above[i - r0, i - r0 + 1:]) + i + 1
+            members = candidates[~assigned[candidates]]
+            assigned[members] = True
+            assigned[i] = True
+            groups.append([i] + members.tolist())
+    return groups
+
+
+def _union_find_groups(matrix: np.ndarray, threshold: float, block_memory_mb: float) -> List[List[int]]:
+    union_find = _UnionFind(matrix.shape[0])
+    for r0, r1, above in _iter_blocks(matrix, threshold, block_memory_mb):
+        # 只保留上三角部分(j > i)
+        rows, cols = np.nonzero(np.triu(above, k=1))
+        union_find.union_pairs(rows + r0, cols + r0)
+    return union_find.groups()
+
+
+def _groups_from_pairs(n: int, rows: np.ndarray, cols: np.ndarray, strategy: str) -> List[List[int]]:
+    """
+    根据已校验的相似对(rows[k] < cols[k])分组，相似对完整时与精确分组结果一致
+    """
+    if strategy == 'union_find':
+        union_find = _UnionFind(n)
+        union_find.union_pairs(rows, cols)
+        return union_find.groups()
+
+    order = np.lexsort((cols, rows))
+    rows, cols = rows[order], cols[order]
+    bounds = np.searchsorted(rows, np.arange(n + 1))
+    assigned = np.zeros(n, dtype=bool)
+    groups = []
+    for i in range(n):
+        if assigned[i]:
+            continue
+        candidates = cols[bounds[i]:bounds[i + 1]]
+        members = candidates[~assigned[candidates]]
+        assigned[members] = True
+        assigned[i] = True
+        groups.append([i] + members.tolist())
+    return groups
+
+
+class _UnionFind:
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+
+    def find(self, x: int) -> int:
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union_pairs(self, rows: np.ndarray, cols: np.ndarray):
+        for i, j in zip(rows.tolist(), cols.tolist()):
+            root_i, root_j = self.find(i), self.find(j)
+            if root_i != root_j:
+                # 以较小下标作为根，保证代表项为组内最先出现的一项
+                if root_i < root_j:
+                    self.parent[root_j] = root_i
+                else:
+                    self.parent[root_i] = root_j
+
+    def groups(self) -> List[List[int]]:
+        groups = {}
+        for i in range(len(self.parent)):
+            groups.setdefault(self.find(i), []).append(i)
+        return [groups[root] for root in sorted(groups)]
+
+
+def best_matches(queries: np.ndarray, matrix: np.ndarray, threshold: float, ann_index=None,
+                 block_memory_mb: float = None) -> np.ndarray:
+    """
+    为每个查询向量在matrix中查找最相似的一行
+    Args:
+        queries: 已归一化的查询矩阵
+        matrix: 已归一化的候选矩阵
+        ann_index: 已在matrix上建立的IVF索引，为None时分块精确计算
+    Returns:
+        每个查询最相似行的下标，相似度不大于阈值时为-1
+    """
+    if len(queries) == 0 or len(matrix) == 0:
+        return np.full(len(queries), -1, dtype=np.int64)
+    if ann_index is not None:
+        return ann_index.search(matrix, queries, threshold)[0]
+
+    budget = int((block_memory_mb or Config.DEDUP_BLOCK_MEMORY_MB) * 1024 * 1024)
+    block = max(1, budget // (4 * len(matrix)))
+    best = np.empty(len(queries), dtype=np.int64)
+    for start in range(0, len(queries), block):
+        sims = queries[start:start + block] @ matrix.T
+        top = np.argmax(sims, axis=1)
+        top_sims = sims[np.arange(len(top)), top]
+        best[start:start + block] = np.where(top_sims > threshold, top, -1)
+    return best
@@ -0,0 +1,87 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List
+
+
+class DiskLRUStore:
+    """
+    基于sqlite的磁盘键值缓存，超过容量上限时按最近访问时间淘汰
+    """
+    # sqlite单条语句的参数个数上限
+    _MAX_PARAMS = 500
+
+    def __init__(self, path: str, max_bytes: int):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            'key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries(accessed)')
+        self.conn.commit()
+        self.total_bytes = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+
+    def get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        """
+        批量读取，返回命中的键值并刷新其访问时间
+        """
+        found = {}
+        with self.lock:
+            for start in range(0, len(keys), self._MAX_PARAMS):
+                part = keys[start:start + self._MAX_PARAMS]
+                placeholders = ','.join('?' * len(part))
+                rows = self.conn.execute(
+                    f'SELECT key, value FROM entries WHERE key IN ({placeholders})', part
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self.conn.executemany('UPDATE entries SET accessed = ? WHERE key = ?',
+                                      [(now, key) for key in found])
+                self.conn.commit()
+        return found
+
+    def put_many(self, items: Dict[str, bytes]):
+        """
+        批量写入，写入后超出容量则淘汰最久未访问的条目
+        """
+        if not items:
+            return
+        now = time.time()
+        with self.lock:
+            for key, value in items.items():
+                old = self.conn.execute('SELECT size FROM entries WHERE key = ?', (key,)).fetchone()
+                if old:
+                    self.total_bytes -= old[0]
+                self.conn.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)',
+                                  (key, value, len(value), now))
+                self.total_bytes += len(value)
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        if self.total_bytes <= self.max_bytes:
+            return
+        # 一次淘汰到容量的90%，避免每次写入都触发淘汰
+        target = self.max_bytes * 0.9
+        rows = self.conn.execute('SELECT key, size FROM entries ORDER BY accessed').fetchall()
+        evicted = []
+        for key, size in rows:
+            if self.total_bytes <= target:
+                break
+            evicted.append((key,))
+            self.total_bytes -= size
+        self.conn.executemany('DELETE FROM entries WHERE key = ?', evicted)
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute('DELETE FROM entries')
+            self.conn.commit()
+            self.total_bytes = 0
@@ -0,0 +1,174 @@
+"""
+流式读取上传的文档，按顺序产出文本片段供iter_chunks切分：
+txt按块读取，docx逐段落解析document.xml，xlsx以只读模式逐行读取并将每行紧凑地序列化为一行文本
+
+docx和xlsx在进程池中解析(不占用请求线程和任务线程的GIL)，解析出的文本写入spool文件后再按块读取，
+全程内存占用与文件大小无关
+"""
+import multiprocessing
+import os
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, Tuple
+from xml.etree import ElementTree
+from config import Config
+
+SUPPORTED_EXTENSIONS = ('txt', 'docx', 'xlsx')
+
+_W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+_SPOOL_SUFFIX = '.spool.txt'
+
+
+def _extension(path: str) -> str:
+    return path.rsplit('.', 1)[-1].lower() if '.' in path else ''
+
+
+def iter_text_file(path: str, block_chars: int = None) -> Iterator[str]:
+    """
+    按块读取UTF-8文本文件
+    """
+    block_chars = block_chars or Config.DOCUMENT_READ_BLOCK_CHARS
+    with open(path, 'r', encoding='utf-8') as f:
+        while True:
+            block = f.read(block_chars)
+            if not block:
+                return
+            yield block
+
+
+def iter_docx_paragraphs(path: str) -> Iterator[str]:
+    """
+    逐段落解析docx的正文(包括表格中的段落)，每段以换行结尾；已解析的元素随即从树中移除
+    """
+    with zipfile.ZipFile(path) as archive, archive.open('word/document.xml') as xml:
+        stack = []
+        for event, element in ElementTree.iterparse(xml, events=('start', 'end')):
+            if event == 'start':
+                stack.append(element)
+                continue
+            stack.pop()
+            if element.tag == _W + 'p':
+                parts = []
+                for node in element.iter():
+                    if node.tag == _W + 't':
+                        parts.append(node.text or '')
+                    elif node.tag == _W + 'tab':
+                        parts.append('\t')
+                    elif node.tag in (_W + 'br', _W + 'cr'):
+                        parts.append('\n')
+                yield ''.join(parts) + '\n'
+                # 文本框等嵌套段落已输出，清空后外层段落不会重复输出
+                element.clear()
+            # body的直接子元素(段落、表格)处理完后移除，树的大小不随文档增长
+            if len(stack) == 2 and stack[-1].tag == _W + 'body':
+                stack[-1].remove(element)
+
+
+def _format_cell(value) -> str:
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    # 单元格内的换行和制表符会破坏行结构
+    return str(value).replace('\t', ' ').replace('\r', ' ').replace('\n', ' ')
+
+
+def serialize_row(values: Iterable) -> str:
+    """
+    将一行单元格序列化为制表符分隔的一行文本，去掉行尾的空单元格，空行返回空字符串
+    """
+    cells = [_format_cell(value) for value in values]
+    while cells and not cells[-1]:
+        cells.pop()
+    return '\t'.join(cells) + '\n' if cells else ''
+
+
+def iter_xlsx_rows(path: str) -> Iterator[str]:
+    """
+    以只读模式逐行读取xlsx第一个工作表，每行序列化为一行文本
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for values in workbook.worksheets[0].iter_rows(values_only=True):
+            row = serialize_row(values)
+            if row:
+                yield row
+    finally:
+        workbook.close()
+
+
+def iter_document_segments(path: str) -> Iterator[str]:
+    """
+    按文件扩展名流式读取文档，产出文本片段
+    """
+    extension = _extension(path)
+    if extension == 'txt':
+        return iter_text_file(path)
+    if extension == 'docx':
+        return iter_docx_paragraphs(path)
+    if extension == 'xlsx':
+        return iter_xlsx_rows(path)
+    raise ValueError(f"不支持的文件类型: {path}")
+
+
+def _spool_document(path: str, spool_path: str) -> int:
+    """
+    在工作进程中执行：解析文档并将文本写入spool文件，返回字符数
+    txt不需要转换，只校验编码并统计字符数
+    """
+    if _extension(path) == 'txt':
+        return sum(len(block) for block in iter_text_file(path))
+    total_chars = 0
+    with open(spool_path, 'w', encoding='utf-8') as spool:
+        for segment in iter_document_segments(path):
+            spool.write(segment)
+            total_chars += len(segment)
+    return total_chars
+
+
+def spool_path_for(path: str) -> str:
+    """
+    返回文档解析结果的spool文件路径，txt直接读取原文件
+    """
+    return path if _extension(path) == 'txt' else path + _SPOOL_SUFFIX
+
+
+def read_document(path: str) -> Tuple[Iterator[str], int]:
+    """
+    在进程池中解析文档，阻塞直到解析完成
+    Returns:
+        (按块产出文本的迭代器, 总字符数)，迭代器读完后由调用方用remove_document删除文件
+    """
+    spool_path = spool_path_for(path)
+    total_chars = get_document_reader_pool().submit(_spool_document, path, spool_path).result()
+    return iter_text_file(spool_path), total_chars
+
+
+def remove_document(path: str):
+    """
+    删除上传的文档及其spool文件
+    """
+    for file_path in {path, spool_path_for(path)}:
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
+
+
+_reader_pool = None
+_reader_pool_lock = threading.Lock()
+
+
+def get_document_reader_pool() -> ProcessPoolExecutor:
+    """
+    获取进程内共享的文档解析进程池；以spawn方式启动，避免在多线程的服务进程中fork
+    """
+    global _reader_pool
+    with _reader_pool_lock:
+        if _reader_pool is None:
+            _reader_pool = ProcessPoolExecutor(max_workers=Config.DOCUMENT_READER_WORKERS,
+                                               mp_context=multiprocessing.get_context('spawn'))
+        return _reader_pool
@@ -0,0 +1,102 @@
+import threading
+from typing import List, Iterator
+import openai
+import numpy as np
+from config import Config
+from token_utils import estimate_tokens
+from embedding_cache import EmbeddingCache, get_embedding_cache
+from rate_limiter import call_with_retry
+from llm_clients import get_embedding_client
+
+
+class Embedder:
+    """
+    批量获取文本embedding，一次请求发送多条输入并按输入顺序返回结果
+    已缓存的文本不再请求接口
+    """
+    def __init__(self, client: openai.OpenAI = None, model: str = None,
+                 batch_size: int = None, batch_max_tokens: int = None,
+                 host: str = None, cache: EmbeddingCache = None):
+        self.client = client or get_embedding_client()
+        self.model = model or Config.EMBEDDING_MODEL
+        self.host = host or Config.EMBEDDING_MODEL_HOST
+        self.cache = cache if cache is not None else get_embedding_cache()
+        self.batch_size = batch_size or Config.EMBEDDING_BATCH_SIZE
+        self.batch_max_tokens = batch_max_tokens or Config.EMBEDDING_BATCH_MAX_TOKENS
+        self.request_count = 0  # 接口请求次数，多个线程共用同一个Embedder，由request_count_lock保护
+        self.request_count_lock = threading.Lock()
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        获取多条文本的embedding
+        Returns:
+            形状为 (len(texts), dim) 的矩阵，第i行对应texts[i]
+        """
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        # 相同文本只请求一次，已缓存的文本直接使用缓存
+        unique_texts = list(dict.fromkeys(texts))
+        vectors = {}
+        if self.cache is not None:
+            keys = {text: EmbeddingCache.make_key(self.model, self.host, text) for text in unique_texts}
+            cached = self.cache.get_many(list(keys.values()))
+            for text, key in keys.items():
+                if key in cached:
+                    vectors[text] = cached[key]
+            unique_texts = [text for text in unique_texts if text not in vectors]
+
+        for batch in self._iter_batches(unique_texts):
+            embedded = dict(zip(batch, self._embed_batch(batch)))
+            vectors.update(embedded)
+            if self.cache is not None:
+                self.cache.put_many({keys[text]: vector for text, vector in embedded.items()})
+
+        return np.vstack([vectors[text] for text in texts])
+
+    def embed_one(self, text: str) -> np.ndarray:
+        """
+        获取单条文本的embedding
+        """
+        return self.embed([text])[0]
+
+    def _iter_batches(self, texts: List[str]) -> Iterator[List[str]]:
+        """
+        按最大条数和token预算将文本切分为批次
+        """
+        batch = []
+        batch_tokens = 0
+        for text in texts:
+            tokens = estimate_tokens(text)
+            if batch and (len(batch) >= self.batch_size or batch_tokens + tokens > self.batch_max_tokens):
+                yield batch
+                batch = []
+                batch_tokens = 0
+            batch.append(text)
+            batch_tokens += tokens
+        if batch:
+            yield batch
+
+    def _embed_batch(self, batch: List[str]) -> List[np.ndarray]:
+        """
+        请求一个批次的embedding，批次被拒绝时拆成两半分别重试
+        """
+        try:
+            with self.request_count_lock:
+                self.request_count += 1
+            response = call_with_retry(lambda: self.client.embeddings.create(
+                input=batch,
+                model=self.model
+            ))
+        except openai.APIStatusError as e:
+            # 400/413/422 表示批次过大或包含非法输入，其余错误直接抛出
+            if len(batch) == 1 or e.status_code not in (400, 413, 422):
+                raise e
+            middle = len(batch) // 2
+            return self._embed_batch(batch[:middle]) + self._embed_batch(batch[middle:])
+
+        # 按返回的index映射回输入顺序
+        results = [None] * len(batch)
+        for item in response.data:
+            results[item.index] = np.asarray(item.embedding, dtype=np.float32)
+        return results
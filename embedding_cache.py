@@ -0,0 +1,109 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List
+import numpy as np
+from config import Config
+from disk_cache import DiskLRUStore
+
+
+class EmbeddingCache:
+    """
+    按 (模型, host, 文本哈希) 缓存embedding
+    内存LRU为第一级，sqlite磁盘缓存为第二级，重启后仍可命中
+    """
+    def __init__(self, path: str = None, memory_items: int = None, disk_max_mb: float = None):
+        self.memory_items = memory_items or Config.EMBEDDING_CACHE_MEMORY_ITEMS
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.disk = DiskLRUStore(
+            path or Config.EMBEDDING_CACHE_PATH,
+            int((disk_max_mb or Config.EMBEDDING_CACHE_DISK_MAX_MB) * 1024 * 1024)
+        )
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model: str, host: str, text: str) -> str:
+        digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        # 替身(LLM_BACKEND=fake)的结果与真实模型分开缓存，离线运行不会污染真实模型的缓存
+        if Config.LLM_BACKEND != 'openai':
+            model = f"{Config.LLM_BACKEND}:{model}"
+        return f"{model}|{host}|{digest}"
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """
+        批量查询，返回命中的embedding
+        """
+        found = {}
+        missing = []
+        with self.lock:
+            for key in keys:
+                vector = self.memory.get(key)
+                if vector is None:
+                    missing.append(key)
+                else:
+                    self.memory.move_to_end(key)
+                    found[key] = vector
+            self.memory_hits += len(found)
+
+        if missing:
+            disk_found = {key: np.frombuffer(value, dtype=np.float32)
+                          for key, value in self.disk.get_many(missing).items()}
+            with self.lock:
+                self.disk_hits += len(disk_found)
+                self.misses += len(missing) - len(disk_found)
+                for key, vector in disk_found.items():
+                    self._remember(key, vector)
+            found.update(disk_found)
+        return found
+
+    def put_many(self, items: Dict[str, np.ndarray]):
+        """
+        批量写入内存和磁盘两级缓存
+        """
+        items = {key: np.asarray(vector, dtype=np.float32) for key, vector in items.items()}
+        with self.lock:
+            for key, vector in items.items():
+                self._remember(key, vector)
+        self.disk.put_many({key: vector.tobytes() for key, vector in items.items()})
+
+    def _remember(self, key: str, vector: np.ndarray):
+        self.memory[key] = vector
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_items:
+            self.memory.popitem(last=False)
+
+    def stats(self) -> Dict:
+        """
+        返回命中统计，hits即节省的embedding条数
+        """
+        with self.lock:
+            hits = self.memory_hits + self.disk_hits
+            total = hits + self.misses
+            return {
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': hits / total if total else 0.0,
+                'memory_items': len(self.memory),
+                'disk_bytes': self.disk.total_bytes
+            }
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """
+    获取进程内共享的embedding缓存，未启用缓存时返回None
+    """
+    global _default_cache
+    if not Config.EMBEDDING_CACHE_ENABLED:
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = EmbeddingCache()
+        return _default_cache
@@ -0,0 +1,63 @@
+from typing import List
+import numpy as np
+from dedup import normalize_rows
+from graph_arrays import NameTable
+
+
+class EmbeddingStore:
+    """
+    按名称存储归一化embedding的连续float32矩阵，容量按倍数增长，支持原位更新和追加
+    """
+    def __init__(self, dim: int = 0):
+        self.names = NameTable()
+        self._matrix = np.zeros((0, dim), dtype=np.float32)
+
+    @classmethod
+    def from_arrays(cls, names: NameTable, matrix: np.ndarray) -> 'EmbeddingStore':
+        """
+        由快照中的名称表和矩阵(可以是内存映射)构建
+        """
+        store = cls()
+        store.names = names
+        store._matrix = matrix
+        return store
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name: str):
+        return name in self.names
+
+    @property
+    def dim(self) -> int:
+        return self._matrix.shape[1]
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """
+        与names逐行对齐的矩阵视图
+        """
+        return self._matrix[:len(self.names)]
+
+    def add(self, names: List[str], vectors: np.ndarray):
+        """
+        写入embedding，已存在的名称原位覆盖，新名称追加到末尾
+        """
+        if not names:
+            return
+        vectors = normalize_rows(vectors)
+        if len(self.names) == 0 and self._matrix.shape[1] != vectors.shape[1]:
+            self._matrix = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+
+        # 新名称按顺序追加ID，同一批中重复的名称以最后一次为准
+        rows = np.fromiter((self.names.intern(name) for name in names), dtype=np.int64, count=len(names))
+        needed = len(self.names)
+        if needed > self._matrix.shape[0]:
+            grown = np.zeros((max(needed, self._matrix.shape[0] * 2), vectors.shape[1]), dtype=np.float32)
+            grown[:self._matrix.shape[0]] = self._matrix
+            self._matrix = grown
+        self._matrix[rows] = vectors
+
+    def get(self, name: str) -> np.ndarray:
+        row = self.names.get(name)
+        return None if row is None else self._matrix[row]
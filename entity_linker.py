@@ -0,0 +1,198 @@
+import threading
+import unicodedata
+import weakref
+from collections import deque
+from typing import Dict, List, NamedTuple, Set
+from config import Config
+from knowledge_graph import KnowledgeGraph
+
+
+def normalize_mention(text: str) -> str:
+    """
+    规范化名称和查询文本：NFKC统一全角/半角字符，英文转小写
+    NFKC和casefold对中文字符不改变长度，规范化前后的位置一一对应
+    """
+    return unicodedata.normalize('NFKC', text).casefold()
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isascii() and char.isalnum()
+
+
+class Mention(NamedTuple):
+    start: int
+    end: int
+    text: str
+    nodes: List[str]
+
+
+class _Automaton:
+    """
+    Aho-Corasick自动机：trie的每个状态保存转移字典、失败指针和输出链接，
+    匹配时对文本只扫描一遍，耗时与文本长度及匹配数成正比
+    """
+    def __init__(self, patterns: Dict[str, Set[str]]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.pattern: List[str] = [None]  # 在该状态结束的模式
+        self.output_link: List[int] = [0]  # 沿失败链最近的有输出的状态
+        self.size = len(patterns)
+        for text in patterns:
+            self._insert(text)
+        self._build_links()
+
+    def __contains__(self, text: str):
+        state = 0
+        for char in text:
+            state = self.goto[state].get(char)
+            if state is None:
+                return False
+        return self.pattern[state] is not None
+
+    def _insert(self, text: str):
+        state = 0
+        for char in text:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.pattern.append(None)
+                self.output_link.append(0)
+            state = next_state
+        self.pattern[state] = text
+
+    def _build_links(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                fail = self.goto[fail].get(char, 0)
+                self.fail[next_state] = fail if fail != next_state else 0
+                self.output_link[next_state] = fail if self.pattern[fail] is not None else self.output_link[fail]
+                queue.append(next_state)
+
+    def iter_matches(self, text: str):
+        """
+        依次返回 (结束位置, 模式)
+        """
+        state = 0
+        for end, char in enumerate(text, 1):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            match = state if self.pattern[state] is not None else self.output_link[state]
+            while match:
+                yield end, self.pattern[match]
+                match = self.output_link[match]
+
+
+class EntityLinker:
+    """
+    基于节点名称和别名的实体链接索引，在查询中找出所有提及的实体
+    名称和别名规范化后构建Aho-Corasick自动机；图新增节点时只为新增的名称构建增量自动机，
+    增量部分超过主自动机的ENTITY_LINK_REBUILD_RATIO时合并重建
+    """
+    def __init__(self, graph: KnowledgeGraph, min_length: int = None):
+        self.graph = graph
+        self.min_length = min_length or Config.ENTITY_LINK_MIN_LENGTH
+        self.lock = threading.Lock()
+        self.version = None
+        self.cursor = None  # 图的node_changes游标
+        self.patterns: Dict[str, Set[str]] = {}  # 规范化名称 -> 节点
+        self.canonical: Dict[str, str] = {}  # 规范化后与节点名称相同的模式 -> 节点
+        self.main = _Automaton({})
+        self.delta = _Automaton({})
+        self.delta_patterns: Dict[str, Set[str]] = {}
+
+    def refresh(self):
+        """
+        图版本变化时只处理新增的节点和别名有变化的节点
+        """
+        with self.lock:
+            if self.version == self.graph.version:
+                return
+            version = self.graph.version
+            added = False
+            items, self.cursor = self.graph.node_changes(self.cursor)
+            for name, attrs in items:
+                for text in [name] + list(attrs.get('aliases', [])):
+                    pattern = normalize_mention(text).strip()
+                    if len(pattern) < self.min_length:
+                        continue
+                    nodes = self.patterns.setdefault(pattern, set())
+                    if name not in nodes:
+                        nodes.add(name)
+                        if pattern not in self.main:
+                            self.delta_patterns[pattern] = nodes
+                        added = True
+                    if text == name:
+                        self.canonical.setdefault(pattern, name)
+            if added:
+                if len(self.delta_patterns) > self.main.size * Config.ENTITY_LINK_REBUILD_RATIO:
+                    self.main = _Automaton(self.patterns)
+                    self.delta_patterns = {}
+                self.delta = _Automaton(self.delta_patterns)
+            self.version = version
+
+    def find_mentions(self, text: str) -> List[Mention]:
+        """
+        返回查询中所有的实体提及(可能重叠)，英文名称要求前后不紧邻字母或数字
+        """
+        self.refresh()
+        normalized = normalize_mention(text)
+        # NFKC可能改变少数兼容字符的长度，此时位置无法对应回原文，直接使用规范化文本
+        source = text if len(normalized) == len(text) else normalized
+
+        mentions = {}
+        with self.lock:
+            for automaton in [self.main, self.delta]:
+                for end, pattern in automaton.iter_matches(normalized):
+                    start = end - len(pattern)
+                    if _is_word_char(pattern[0]) and start > 0 and _is_word_char(normalized[start - 1]):
+                        continue
+                    if _is_word_char(pattern[-1]) and end < len(normalized) and _is_word_char(normalized[end]):
+                        continue
+                    mentions[(start, end)] = Mention(start, end, source[start:end], self._rank_nodes(pattern))
+        return [mentions[key] for key in sorted(mentions)]
+
+    def _rank_nodes(self, pattern: str) -> List[str]:
+        # 名称与提及完全相同的节点排在最前，其余按名称排序保证结果稳定
+        nodes = sorted(self.patterns[pattern])
+        canonical = self.canonical.get(pattern)
+        if canonical in self.patterns[pattern]:
+            nodes.remove(canonical)
+            nodes.insert(0, canonical)
+        return nodes
+
+    def link(self, text: str) -> List[Mention]:
+        """
+        从左到右选取互不重叠的最长提及
+        """
+        selected = []
+        last_end = 0
+        for mention in sorted(self.find_mentions(text), key=lambda m: (m.start, -(m.end - m.start))):
+            if mention.start >= last_end:
+                selected.append(mention)
+                last_end = mention.end
+        return selected
+
+
+_linkers = weakref.WeakKeyDictionary()
+_linkers_lock = threading.Lock()
+
+
+def get_entity_linker(graph: KnowledgeGraph) -> EntityLinker:
+    """
+    获取图对应的实体链接索引，同一个图的索引在多次查询之间复用
+    """
+    with _linkers_lock:
+        linker = _linkers.get(graph)
+        if linker is None:
+            linker = EntityLinker(graph)
+            _linkers[graph] = linker
+        return linker
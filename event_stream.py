@@ -0,0 +1,94 @@
+"""
+服务端事件流：分析任务发布进度、阶段、chunk完成数和图版本等事件，订阅者以SSE(text/event-stream)接收
+
+每种类型(及键，如任务ID)的事件只保留最新的一条，订阅者两批推送之间至少间隔EVENT_STREAM_MIN_INTERVAL秒，
+期间的多次更新合并为最新值；断线重连时按Last-Event-ID补发错过的各类型最新事件
+"""
+import json
+import threading
+import time
+from typing import Dict, Hashable, Iterator, List, Tuple
+from config import Config
+
+
+class EventBroker:
+    """
+    进程内的事件发布与订阅，线程安全
+    """
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.seq = 0
+        self.latest: Dict[Tuple[str, Hashable], Tuple[int, Dict]] = {}  # (事件类型, 键) -> (序号, 数据)
+
+    def publish(self, event_type: str, data: Dict, key: Hashable = None):
+        """
+        发布事件，同一类型不同键(如不同任务)的事件分别合并；与最新事件的数据相同时忽略
+        """
+        with self.condition:
+            latest = self.latest.get((event_type, key))
+            if latest is not None and latest[1] == data:
+                return
+            self.seq += 1
+            self.latest[(event_type, key)] = (self.seq, data)
+            self.condition.notify_all()
+
+    def discard(self, event_type: str, key: Hashable = None):
+        """
+        删除某个键的最新事件，新的订阅者不再收到
+        """
+        with self.condition:
+            self.latest.pop((event_type, key), None)
+
+    def _effective_id(self, last_id: int) -> int:
+        # 服务重启后序号重新计数，客户端的序号可能大于当前序号
+        return 0 if last_id > self.seq else last_id
+
+    def events_since(self, last_id: int) -> List[Tuple[int, str, Dict]]:
+        """
+        按序号返回last_id之后有更新的各类型最新事件 (序号, 类型, 数据)
+        """
+        with self.condition:
+            last_id = self._effective_id(last_id)
+            events = [(seq, event_type, data) for (event_type, _), (seq, data) in self.latest.items()
+                      if seq > last_id]
+        return sorted(events, key=lambda event: event[0])
+
+    def _has_events(self, last_id: int) -> bool:
+        # 按保留的最新事件判断而不是按序号，last_id之后的事件都被discard时继续等待
+        last_id = self._effective_id(last_id)
+        return any(seq > last_id for seq, _ in self.latest.values())
+
+    def wait(self, last_id: int, timeout: float = None) -> List[Tuple[int, str, Dict]]:
+        """
+        等待last_id之后的新事件，超时返回空列表
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self._has_events(last_id), timeout)
+        return self.events_since(last_id)
+
+    def subscribe(self, last_id: int = 0, min_interval: float = None, keepalive: float = None) -> Iterator[str]:
+        """
+        以SSE格式依次返回事件，没有事件时每keepalive秒返回一条注释保持连接
+        """
+        min_interval = Config.EVENT_STREAM_MIN_INTERVAL if min_interval is None else min_interval
+        keepalive = keepalive or Config.EVENT_STREAM_KEEPALIVE
+        while True:
+            events = self.wait(last_id, keepalive)
+            if not events:
+                yield ": keepalive\n\n"
+                continue
+            for seq, event_type, data in events:
+                yield f"id: {seq}\nevent: {event_type}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+            last_id = events[-1][0]
+            # 间隔期内的更新在下一批中合并为最新值
+            time.sleep(min_interval)
+
+
+_default_broker = EventBroker()
+
+
+def get_event_broker() -> EventBroker:
+    """
+    获取进程内共享的事件发布与订阅
+    """
+    return _default_broker
@@ -0,0 +1,84 @@
+import hashlib
+import json
+import threading
+from typing import Any, Dict
+from config import Config
+from disk_cache import DiskLRUStore
+
+
+class ExtractionCache:
+    """
+    持久化缓存LLM抽取的解析结果，
+    按 (抽取类型, 模型, 模型host, prompt模板版本, chunk哈希, 实体列表哈希) 定位
+    """
+    def __init__(self, path: str = None, max_mb: float = None):
+        self.disk = DiskLRUStore(
+            path or Config.EXTRACTION_CACHE_PATH,
+            int((max_mb or Config.EXTRACTION_CACHE_MAX_MB) * 1024 * 1024)
+        )
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(kind: str, model: str, prompt_version: int, text: str, context: Any = None) -> str:
+        """
+        Args:
+            kind: 抽取类型，如entities、relations
+            context: 影响抽取结果的附加输入（如关系抽取的实体列表），按规范化JSON计算哈希
+        """
+        digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        context_digest = ''
+        if context is not None:
+            context_json = json.dumps(context, ensure_ascii=False, sort_keys=True)
+            context_digest = hashlib.sha256(context_json.encode('utf-8')).hexdigest()
+        # 与embedding缓存一样按Chat模型host区分，指向本地替身服务(fake_llm.py)时不会污染真实模型的缓存；
+        # 进程内替身(LLM_BACKEND=fake)不经过host，另按后端区分
+        if Config.LLM_BACKEND != 'openai':
+            model = f"{Config.LLM_BACKEND}:{model}"
+        return f"{kind}|{model}|{Config.CHAT_MODEL_HOST}|v{prompt_version}|{digest}|{context_digest}"
+
+    def get(self, key: str) -> Any:
+        """
+        返回缓存的结果，未命中时返回None
+        """
+        value = self.disk.get_many([key]).get(key)
+        with self.lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(value)
+
+    def put(self, key: str, value: Any):
+        self.disk.put_many({key: json.dumps(value, ensure_ascii=False).encode('utf-8')})
+
+    def stats(self) -> Dict:
+        """
+        返回命中统计，hits即节省的LLM调用次数
+        """
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'disk_bytes': self.disk.total_bytes
+            }
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_extraction_cache() -> ExtractionCache:
+    """
+    获取进程内共享的抽取结果缓存，未启用缓存时返回None
+    """
+    global _default_cache
+    if not Config.EXTRACTION_CACHE_ENABLED:
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ExtractionCache()
+        return _default_cache
@@ -0,0 +1,219 @@
+"""
+本地确定性的OpenAI兼容替身，用于离线开发和性能测试
+
+FakeOpenAI 可直接替换 openai.OpenAI 客户端在进程内使用；
+FakeLLMServer 在本地提供 /v1/chat/completions 和 /v1/embeddings 接口，
+将 CHAT_MODEL_HOST / EMBEDDING_MODEL_HOST 指向它即可走完整的HTTP链路:
+    python fake_llm.py --port 9300
+"""
+import argparse
+import ast
+import json
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Dict, List
+import numpy as np
+from config import Config
+
+ENTITY_TYPES = ['人物', '组织', '地点', '概念', '事件']
+_TOKEN_PATTERN = re.compile(r'[A-Za-z][A-Za-z0-9]+|[\u4e00-\u9fff]{2}')
+
+
+def _stable_hash(text: str, seed: int = 0) -> int:
+    return zlib.crc32(f"{seed}|{text}".encode('utf-8'))
+
+
+def _source_text(prompt: str) -> str:
+    """
+    去掉prompt中的指令行，只保留待抽取的原文
+    """
+    lines = []
+    for line in prompt.strip().splitlines():
+        line = line.strip()
+        if line.startswith(('请', '以下是', '返回', '和实体列表')):
+            continue
+        lines.append(line.replace('给定文本：', ''))
+    return '\n'.join(lines)
+
+
+class FakeBackend:
+    """
+    根据prompt类型生成确定性的合成抽取结果和embedding
+    """
+    def __init__(self, chat_latency: float = None, embedding_latency: float = None,
+                 embedding_dim: int = None, entities_per_chunk: int = 8, seed: int = 0):
+        self.chat_latency = Config.FAKE_LLM_CHAT_LATENCY if chat_latency is None else chat_latency
+        self.embedding_latency = Config.FAKE_LLM_EMBEDDING_LATENCY if embedding_latency is None else embedding_latency
+        self.embedding_dim = embedding_dim or Config.FAKE_LLM_EMBEDDING_DIM
+        self.entities_per_chunk = entities_per_chunk
+        self.seed = seed
+        self.lock = threading.Lock()
+        self.chat_calls = 0
+        self.embedding_calls = 0
+        self.embedded_texts = 0
+
+    def entities(self, text: str) -> List[Dict]:
+        tokens = list(dict.fromkeys(_TOKEN_PATTERN.findall(text)))
+        # 以文本哈希作为排序种子，不同chunk选出不同的实体
+        text_seed = self.seed + _stable_hash(text)
+        tokens.sort(key=lambda token: _stable_hash(token, text_seed))
+        return [{'entity': token, 'type': ENTITY_TYPES[_stable_hash(token, self.seed + 1) % len(ENTITY_TYPES)]}
+                for token in tokens[:self.entities_per_chunk]]
+
+    def relations(self, entities: List[Dict]) -> List[List[str]]:
+        names = [entity['entity'] for entity in entities]
+        return [[head, f"关系{_stable_hash(head + tail, self.seed) % 7}", tail]
+                for head, tail in zip(names, names[1:])]
+
+    def chat(self, prompt: str) -> str:
+        with self.lock:
+            self.chat_calls += 1
+        if self.chat_latency:
+            time.sleep(self.chat_latency)
+
+        if '【片段' in prompt:
+            sections = re.split(r'【片段(\d+)】', prompt)
+            items = []
+            for number, body in zip(sections[1::2], sections[2::2]):
+                entities = self.entities(_source_text(body))
+                items.append({'chunk': int(number), 'entities': entities, 'relations': self.relations(entities)})
+            return json.dumps(items, ensure_ascii=False)
+        if '"relations"' in prompt:
+            entities = self.entities(_source_text(prompt))
+            return json.dumps({'entities': entities, 'relations': self.relations(entities)}, ensure_ascii=False)
+        if '和实体列表：' in prompt:
+            entity_line = prompt.split('和实体列表：', 1)[1].split('\n', 1)[0]
+            try:
+                entities = ast.literal_eval(entity_line.strip())
+            except (ValueError, SyntaxError):
+                entities = []
+            return repr([tuple(relation) for relation in self.relations(entities)])
+        if '"points"' in prompt:
+            points = [{'point': f"社区{number}的要点", 'score': _stable_hash(number, self.seed) % 101,
+                       'communities': [int(number)]} for number in re.findall(r'【社区(\d+)】', prompt)]
+            return json.dumps({'points': points}, ensure_ascii=False)
+        if '提取实体' in prompt:
+            return json.dumps(self.entities(_source_text(prompt)), ensure_ascii=False)
+        return f"这是离线替身的回答（{_stable_hash(prompt, self.seed) % 1000}）"
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        with self.lock:
+            self.embedding_calls += 1
+            self.embedded_texts += len(texts)
+        if self.embedding_latency:
+            time.sleep(self.embedding_latency)
+        vectors = []
+        for text in texts:
+            # 按规范化后的文本取随机种子，大小写和空白不同的文本得到相同的向量
+            rng = np.random.default_rng(_stable_hash(text.strip().lower(), self.seed))
+            vector = rng.standard_normal(self.embedding_dim).astype(np.float32)
+            vectors.append((vector / np.linalg.norm(vector)).tolist())
+        return vectors
+
+
+class FakeOpenAI:
+    """
+    进程内替身，提供与openai.OpenAI一致的 chat.completions.create 和 embeddings.create
+    """
+    def __init__(self, backend: FakeBackend = None, **kwargs):
+        self.backend = backend or get_fake_backend()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create_chat_completion))
+        self.embeddings = SimpleNamespace(create=self._create_embeddings)
+
+    def _create_chat_completion(self, model: str, messages: List[Dict], **kwargs):
+        content = self.backend.chat(messages[-1]['content'])
+        return SimpleNamespace(
+            model=model,
+            choices=[SimpleNamespace(index=0, message=SimpleNamespace(role='assistant', content=content))]
+        )
+
+    def _create_embeddings(self, input, model: str, **kwargs):
+        texts = [input] if isinstance(input, str) else list(input)
+        return SimpleNamespace(
+            model=model,
+            data=[SimpleNamespace(index=i, embedding=vector) for i, vector in enumerate(self.backend.embed(texts))]
+        )
+
+
+_default_backend = None
+_default_backend_lock = threading.Lock()
+
+
+def get_fake_backend() -> FakeBackend:
+    global _default_backend
+    with _default_backend_lock:
+        if _default_backend is None:
+            _default_backend = FakeBackend()
+        return _default_backend
+
+
+class _FakeLLMHandler(BaseHTTPRequestHandler):
+    backend: FakeBackend = None
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        if self.path.endswith('/chat/completions'):
+            content = self.backend.chat(body['messages'][-1]['content'])
+            payload = {
+                'id': 'chatcmpl-fake', 'object': 'chat.completion', 'created': int(time.time()),
+                'model': body.get('model'),
+                'choices': [{'index': 0, 'finish_reason': 'stop',
+                             'message': {'role': 'assistant', 'content': content}}]
+            }
+        elif self.path.endswith('/embeddings'):
+            texts = body['input'] if isinstance(body['input'], list) else [body['input']]
+            payload = {
+                'object': 'list', 'model': body.get('model'),
+                'data': [{'object': 'embedding', 'index': i, 'embedding': vector}
+                         for i, vector in enumerate(self.backend.embed(texts))]
+            }
+        else:
+            self.send_error(404)
+            return
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeLLMServer:
+    """
+    本地HTTP替身服务，可在后台线程中运行
+    """
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, backend: FakeBackend = None):
+        handler = type('FakeLLMHandler', (_FakeLLMHandler,), {'backend': backend or get_fake_backend()})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='启动本地OpenAI兼容替身服务')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9300)
+    args = parser.parse_args()
+    server = FakeLLMServer(args.host, args.port)
+    print(f"fake LLM server listening on {server.base_url}")
+    server.server.serve_forever()
@@ -1,16 +1,26 @@
 import argparse
-from flask import Flask, request, jsonify
+import json
+from flask import Flask, Response, request, jsonify, stream_with_context
 import streamlit as st
 from preprocessor import Preprocessor
-from knowledge_graph import KnowledgeGraph
+from knowledge_graph import KnowledgeGraph, create_knowledge_graph
 import os
+import uuid
 from werkzeug.utils import secure_filename
-import pandas as pd
-import docx
 import threading
 import logging
 
-from query_processor import QueryProcessor
+from query_processor import get_query_processor
+from community_summary import get_community_index
+from chunk_store import get_chunk_store
+from document_reader import SUPPORTED_EXTENSIONS, read_document, remove_document
+from graph_export import ExportRequest, get_graph_exporter
+from event_stream import get_event_broker
+from job_manager import JOB_CANCELLED, JOB_QUEUED, JOB_RUNNING, Job, JobManager, JobQueueFull
+from embedding_cache import get_embedding_cache
+from extraction_cache import get_extraction_cache
+from graph_snapshot import save_graph_snapshot, load_latest_graph_snapshot
+from config import Config
 from streamlit_app import STREAMLIT_APP_PORT, STREAMLIT_BASE_PATH, streamlit_ui, FLASK_APP_PORT, FLASK_BASE_PATH
 
 # 解析命令行参数
@@ -23,131 +33,461 @@ flask_app = Flask(__name__)
 
 # 文件上传配置
 UPLOAD_FOLDER = 'uploads'
-ALLOWED_EXTENSIONS = {'txt', 'docx', 'xlsx'}
+ALLOWED_EXTENSIONS = set(SUPPORTED_EXTENSIONS)
 flask_app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
-# 全局任务状态
+# 当前对外提供查询的知识图谱，分析任务由job_manager管理
 task_status = {
-    'is_running': False,
-    'progress': 0,
-    'graph': None,
-    'preprocessor': None
+    'graph': None
 }
 task_lock = threading.Lock()
+# 图的写入和替换按任务开始的顺序依次进行，多个任务的预处理(LLM抽取)可以并发
+graph_update_turns = []  # 等待或正在写入图的任务ID，按开始顺序
+graph_update_condition = threading.Condition()
+# 运行中的增量任务 -> 预处理器，重新分析的结果替换当前图时保留这些任务的chunk
+incremental_preprocessors = {}
+events = get_event_broker()
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def read_file_content(filepath):
-    if filepath.endswith('.txt'):
-        with open(filepath, 'r', encoding='utf-8') as f:
-            return f.read()
-    elif filepath.endswith('.docx'):
-        doc = docx.Document(filepath)
-        return '\n'.join([para.text for para in doc.paragraphs])
-    elif filepath.endswith('.xlsx'):
-        df = pd.read_excel(filepath)
-        return df.to_string()
-    return ''
-
-def analyze_task(text):
-    global task_status
-    # 初始化模块
-    with task_lock:
-        task_status['is_running'] = True
-        task_status['progress'] = 0
-        task_status['graph'] = KnowledgeGraph()
-        task_status['preprocessor'] = Preprocessor()
-
-    preprocessor = task_status['preprocessor']
+def analyze_task(job: Job, text, incremental=False, bypass_cache=False, document='', path=None):
+    """
+    分析任务：增量任务追加到当前图，非增量任务构建新图并在完成后替换当前图(停止时保留原图)
+    Args:
+        path: 上传文档的保存路径，提供时在进程池中解析并流式读入，忽略text
+    """
+    chunk_store = get_chunk_store()
+    preprocessor = Preprocessor(bypass_cache=bypass_cache, chunk_store=chunk_store, llm_owner=job.id)
+    job.on_cancel(preprocessor.stop_analysis)
+    with graph_update_condition:
+        graph_update_turns.append(job.id)
+    if incremental:
+        with task_lock:
+            incremental_preprocessors[job.id] = preprocessor
 
     def progress_callback(progress, phase=0):
         """
         phase: 0 - 预处理阶段，1 - 知识图谱构建阶段
         """
-        with task_lock:
-            # 预处理阶段占50%，知识图谱构建阶段占50%
-            task_status['progress'] = (progress * 0.5) + (phase * 50)
+        # 预处理阶段占50%，知识图谱构建阶段占50%
+        job.update(progress=(progress * 0.5) + (phase * 50))
+
+    def chunk_callback(done_chunks, done_chars, total_chars):
+        job.update(chunks={'done': done_chunks, 'done_chars': done_chars, 'total_chars': total_chars})
 
-    # 预处理
-    preprocess_result = preprocessor.process(text, progress_callback=progress_callback)
-    if preprocess_result != None:
+    # 结果是否已写入对外提供查询的图，未写入就结束(取消或失败)时删除本任务保存的chunk
+    written = False
+    try:
+        total_chars = len(text)
+        if path:
+            # 文档在进程池中解析，解析出的文本按块流式交给chunk切分
+            job.update(stage='reading')
+            text, total_chars = read_document(path)
+            if job.should_stop:
+                return None
+
+        # 预处理
+        job.update(stage='preprocessing', chunks={'done': 0, 'done_chars': 0, 'total_chars': total_chars})
+        preprocess_result = preprocessor.process(text, progress_callback=progress_callback,
+                                                 graph=task_status['graph'] if incremental else None,
+                                                 document=document, chunk_callback=chunk_callback,
+                                                 total_chars=total_chars)
+        if preprocess_result is None:
+            return None
         unique_entities, relations = preprocess_result
+        embeddings = preprocessor.embed_entities(unique_entities)
 
-        # 构建知识图谱
-        task_status['graph'].add_entities(unique_entities, lambda p: progress_callback(p, 1))
-        task_status['graph'].add_relations(relations, lambda p: progress_callback(p, 1))
+        with graph_update_condition:
+            # 先开始的任务写入图之后才轮到本任务，保证增量结果不会被更早开始的重新分析覆盖
+            graph_update_condition.wait_for(lambda: graph_update_turns[0] == job.id)
+        try:
+            if job.should_stop:
+                return None
+            graph = task_status['graph'] if incremental else None
+            replace = graph is None
+            if replace:
+                graph = create_knowledge_graph()
+            graph.clear_stop()
+            # 增量任务直接写入当前图，停止时已写入的部分保留
+            written = not replace
+            # 图可能被其他任务共享，只在本任务写入期间响应取消
+            building = [True]
+            job.on_cancel(lambda: building[0] and graph.stop_analysis())
 
-    with task_lock:
-        task_status['is_running'] = False
+            # 构建知识图谱，同时保存节点embedding供后续增量导入对齐
+            job.update(stage='building')
+            graph.add_entities(unique_entities, lambda p: progress_callback(p, 1), embeddings=embeddings)
+            completed = graph.add_relations(relations, lambda p: progress_callback(p, 1))
+            building[0] = False
+            if replace and not completed:
+                return None
 
-@flask_app.route(f'{FLASK_BASE_PATH}/analyze', methods=['POST'])
-def analyze():
+            if replace:
+                with task_lock:
+                    task_status['graph'] = graph
+                    written = True
+                    # 替换后只保留本任务和仍在运行的增量任务的chunk
+                    retained = list(preprocessor.chunk_ids)
+                    for other in incremental_preprocessors.values():
+                        if other is not preprocessor:
+                            retained.extend(other.chunk_ids)
+                if chunk_store is not None:
+                    chunk_store.retain(retained)
+
+            # 保存快照，服务重启后无需重新抽取
+            if completed and Config.GRAPH_SNAPSHOT_ENABLED:
+                try:
+                    save_graph_snapshot(graph)
+                except OSError as e:
+                    logging.error(f"保存图快照失败: {e}")
+        finally:
+            finish_graph_update(job.id)
+        publish_status()
+
+        # 新图的检索索引在后台构建好，查询不必等待
+        job.update(stage='indexing')
+        get_query_processor(graph).warm_up()
+
+        # 生成社区摘要供全局查询使用，增量导入时只有内容变化的社区调用LLM
+        if completed and Config.COMMUNITY_SUMMARY_ENABLED:
+            job.update(stage='summarizing')
+            # 图和快照已写入，摘要生成失败不影响本次分析的结果，之后的全局查询会在后台重试
+            try:
+                get_community_index(graph).refresh(should_stop=lambda: job.should_stop, llm_owner=job.id)
+            except Exception:
+                logging.exception("生成社区摘要失败")
+
+        job.update(progress=100, stage='completed' if completed else 'stopped')
+        return {
+            'graph_version': graph.version,
+            'entities': len(unique_entities),
+            'relations': len(relations),
+            'completed': completed
+        }
+    finally:
+        finish_graph_update(job.id)
+        with task_lock:
+            incremental_preprocessors.pop(job.id, None)
+        if not written and chunk_store is not None:
+            chunk_store.remove(preprocessor.chunk_ids)
+
+def finish_graph_update(job_id):
+    """
+    任务写入图完成(或提前结束)，轮到下一个任务
+    """
+    with graph_update_condition:
+        if job_id in graph_update_turns:
+            graph_update_turns.remove(job_id)
+            graph_update_condition.notify_all()
+
+def current_job():
+    """
+    兼容单任务接口：返回最近提交的未结束任务，没有时返回最近提交的任务
+    """
+    jobs = job_manager.list()
+    active = [job for job in jobs if not job.is_finished]
+    return (active or jobs or [None])[-1]
+
+def publish_status():
+    """
+    发布当前任务的进度、阶段、chunk完成数和图版本，内容未变化时不产生新事件
+    """
+    job = current_job()
+    state = job.to_dict() if job else None
+    events.publish('progress', progress_status(state))
+    if state is not None:
+        if state['stage']:
+            events.publish('stage', {'stage': state['stage']})
+        if state['chunks']:
+            events.publish('chunks', state['chunks'])
+    graph = task_status['graph']
+    if graph is not None:
+        events.publish('graph', {'version': graph.version})
+
+def progress_status(state):
+    """
+    由任务状态生成 /progress 的进度信息，被停止的任务进度为0
+    """
+    if state is None:
+        return {'is_running': False, 'progress': 0}
+    return {
+        'is_running': state['status'] in (JOB_QUEUED, JOB_RUNNING),
+        'progress': 0 if state['status'] == JOB_CANCELLED else state['progress'],
+        'job_id': state['job_id']
+    }
+
+def on_job_update(job: Job):
+    events.publish('job', job.to_dict(), key=job.id)
+    publish_status()
+
+job_manager = JobManager(listener=on_job_update, on_remove=lambda job: events.discard('job', job.id))
+
+def parse_analysis_request():
+    """
+    解析分析请求的文本或上传文件及选项
+    Returns:
+        提交任务的参数，没有输入时返回None
+    """
     # 获取输入文本或文件
     text = request.form.get('text', '')
     file = request.files.get('file')
+    # 增量模式：在已有知识图谱上追加，而不是重新构建
+    incremental = request.form.get('incremental', 'false').lower() == 'true'
+    # 跳过抽取结果缓存，强制重新调用LLM
+    bypass_cache = request.form.get('bypass_cache', 'false').lower() == 'true'
 
+    document = ''
+    filepath = None
     if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(flask_app.config['UPLOAD_FOLDER'], filename)
+        # 上传的文件只保存到磁盘，由分析任务解析；以唯一名称保存，同名文件的任务互不影响
+        extension = file.filename.rsplit('.', 1)[1].lower()
+        os.makedirs(flask_app.config['UPLOAD_FOLDER'], exist_ok=True)
+        filepath = os.path.join(flask_app.config['UPLOAD_FOLDER'], f"{uuid.uuid4().hex}.{extension}")
         file.save(filepath)
-        text = read_file_content(filepath)
+        text = ''
+        document = secure_filename(file.filename)
+
+    if not text and not filepath:
+        return None
+    return {'text': text, 'incremental': incremental, 'bypass_cache': bypass_cache, 'document': document,
+            'path': filepath}
+
+def submit_analysis(params):
+    """
+    提交分析任务，任务参数中不保存原文；上传的文档在任务结束后删除
+    """
+    path = params['path']
+    info = {'incremental': params['incremental'], 'bypass_cache': params['bypass_cache'],
+            'document': params['document']}
+    if path:
+        info['bytes'] = os.path.getsize(path)
+    else:
+        info['chars'] = len(params['text'])
+    try:
+        return job_manager.submit('analyze', lambda job: analyze_task(job, **params), info,
+                                  cleanup=(lambda: remove_document(path)) if path else None)
+    except JobQueueFull:
+        if path:
+            remove_document(path)
+        raise
+
+def queue_full_response(error):
+    response = jsonify({'error': str(error)})
+    response.status_code = 429
+    response.headers['Retry-After'] = '10'
+    return response
 
-    if not text:
+@flask_app.route(f'{FLASK_BASE_PATH}/analyze', methods=['POST'])
+def analyze():
+    params = parse_analysis_request()
+    if params is None:
         return jsonify({'error': 'No input provided'}), 400
 
     # 启动异步任务
-    thread = threading.Thread(target=analyze_task, daemon=True, args=(text,))
-    thread.start()
+    try:
+        job = submit_analysis(params)
+    except JobQueueFull as e:
+        return queue_full_response(e)
 
-    return jsonify({'status': 'started'}), 200
+    return jsonify({'status': 'started', 'job_id': job.id}), 200
 
 @flask_app.route(f'{FLASK_BASE_PATH}/progress', methods=['GET'])
 def get_progress():
-    with task_lock:
-        return jsonify({
-            'is_running': task_status['is_running'],
-            'progress': task_status['progress']
-        })
+    job = current_job()
+    graph = task_status['graph']
+    return jsonify({
+        **progress_status(job.to_dict() if job else None),
+        'graph_version': graph.version if graph else 0
+    })
 
 @flask_app.route(f'{FLASK_BASE_PATH}/stop', methods=['POST'])
 def stop_analysis():
-    with task_lock:
-        if task_status['graph']:
-            task_status['graph'].stop_analysis()
-            task_status['preprocessor'].stop_analysis()
-            task_status['is_running'] = False
-            task_status['progress'] = 0
+    """
+    停止分析任务，未指定job_id时停止所有排队和运行中的任务
+    """
+    job_id = request.values.get('job_id')
+    jobs = [job_manager.get(job_id)] if job_id else job_manager.active()
+    for job in jobs:
+        if job is not None:
+            job_manager.cancel(job.id)
+    publish_status()
     return jsonify({'status': 'stopped'})
 
+@flask_app.route(f'{FLASK_BASE_PATH}/jobs', methods=['POST'])
+def submit_job():
+    params = parse_analysis_request()
+    if params is None:
+        return jsonify({'error': 'No input provided'}), 400
+    try:
+        job = submit_analysis(params)
+    except JobQueueFull as e:
+        return queue_full_response(e)
+    return jsonify(job.to_dict()), 202
+
+@flask_app.route(f'{FLASK_BASE_PATH}/jobs', methods=['GET'])
+def list_jobs():
+    status = request.args.get('status')
+    return jsonify({'jobs': [job.to_dict() for job in job_manager.list(status)], **job_manager.stats()})
+
+@flask_app.route(f'{FLASK_BASE_PATH}/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+@flask_app.route(f'{FLASK_BASE_PATH}/jobs/<job_id>', methods=['DELETE'])
+@flask_app.route(f'{FLASK_BASE_PATH}/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    job = job_manager.cancel(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+@flask_app.route(f'{FLASK_BASE_PATH}/events', methods=['GET'])
+def get_events():
+    """
+    以SSE推送事件：progress(当前任务进度)、stage(阶段)、chunks(已完成chunk数)、graph(图版本)、job(每个任务的状态)，
+    同类型(同一任务)的快速更新合并为最新值，重连时按Last-Event-ID补发错过的事件
+    """
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('last_id') or 0
+    try:
+        last_id = int(last_id)
+    except ValueError:
+        last_id = 0
+    response = Response(events.subscribe(last_id), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # 禁止反向代理缓冲事件流
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @flask_app.route(f'{FLASK_BASE_PATH}/query', methods=['POST'])
 def query():
     data = request.get_json()
     query_text = data.get('query', '')
+    # local - 检索相关节点, global - 基于社区摘要回答关于整个语料的问题
+    mode = data.get('mode', 'local')
 
     if not query_text:
         return jsonify({'error': 'No query provided'}), 400
+    if mode not in ('local', 'global'):
+        return jsonify({'error': f'Unknown query mode: {mode}'}), 400
 
-    # 初始化查询处理器
     graph: KnowledgeGraph = task_status['graph']
-    query_processor = QueryProcessor(graph)
+    if not graph:
+        return jsonify({'error': 'Graph not available'}), 404
+    # 同一个图的查询服务在请求之间复用
+    query_processor = get_query_processor(graph)
 
     # 处理查询
-    result = query_processor.process_query(query_text)
+    result = query_processor.process_query(query_text, mode)
     return jsonify({'result': result})
 
+@flask_app.route(f'{FLASK_BASE_PATH}/query/batch', methods=['POST'])
+def query_batch():
+    """
+    批量查询，以NDJSON逐行返回每条查询的结果(按完成顺序，index为查询在请求中的位置)
+    """
+    data = request.get_json(silent=True) or {}
+    queries = data.get('queries')
+    mode = data.get('mode', 'local')
+
+    if not isinstance(queries, list) or not queries or not all(isinstance(q, str) and q for q in queries):
+        return jsonify({'error': 'queries must be a non-empty list of strings'}), 400
+    if len(queries) > Config.QUERY_BATCH_MAX_SIZE:
+        return jsonify({'error': f'Too many queries, at most {Config.QUERY_BATCH_MAX_SIZE}'}), 413
+    if mode not in ('local', 'global'):
+        return jsonify({'error': f'Unknown query mode: {mode}'}), 400
+    try:
+        timeout = min(float(data.get('timeout', Config.QUERY_BATCH_TIMEOUT)), Config.QUERY_BATCH_TIMEOUT)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'timeout must be a number'}), 400
+
+    graph: KnowledgeGraph = task_status['graph']
+    if not graph:
+        return jsonify({'error': 'Graph not available'}), 404
+    query_processor = get_query_processor(graph)
+
+    def generate():
+        for item in query_processor.process_queries(queries, mode, timeout):
+            yield json.dumps(item, ensure_ascii=False) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@flask_app.route(f'{FLASK_BASE_PATH}/cache/stats', methods=['GET'])
+def get_cache_stats():
+    embedding_cache = get_embedding_cache()
+    extraction_cache = get_extraction_cache()
+    graph = task_status['graph']
+    return jsonify({
+        'embedding': embedding_cache.stats() if embedding_cache else None,
+        'extraction': extraction_cache.stats() if extraction_cache else None,
+        'query': get_query_processor(graph).stats() if graph else None,
+        'community': get_community_index(graph).stats() if graph else None,
+        'graph_export': get_graph_exporter(graph).stats() if graph else None
+    })
+
 @flask_app.route(f'{FLASK_BASE_PATH}/graph', methods=['GET'])
 def get_graph():
-    with task_lock:
-        if not task_status['graph']:
-            return jsonify({'error': 'Graph not available'}), 404
-        
-        graph_data = task_status['graph'].to_dict()
-        logging.info(f"{jsonify(graph_data)}")
-        return jsonify(graph_data)
+    """
+    导出图，序列化结果按图版本缓存，If-None-Match与当前版本的ETag一致时返回304
+    查询参数：node(可重复)/hops 导出节点的k跳邻域，type(可重复) 按节点类型过滤，top 只取度数最高的节点，
+    offset/limit 分页，format=compact 使用按列存储的紧凑格式
+    """
+    graph: KnowledgeGraph = task_status['graph']
+    if not graph:
+        return jsonify({'error': 'Graph not available'}), 404
+    exporter = get_graph_exporter(graph)
+
+    etag = exporter.etag()
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    params = ExportRequest(
+        nodes=tuple(request.args.getlist('node')),
+        types=tuple(request.args.getlist('type')),
+        hops=request.args.get('hops', 1, type=int),
+        top=request.args.get('top', None, type=int),
+        offset=request.args.get('offset', 0, type=int),
+        limit=request.args.get('limit', None, type=int),
+        format=request.args.get('format', 'node_link')
+    )
+    try:
+        version, data = exporter.export(params)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except KeyError as e:
+        return jsonify({'error': f'Node not found: {e.args[0]}'}), 404
+
+    response = Response(data, mimetype='application/json')
+    response.set_etag(exporter.etag(version))
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Graph-Version'] = str(version)
+    return response
+
+def load_graph_snapshot_at_startup():
+    """
+    启动时加载最新的图快照
+    """
+    if not Config.GRAPH_SNAPSHOT_ENABLED:
+        return
+    graph = load_latest_graph_snapshot()
+    if graph is not None:
+        with task_lock:
+            task_status['graph'] = graph
+        logging.info(f"已加载图快照，版本 {graph.version}")
+        publish_status()
+        threading.Thread(target=get_query_processor(graph).warm_up, daemon=True).start()
+        # 社区摘要大多可从抽取结果缓存中恢复，在后台生成，全局查询在此之前使用空结果
+        if Config.COMMUNITY_SUMMARY_ENABLED:
+            get_community_index(graph).refresh_in_background()
 
 if __name__ == "__main__":
     args = parser.parse_args()
+    load_graph_snapshot_at_startup()
     
     # 启动Flask应用
     flask_app.run(
@@ -0,0 +1,170 @@
+"""
+图的数组表示：字符串表、名称驻留表和别名表均由定长NumPy数组构成，
+可直接保存为 .npy 文件并以内存映射方式加载，加载耗时与图的规模无关
+"""
+import hashlib
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional
+import numpy as np
+
+
+def _name_hash(name: str) -> int:
+    return int.from_bytes(hashlib.blake2b(name.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class StringTable:
+    """
+    只读字符串表：所有字符串的UTF-8编码拼接为data，第i个字符串为 data[offsets[i]:offsets[i + 1]]
+    """
+    def __init__(self, data: np.ndarray = None, offsets: np.ndarray = None):
+        self.data = np.zeros(0, dtype=np.uint8) if data is None else data
+        self.offsets = np.zeros(1, dtype=np.int64) if offsets is None else offsets
+
+    @classmethod
+    def from_strings(cls, strings: Iterable[str]) -> 'StringTable':
+        encoded = [string.encode('utf-8') for string in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(item) for item in encoded], out=offsets[1:])
+        return cls(np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> str:
+        return self.data[self.offsets[index]:self.offsets[index + 1]].tobytes().decode('utf-8')
+
+    def __iter__(self) -> Iterator[str]:
+        blob = self.data.tobytes()
+        offsets = self.offsets.tolist()
+        for start, end in zip(offsets, offsets[1:]):
+            yield blob[start:end].decode('utf-8')
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        return {'data': self.data, 'offsets': self.offsets}
+
+
+class NameTable:
+    """
+    名称驻留表：名称与连续整数ID双向映射
+    加载自快照的部分保存在只读字符串表中，按名称哈希排序后二分查找；
+    之后新增的名称追加到内存中的列表和字典
+    """
+    def __init__(self, strings: StringTable = None, hashes: np.ndarray = None, order: np.ndarray = None):
+        self.base = strings or StringTable()
+        self.base_hashes = np.zeros(0, dtype=np.uint64) if hashes is None else hashes
+        self.base_order = np.zeros(0, dtype=np.int64) if order is None else order
+        self.base_size = len(self.base)
+        self.names: List[str] = []
+        self.ids: Dict[str, int] = {}
+
+    @classmethod
+    def from_names(cls, names: Iterable[str]) -> 'NameTable':
+        table = cls()
+        for name in names:
+            table.intern(name)
+        return table
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> 'NameTable':
+        return cls(StringTable(arrays['data'], arrays['offsets']), arrays['hashes'], arrays['order'])
+
+    def __len__(self):
+        return self.base_size + len(self.names)
+
+    def __getitem__(self, index: int) -> str:
+        if index < self.base_size:
+            return self.base[index]
+        return self.names[index - self.base_size]
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self.base
+        yield from self.names
+
+    def __contains__(self, name: str):
+        return self.get(name) is not None
+
+    def get(self, name: str, default: int = None) -> Optional[int]:
+        index = self.ids.get(name)
+        if index is not None:
+            return index
+        if self.base_size:
+            name_hash = np.uint64(_name_hash(name))
+            position = int(np.searchsorted(self.base_hashes, name_hash))
+            while position < self.base_size and self.base_hashes[position] == name_hash:
+                index = int(self.base_order[position])
+                if self.base[index] == name:
+                    return index
+                position += 1
+        return default
+
+    def intern(self, name: str) -> int:
+        """
+        返回名称的ID，名称不存在时追加
+        """
+        index = self.get(name)
+        if index is None:
+            index = len(self)
+            self.ids[name] = index
+            self.names.append(name)
+        return index
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        strings = StringTable.from_strings(self) if self.names else self.base
+        # 快照中已有名称的哈希按排序位置还原，只需为新增名称计算哈希
+        hashes = np.zeros(len(self), dtype=np.uint64)
+        hashes[self.base_order] = self.base_hashes
+        hashes[self.base_size:] = [_name_hash(name) for name in self.names]
+        order = np.argsort(hashes, kind='stable')
+        return {**strings.to_arrays(), 'hashes': hashes[order], 'order': order.astype(np.int64)}
+
+
+class AliasTable:
+    """
+    每个节点的别名列表：快照部分以 indptr + 字符串表存储，之后的修改保存在内存字典中
+    """
+    def __init__(self, indptr: np.ndarray = None, strings: StringTable = None):
+        self.base_indptr = np.zeros(1, dtype=np.int64) if indptr is None else indptr
+        self.base = strings or StringTable()
+        self.overrides: Dict[int, List[str]] = {}
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> 'AliasTable':
+        return cls(arrays['indptr'], StringTable(arrays['data'], arrays['offsets']))
+
+    def get(self, node_id: int, default: List[str] = None) -> Optional[List[str]]:
+        aliases = self.overrides.get(node_id)
+        if aliases is not None:
+            return aliases
+        if node_id < len(self.base_indptr) - 1:
+            start, end = self.base_indptr[node_id], self.base_indptr[node_id + 1]
+            if end > start:
+                return [self.base[i] for i in range(start, end)]
+        return default
+
+    def __setitem__(self, node_id: int, aliases: List[str]):
+        self.overrides[node_id] = aliases
+
+    def to_arrays(self, node_count: int) -> Dict[str, np.ndarray]:
+        lists = [self.get(node_id, []) for node_id in range(node_count)]
+        indptr = np.zeros(node_count + 1, dtype=np.int64)
+        np.cumsum([len(aliases) for aliases in lists], out=indptr[1:])
+        strings = StringTable.from_strings(alias for aliases in lists for alias in aliases)
+        return {'indptr': indptr, **strings.to_arrays()}
+
+
+class GraphArrays(NamedTuple):
+    """
+    两种图存储通用的数组表示，边以 (较小节点ID << 32 | 较大节点ID) 为键升序排列，
+    edge_forward表示关系的头实体是否为键中ID较小的节点
+    """
+    version: int
+    node_names: NameTable
+    node_types: np.ndarray  # int32，-1表示未设置
+    type_names: NameTable
+    aliases: AliasTable
+    relation_names: NameTable
+    edge_keys: np.ndarray  # int64
+    edge_relations: np.ndarray  # int32
+    edge_weights: np.ndarray  # int32
+    edge_forward: np.ndarray  # bool
+    embedding_names: NameTable
+    embeddings: np.ndarray  # float32，与embedding_names逐行对齐
@@ -0,0 +1,230 @@
+"""
+图导出：基于当前版本的CSR快照序列化，不在图的锁内做序列化，序列化结果按图版本缓存
+
+支持按节点(及其k跳邻域)、节点类型和度数过滤子图，以及按节点ID顺序分页：
+每条边归入其ID较小的端点所在的页，依次取完所有页恰好得到完整的子图，每条边只出现一次
+"""
+import json
+import threading
+import uuid
+import weakref
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import numpy as np
+from config import Config
+from csr_snapshot import CSRSnapshot
+from knowledge_graph import KnowledgeGraph
+
+EXPORT_FORMATS = ('node_link', 'compact')
+# 选中的节点不超过该数量时逐个读取节点属性，否则一次读取全部节点属性
+_NODE_ATTRS_BATCH_THRESHOLD = 1024
+
+
+class ExportRequest(NamedTuple):
+    nodes: Tuple[str, ...] = ()  # 只导出这些节点及其hops跳以内的邻居，为空时导出全部节点
+    types: Tuple[str, ...] = ()  # 只导出这些类型的节点
+    hops: int = 1
+    top: Optional[int] = None  # 只导出度数最高的top个节点(nodes中的节点优先保留)，用于大图的概览
+    offset: int = 0
+    limit: Optional[int] = None  # 每页的节点数，为None时不分页
+    format: str = 'node_link'  # node_link - 与 nx.node_link_data 相同的结构，compact - 按列存储的紧凑结构
+
+
+class GraphExporter:
+    """
+    图的导出服务，线程安全，同一个图在多次请求之间复用
+    """
+    def __init__(self, graph: KnowledgeGraph, cache_size: int = None):
+        self.graph = graph
+        # 区分不同的图对象，重新分析后新图的版本号可能与旧图相同
+        self.token = uuid.uuid4().hex[:12]
+        self.cache_size = Config.GRAPH_EXPORT_CACHE_SIZE if cache_size is None else cache_size
+        self.lock = threading.Lock()
+        self.cache: OrderedDict = OrderedDict()  # 导出参数 -> 序列化结果，只保存cache_version的结果
+        self.cache_version = None
+        self.hits = 0
+        self.misses = 0
+
+    def etag(self, version: int = None) -> str:
+        """
+        返回图某一版本(默认为当前版本)导出结果的ETag
+        """
+        return f"{self.token}-{self.graph.version if version is None else version}"
+
+    def export(self, params: ExportRequest) -> Tuple[int, bytes]:
+        """
+        导出图或子图，返回 (图版本, JSON字节串)
+        Raises:
+            ValueError: 参数不合法
+            KeyError: 过滤条件中的节点不存在
+        """
+        self._validate(params)
+        snapshot = self.graph.csr_snapshot()
+        version = snapshot.version
+        with self.lock:
+            if self.cache_version is None or version > self.cache_version:
+                self.cache.clear()
+                self.cache_version = version
+            data = self.cache.get(params) if version == self.cache_version else None
+            if data is not None:
+                self.cache.move_to_end(params)
+                self.hits += 1
+                return version, data
+            self.misses += 1
+
+        data = json.dumps(self._serialize(snapshot, params), ensure_ascii=False).encode('utf-8')
+        with self.lock:
+            if self.cache_size > 0 and version == self.cache_version:
+                self.cache[params] = data
+                while len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+        return version, data
+
+    @staticmethod
+    def _validate(params: ExportRequest):
+        if params.format not in EXPORT_FORMATS:
+            raise ValueError(f"未知的导出格式: {params.format}")
+        if not 0 <= params.hops <= Config.GRAPH_EXPORT_MAX_HOPS:
+            raise ValueError(f"hops必须在0到{Config.GRAPH_EXPORT_MAX_HOPS}之间")
+        if params.top is not None and not 0 < params.top <= Config.GRAPH_EXPORT_MAX_LIMIT:
+            raise ValueError(f"top必须在1到{Config.GRAPH_EXPORT_MAX_LIMIT}之间")
+        if params.offset < 0:
+            raise ValueError("offset不能为负数")
+        if params.limit is not None and not 0 < params.limit <= Config.GRAPH_EXPORT_MAX_LIMIT:
+            raise ValueError(f"limit必须在1到{Config.GRAPH_EXPORT_MAX_LIMIT}之间")
+
+    @staticmethod
+    def _select(snapshot: CSRSnapshot, params: ExportRequest) -> np.ndarray:
+        """
+        返回按ID升序排列的选中节点；按节点过滤时先扩展k跳邻域，再按类型过滤，最后按度数取前top个
+        """
+        seeds = []
+        if params.nodes:
+            for name in params.nodes:
+                node_id = snapshot.lookup(name)
+                if node_id is None:
+                    raise KeyError(name)
+                seeds.append(node_id)
+            selected = np.zeros(snapshot.num_nodes, dtype=bool)
+            frontier = np.unique(np.array(seeds, dtype=np.int64))
+            selected[frontier] = True
+            for _ in range(params.hops):
+                if not len(frontier):
+                    break
+                neighbors = np.unique(snapshot.gather_neighbors(frontier))
+                frontier = neighbors[~selected[neighbors]]
+                selected[frontier] = True
+            ids = np.flatnonzero(selected)
+        else:
+            ids = np.arange(snapshot.num_nodes)
+        if params.types:
+            types = set(params.types)
+            ids = ids[np.array([snapshot.node_types[node_id] in types for node_id in ids.tolist()], dtype=bool)]
+        if params.top is not None and len(ids) > params.top:
+            is_seed = np.isin(ids, seeds)
+            order = np.lexsort((ids, -snapshot.degrees[ids], ~is_seed))
+            ids = np.sort(ids[order[:params.top]])
+        return ids
+
+    def _node_attrs(self, names: List[str]) -> Dict[str, Dict]:
+        if len(names) <= _NODE_ATTRS_BATCH_THRESHOLD:
+            return {name: self.graph.get_node(name) or {} for name in names}
+        return dict(self.graph.node_items())
+
+    def _serialize(self, snapshot: CSRSnapshot, params: ExportRequest) -> Dict:
+        ids = self._select(snapshot, params)
+        end = len(ids) if params.limit is None else min(params.offset + params.limit, len(ids))
+        page = ids[params.offset:end]
+        selected = np.zeros(snapshot.num_nodes, dtype=bool)
+        selected[ids] = True
+
+        # 页内节点的邻接边中，另一端点也被选中且ID不小于本端点的边(自环在两条邻接记录中取正向的一条)
+        positions = snapshot.neighbor_positions(page)
+        sources = np.repeat(page, snapshot.degrees[page])
+        targets = snapshot.indices[positions]
+        keep = ((sources < targets) | ((sources == targets) & snapshot.edge_forward[positions])) & selected[targets]
+        positions, sources, targets = positions[keep], sources[keep], targets[keep]
+        weights = snapshot.edge_weights[positions]
+        # 快照中的权重为浮点数，整数权重按整数输出，与直接导出networkx图一致
+        weights = weights.astype(np.int64).tolist() if np.array_equal(weights, np.round(weights)) \
+            else weights.tolist()
+        forward = snapshot.edge_forward[positions].tolist()
+
+        names = [snapshot.node_names[node_id] for node_id in page.tolist()]
+        attrs = self._node_attrs(names)
+        result = {
+            'version': snapshot.version,
+            'graph_nodes': snapshot.num_nodes,
+            'total_nodes': len(ids),
+            'offset': params.offset,
+            'next_offset': end if end < len(ids) else None
+        }
+        if params.format == 'compact':
+            relation_ids, relation_index = np.unique(snapshot.edge_relations[positions], return_inverse=True)
+            type_names = list(dict.fromkeys(snapshot.node_types[node_id] for node_id in page.tolist()
+                                            if snapshot.node_types[node_id] is not None))
+            type_index = {name: i for i, name in enumerate(type_names)}
+            result.update({
+                'types': type_names,
+                'relations': [snapshot.relation_names[relation] for relation in relation_ids.tolist()],
+                # 节点和边的各字段分列存储，source/target为节点ID，type/relation为types/relations中的下标(无类型为-1)
+                'nodes': {
+                    'id': page.tolist(),
+                    'name': names,
+                    'type': [type_index.get(snapshot.node_types[node_id], -1) for node_id in page.tolist()],
+                    'aliases': [list(attrs[name].get('aliases', [])) for name in names]
+                },
+                # forward为true时source是关系的头实体
+                'links': {
+                    'source': sources.tolist(),
+                    'target': targets.tolist(),
+                    'relation': relation_index.tolist(),
+                    'weight': weights,
+                    'forward': forward
+                }
+            })
+            return result
+
+        relation_names = [snapshot.relation_names[relation] for relation in snapshot.edge_relations[positions].tolist()]
+        source_names = [snapshot.node_names[node_id] for node_id in sources.tolist()]
+        target_names = [snapshot.node_names[node_id] for node_id in targets.tolist()]
+        result.update({
+            'directed': False,
+            'multigraph': False,
+            'graph': {},
+            'nodes': [{**attrs[name], 'id': name} for name in names],
+            'links': [
+                {'relation': relation, 'weight': weight, 'head': source if is_forward else target,
+                 'source': source, 'target': target}
+                for relation, weight, is_forward, source, target
+                in zip(relation_names, weights, forward, source_names, target_names)
+            ]
+        })
+        return result
+
+    def stats(self) -> Dict:
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "items": len(self.cache),
+                "graph_version": self.cache_version
+            }
+
+
+_exporters = weakref.WeakKeyDictionary()
+_exporters_lock = threading.Lock()
+
+
+def get_graph_exporter(graph: KnowledgeGraph) -> GraphExporter:
+    """
+    获取图对应的导出服务，同一个图的导出结果在多次请求之间复用
+    """
+    with _exporters_lock:
+        exporter = _exporters.get(graph)
+        if exporter is None:
+            exporter = GraphExporter(graph)
+            _exporters[graph] = exporter
+        return exporter
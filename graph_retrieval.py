@@ -0,0 +1,134 @@
+from collections import deque
+from typing import Dict, List, Tuple
+import numpy as np
+from config import Config
+from csr_snapshot import CSRSnapshot
+
+
+def _degree_factor(degrees: np.ndarray, penalty: float) -> np.ndarray:
+    # 度数越高的枢纽节点携带的信息越泛，按 (1 + ln(1 + 度数))^-penalty 衰减
+    if not penalty:
+        return np.ones(len(degrees), dtype=np.float32)
+    return (1.0 + np.log1p(degrees.astype(np.float32))) ** -penalty
+
+
+def expand_subgraph(snapshot: CSRSnapshot, seeds: List[Tuple[str, float]], hops: int = None, fanout: int = None,
+                    node_budget: int = None, degree_penalty: float = None, min_score: float = None) -> Dict:
+    """
+    从种子节点出发按跳扩展邻域，返回用于生成回答的上下文子图
+    邻居得分 = 父节点得分 * 边权重因子 w/(w+1) * 度数惩罚因子，
+    每个节点每跳只保留得分最高的fanout个邻居，低于min_score的剪枝，总节点数不超过node_budget
+    Args:
+        seeds: (节点名称, 相似度) 列表，不在图中的节点被忽略
+    Returns:
+        {"nodes": [{entity, type, score, hop}], "edges": [[头实体, 关系, 尾实体]], "paths": [[种子, ..., 种子]]}
+    """
+    hops = Config.RETRIEVAL_HOPS if hops is None else hops
+    fanout = fanout or Config.RETRIEVAL_FANOUT
+    node_budget = node_budget or Config.RETRIEVAL_NODE_BUDGET
+    degree_penalty = Config.RETRIEVAL_DEGREE_PENALTY if degree_penalty is None else degree_penalty
+    min_score = Config.RETRIEVAL_MIN_SCORE if min_score is None else min_score
+
+    scores = {}
+    hop_of = {}
+    for name, score in seeds:
+        node_id = snapshot.lookup(name)
+        if node_id is not None and node_id not in scores and len(scores) < node_budget:
+            scores[node_id] = float(score)
+            hop_of[node_id] = 0
+    seed_ids = list(scores)
+
+    frontier = seed_ids
+    for hop in range(1, hops + 1):
+        if not frontier or len(scores) >= node_budget:
+            break
+        candidates = {}
+        for node_id in frontier:
+            edges = snapshot.neighbors(node_id)
+            neighbors = snapshot.indices[edges]
+            if len(neighbors) == 0:
+                continue
+            weights = snapshot.edge_weights[edges]
+            neighbor_scores = scores[node_id] * weights / (weights + 1) \
+                * _degree_factor(snapshot.degrees[neighbors], degree_penalty)
+            if len(neighbors) > fanout:
+                top = np.argpartition(-neighbor_scores, fanout - 1)[:fanout]
+                neighbors, neighbor_scores = neighbors[top], neighbor_scores[top]
+            for neighbor, score in zip(neighbors.tolist(), neighbor_scores.tolist()):
+                if neighbor not in scores and score >= min_score and score > candidates.get(neighbor, 0.0):
+                    candidates[neighbor] = score
+
+        # 本跳候选按得分排序，只取剩余预算内的节点作为下一跳的起点
+        ranked = sorted(candidates.items(), key=lambda item: -item[1])[:node_budget - len(scores)]
+        for neighbor, score in ranked:
+            scores[neighbor] = score
+            hop_of[neighbor] = hop
+        frontier = [neighbor for neighbor, _ in ranked]
+
+    # 取选中节点之间的全部边作为子图的边
+    selected = np.fromiter(scores, dtype=np.int64, count=len(scores))
+    adjacency = {node_id: [] for node_id in scores}
+    edges = []
+    for node_id in scores:
+        span = snapshot.neighbors(node_id)
+        neighbors = snapshot.indices[span]
+        mask = np.isin(neighbors, selected)
+        for neighbor, relation, forward in zip(neighbors[mask].tolist(), snapshot.edge_relations[span][mask].tolist(),
+                                               snapshot.edge_forward[span][mask].tolist()):
+            adjacency[node_id].append(neighbor)
+            if neighbor > node_id or (neighbor == node_id and forward):
+                head, tail = (node_id, neighbor) if forward else (neighbor, node_id)
+                edges.append([snapshot.node_names[head], snapshot.relation_names[relation], snapshot.node_names[tail]])
+
+    nodes = [{
+        "entity": snapshot.node_names[node_id],
+        "type": snapshot.node_types[node_id],
+        "score": score,
+        "hop": hop_of[node_id]
+    } for node_id, score in sorted(scores.items(), key=lambda item: (hop_of[item[0]], -item[1]))]
+
+    return {
+        "nodes": nodes,
+        "edges": edges,
+        "paths": _seed_paths(snapshot, seed_ids, adjacency)
+    }
+
+
+def _seed_paths(snapshot: CSRSnapshot, seed_ids: List[int], adjacency: Dict[int, List[int]]) -> List[List[str]]:
+    """
+    在子图内为每对种子节点找一条最短路径
+    """
+    paths = []
+    for i, source in enumerate(seed_ids[:-1]):
+        targets = set(seed_ids[i + 1:])
+        parents = {source: None}
+        queue = deque([source])
+        while queue and targets - parents.keys():
+            node_id = queue.popleft()
+            for neighbor in adjacency[node_id]:
+                if neighbor not in parents:
+                    parents[neighbor] = node_id
+                    queue.append(neighbor)
+        for target in seed_ids[i + 1:]:
+            if target not in parents:
+                continue
+            path = [target]
+            while parents[path[-1]] is not None:
+                path.append(parents[path[-1]])
+            paths.append([snapshot.node_names[node_id] for node_id in reversed(path)])
+    return paths
+
+
+def format_context(subgraph: Dict) -> str:
+    """
+    将上下文子图格式化为可直接放入prompt的文本
+    """
+    lines = ["实体："]
+    lines.extend(f"- {node['entity']}（{node['type']}）" for node in subgraph['nodes'])
+    if subgraph['edges']:
+        lines.append("关系：")
+        lines.extend(f"- {head} -[{relation}]-> {tail}" for head, relation, tail in subgraph['edges'])
+    if subgraph['paths']:
+        lines.append("路径：")
+        lines.extend(f"- {' → '.join(path)}" for path in subgraph['paths'])
+    return '\n'.join(lines)
@@ -0,0 +1,179 @@
+"""
+知识图谱的二进制快照
+
+每个快照是一个目录，包含若干 .npy 数组文件和 manifest.json：
+    manifest.json          格式版本、图版本、节点/边数量以及每个文件的大小和sha256
+    node_names.*.npy       节点名称表(UTF-8字节、偏移、排序后的名称哈希及对应ID)
+    node_types.npy         节点类型ID
+    type_names.*.npy       类型名称表
+    aliases.*.npy          每个节点的别名
+    relation_names.*.npy   关系名称表
+    edge_*.npy             按 (较小节点ID, 较大节点ID) 排序的边及其关系、权重、方向
+    embedding_names.*.npy  节点embedding的名称表
+    embeddings.npy         节点embedding矩阵
+快照先写入临时目录再整体重命名，加载时以内存映射方式打开数组
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from typing import Dict, Optional
+import numpy as np
+from config import Config
+from graph_arrays import AliasTable, GraphArrays, NameTable
+from knowledge_graph import KnowledgeGraph
+
+SNAPSHOT_FORMAT_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+SNAPSHOT_PREFIX = 'graph-'
+
+logger = logging.getLogger(__name__)
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _flatten(arrays: GraphArrays) -> Dict[str, np.ndarray]:
+    node_count = len(arrays.node_names)
+    files = {
+        'node_types': arrays.node_types,
+        'edge_keys': arrays.edge_keys,
+        'edge_relations': arrays.edge_relations,
+        'edge_weights': arrays.edge_weights,
+        'edge_forward': arrays.edge_forward,
+        'embeddings': arrays.embeddings
+    }
+    for prefix, table in [('node_names', arrays.node_names), ('type_names', arrays.type_names),
+                          ('relation_names', arrays.relation_names), ('embedding_names', arrays.embedding_names)]:
+        files.update({f"{prefix}.{key}": array for key, array in table.to_arrays().items()})
+    files.update({f"aliases.{key}": array for key, array in arrays.aliases.to_arrays(node_count).items()})
+    return files
+
+
+def save_graph_snapshot(graph: KnowledgeGraph, directory: str = None) -> str:
+    """
+    将图保存为新快照并清理多余的旧快照，返回快照目录
+    """
+    directory = directory or Config.GRAPH_SNAPSHOT_DIR
+    arrays = graph.export_arrays()
+    name = f"{SNAPSHOT_PREFIX}{int(time.time() * 1000):013d}-v{arrays.version}"
+    temp_path = os.path.join(directory, f".{name}.tmp")
+    os.makedirs(temp_path)
+
+    try:
+        files = {}
+        for key, array in _flatten(arrays).items():
+            filename = f"{key}.npy"
+            path = os.path.join(temp_path, filename)
+            np.save(path, np.ascontiguousarray(array))
+            files[filename] = {
+                'bytes': os.path.getsize(path),
+                'sha256': _sha256(path),
+                'shape': list(array.shape),
+                'dtype': str(array.dtype)
+            }
+        manifest = {
+            'format_version': SNAPSHOT_FORMAT_VERSION,
+            'graph_version': arrays.version,
+            'created_at': time.time(),
+            'nodes': len(arrays.node_names),
+            'edges': len(arrays.edge_keys),
+            'files': files
+        }
+        with open(os.path.join(temp_path, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        path = os.path.join(directory, name)
+        os.replace(temp_path, path)
+    except BaseException:
+        shutil.rmtree(temp_path, ignore_errors=True)
+        raise
+
+    _prune_snapshots(directory)
+    return path
+
+
+def list_snapshots(directory: str = None):
+    """
+    按时间从旧到新返回已完成的快照目录
+    """
+    directory = directory or Config.GRAPH_SNAPSHOT_DIR
+    if not os.path.isdir(directory):
+        return []
+    names = sorted(name for name in os.listdir(directory)
+                   if name.startswith(SNAPSHOT_PREFIX) and os.path.isfile(os.path.join(directory, name, MANIFEST_NAME)))
+    return [os.path.join(directory, name) for name in names]
+
+
+def _prune_snapshots(directory: str):
+    for path in list_snapshots(directory)[:-max(Config.GRAPH_SNAPSHOT_KEEP, 1)]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def load_graph_snapshot(path: str, graph_type: str = None, verify: bool = None, mmap: bool = True) -> KnowledgeGraph:
+    """
+    从快照目录加载图
+    Args:
+        graph_type: 加载为哪种图存储，默认为GRAPH_TYPE；compact直接引用内存映射数组，networkx需要逐条重建
+        verify: 是否校验每个文件的sha256，默认为GRAPH_SNAPSHOT_VERIFY；文件大小总是会校验
+        mmap: 是否以内存映射(写时复制)方式打开数组
+    """
+    graph_type = graph_type or Config.GRAPH_TYPE
+    verify = Config.GRAPH_SNAPSHOT_VERIFY if verify is None else verify
+    with open(os.path.join(path, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('format_version') != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(f"不支持的快照格式版本: {manifest.get('format_version')}")
+
+    files = {}
+    for filename, meta in manifest['files'].items():
+        file_path = os.path.join(path, filename)
+        if os.path.getsize(file_path) != meta['bytes']:
+            raise ValueError(f"快照文件大小不一致: {file_path}")
+        if verify and _sha256(file_path) != meta['sha256']:
+            raise ValueError(f"快照文件校验失败: {file_path}")
+        # 空数组无法内存映射
+        mmap_mode = 'c' if mmap and np.prod(meta['shape']) > 0 else None
+        files[filename[:-len('.npy')]] = np.load(file_path, mmap_mode=mmap_mode)
+
+    def table(prefix: str) -> Dict[str, np.ndarray]:
+        return {key.split('.', 1)[1]: array for key, array in files.items() if key.startswith(f"{prefix}.")}
+
+    arrays = GraphArrays(
+        version=manifest['graph_version'],
+        node_names=NameTable.from_arrays(table('node_names')),
+        node_types=files['node_types'],
+        type_names=NameTable.from_arrays(table('type_names')),
+        aliases=AliasTable.from_arrays(table('aliases')),
+        relation_names=NameTable.from_arrays(table('relation_names')),
+        edge_keys=files['edge_keys'],
+        edge_relations=files['edge_relations'],
+        edge_weights=files['edge_weights'],
+        edge_forward=files['edge_forward'],
+        embedding_names=NameTable.from_arrays(table('embedding_names')),
+        embeddings=files['embeddings']
+    )
+    if graph_type == 'compact':
+        from compact_graph import CompactKnowledgeGraph
+        return CompactKnowledgeGraph.from_arrays(arrays)
+    if graph_type == 'networkx':
+        return KnowledgeGraph.from_arrays(arrays)
+    raise ValueError(f"未知的图类型: {graph_type}")
+
+
+def load_latest_graph_snapshot(directory: str = None, graph_type: str = None) -> Optional[KnowledgeGraph]:
+    """
+    加载最新的可用快照，损坏的快照被跳过，没有可用快照时返回None
+    """
+    for path in reversed(list_snapshots(directory)):
+        try:
+            return load_graph_snapshot(path, graph_type)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"跳过无法加载的图快照 {path}: {e}")
+    return None
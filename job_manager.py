@@ -0,0 +1,248 @@
+"""
+后台任务管理：每个任务有独立的ID、状态、进度和结果，在有界线程池中运行，
+排队的任务数有上限(超出时拒绝提交)，结束的任务保留JOB_RETENTION_SECONDS秒后清除
+"""
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+from config import Config
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_COMPLETED = 'completed'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+FINISHED_STATUSES = (JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED)
+
+
+class JobQueueFull(Exception):
+    """
+    排队的任务数达到上限
+    """
+
+
+class Job:
+    """
+    一个后台任务的状态，线程安全
+    任务函数通过update报告进度，通过should_stop检查是否被取消，通过on_cancel注册取消时的回调
+    """
+    def __init__(self, job_id: str, kind: str, params: Dict):
+        self.id = job_id
+        self.kind = kind
+        self.params = params
+        self.lock = threading.Lock()
+        self.status = JOB_QUEUED
+        self.progress = 0.0
+        self.stage = None
+        self.chunks = None
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_requested = False
+        self.cancel_callbacks: List[Callable] = []
+        self.listener = None  # 状态变化时调用 listener(job)
+        self.cleanup = None  # 任务结束(包括排队中被取消)后调用 cleanup()
+
+    def update(self, **fields):
+        """
+        更新progress、stage、chunks等字段
+        """
+        with self.lock:
+            for name, value in fields.items():
+                setattr(self, name, value)
+        self._notify()
+
+    def _notify(self):
+        if self.listener is not None:
+            self.listener(self)
+
+    @property
+    def should_stop(self) -> bool:
+        with self.lock:
+            return self.cancel_requested
+
+    @property
+    def is_finished(self) -> bool:
+        with self.lock:
+            return self.status in FINISHED_STATUSES
+
+    def on_cancel(self, callback: Callable):
+        """
+        注册取消时的回调，已被取消时立即调用
+        """
+        with self.lock:
+            if not self.cancel_requested:
+                self.cancel_callbacks.append(callback)
+                return
+        callback()
+
+    def cancel(self):
+        with self.lock:
+            if self.cancel_requested or self.status in FINISHED_STATUSES:
+                return
+            self.cancel_requested = True
+            callbacks = list(self.cancel_callbacks)
+        for callback in callbacks:
+            callback()
+        self._notify()
+
+    def to_dict(self) -> Dict:
+        with self.lock:
+            return {
+                'job_id': self.id,
+                'kind': self.kind,
+                'params': self.params,
+                'status': self.status,
+                'progress': self.progress,
+                'stage': self.stage,
+                'chunks': self.chunks,
+                'result': self.result,
+                'error': self.error,
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at
+            }
+
+
+class JobManager:
+    """
+    在有界线程池中运行后台任务，线程安全
+    """
+    def __init__(self, max_workers: int = None, max_queued: int = None, retention: float = None,
+                 listener: Callable = None, on_remove: Callable = None):
+        """
+        Args:
+            listener: 任务状态变化时调用 listener(job)
+            on_remove: 结束的任务超过保留时间被清除时调用 on_remove(job)
+        """
+        self.max_queued = Config.JOB_MAX_QUEUED if max_queued is None else max_queued
+        self.retention = Config.JOB_RETENTION_SECONDS if retention is None else retention
+        self.listener = listener
+        self.on_remove = on_remove
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or Config.JOB_MAX_WORKERS)
+        self.lock = threading.Lock()
+        self.jobs: OrderedDict = OrderedDict()  # 任务ID -> Job，按提交顺序
+        self.futures: Dict[str, Future] = {}
+
+    def submit(self, kind: str, func: Callable, params: Dict = None, cleanup: Callable = None) -> Job:
+        """
+        提交任务，func(job)的返回值作为任务结果
+        Args:
+            cleanup: 任务结束后调用，用于释放任务占用的文件等资源
+        Raises:
+            JobQueueFull: 排队的任务数达到上限
+        """
+        with self.lock:
+            self._cleanup_locked()
+            queued = sum(job.status == JOB_QUEUED for job in self.jobs.values())
+            if queued >= self.max_queued:
+                raise JobQueueFull(f"排队的任务数已达上限 {self.max_queued}")
+            job = Job(uuid.uuid4().hex, kind, params or {})
+            job.listener = self.listener
+            job.cleanup = cleanup
+            self.jobs[job.id] = job
+            self.futures[job.id] = self.executor.submit(self._run, job, func)
+        job._notify()
+        return job
+
+    def _run(self, job: Job, func: Callable):
+        with job.lock:
+            # 排队期间已被取消(取消与开始运行同时发生时)
+            cancelled = job.cancel_requested
+            if cancelled:
+                job.status = JOB_CANCELLED
+                job.finished_at = time.time()
+            else:
+                job.status = JOB_RUNNING
+                job.started_at = time.time()
+        if cancelled:
+            self._finish(job)
+            return
+        job._notify()
+        try:
+            result = func(job)
+            with job.lock:
+                job.result = result
+                job.status = JOB_CANCELLED if job.cancel_requested else JOB_COMPLETED
+        except Exception as e:
+            logging.exception(f"任务 {job.id} 失败")
+            with job.lock:
+                job.error = str(e)
+                job.status = JOB_FAILED
+        finally:
+            with job.lock:
+                job.finished_at = time.time()
+            self._finish(job)
+
+    def _finish(self, job: Job):
+        with self.lock:
+            self.futures.pop(job.id, None)
+        if job.cleanup is not None:
+            try:
+                job.cleanup()
+            except Exception:
+                logging.exception(f"任务 {job.id} 清理失败")
+        job._notify()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self.lock:
+            self._cleanup_locked()
+            return self.jobs.get(job_id)
+
+    def list(self, status: str = None) -> List[Job]:
+        """
+        按提交顺序返回任务，可按状态过滤
+        """
+        with self.lock:
+            self._cleanup_locked()
+            jobs = list(self.jobs.values())
+        return [job for job in jobs if status is None or job.status == status]
+
+    def active(self) -> List[Job]:
+        """
+        返回排队和运行中的任务
+        """
+        return [job for job in self.list() if not job.is_finished]
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """
+        取消任务：排队中的任务直接取消，运行中的任务通知其停止，任务不存在时返回None
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+            future = self.futures.get(job_id)
+        if job is None:
+            return None
+        if future is not None and future.cancel():
+            with job.lock:
+                job.cancel_requested = True
+                job.status = JOB_CANCELLED
+                job.finished_at = time.time()
+            self._finish(job)
+            return job
+        job.cancel()
+        return job
+
+    def _cleanup_locked(self):
+        # 清除超过保留时间的已结束任务
+        expired = time.time() - self.retention
+        for job_id, job in list(self.jobs.items()):
+            with job.lock:
+                finished_at = job.finished_at if job.status in FINISHED_STATUSES else None
+            if finished_at is not None and finished_at < expired:
+                del self.jobs[job_id]
+                if self.on_remove is not None:
+                    self.on_remove(job)
+
+    def stats(self) -> Dict:
+        jobs = self.list()
+        counts = {}
+        for job in jobs:
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {'total': len(jobs), 'by_status': counts, 'max_queued': self.max_queued}
@@ -1,6 +1,14 @@
 import networkx as nx
-from typing import List, Dict, Tuple
+import numpy as np
+from typing import List, Dict, Optional, Tuple
 import threading
+from config import Config
+from ann_index import IVFIndex
+from embedding_store import EmbeddingStore
+from csr_snapshot import CSRSnapshot
+from community import CommunityHierarchy, detect_communities, update_communities
+from progress import ProgressThrottle
+from graph_arrays import AliasTable, GraphArrays, NameTable
 
 class KnowledgeGraph:
     def __init__(self):
@@ -8,50 +16,309 @@ class KnowledgeGraph:
         self.should_stop = False
         self.progress = 0
         self.lock = threading.Lock()
+        # 图每次变更后递增，下游缓存据此判断是否需要刷新
+        self.version = 0
+        # 节点embedding，用于增量导入时的实体对齐和检索
+        self.embeddings = EmbeddingStore()
+        self.entity_index = None
+        self._csr_snapshot = None
+        self._communities = None
+        # 已有节点的别名发生变化时记录节点名称，供下游索引增量同步
+        self.alias_updates: List[str] = []
+        # 节点名称按加入顺序排列，node_changes按游标切片，耗时只与新增节点数成正比
+        self.node_order: List[str] = []
 
-    def add_entities(self, entities: List[Dict], progress_callback=None):
+    def add_entities(self, entities: List[Dict], progress_callback=None, embeddings: np.ndarray = None):
+        """
+        按批添加实体，已存在的节点原位合并别名
+        Args:
+            embeddings: 与entities逐行对齐的embedding矩阵，提供时一并存储
+        """
         with self.lock:
             if self.should_stop:
                 return not self.should_stop
-        total = len(entities)
-        
-        for i, entity in enumerate(entities):
-            if self.should_stop:
-                break
-                
-            self.graph.add_node(entity['entity'], type=entity['type'])
-            
-            if progress_callback:
-                self.progress = (i + 1) / total * 100
-                progress_callback(self.progress)
-        
+
+        try:
+            completed = self._insert_in_batches(entities, self._insert_entity_batch, progress_callback)
+            if embeddings is not None and completed:
+                self.set_node_embeddings([entity['entity'] for entity in entities], embeddings)
+        finally:
+            self._bump_version()
+
         return not self.should_stop
 
     def add_relations(self, relations: List[Tuple], progress_callback=None):
+        """
+        按批添加关系，端点不存在时自动创建节点
+        """
         with self.lock:
             if self.should_stop:
                 return not self.should_stop
-        total = len(relations)
-        
-        for i, relation in enumerate(relations):
+
+        try:
+            self._insert_in_batches(relations, self._insert_relation_batch, progress_callback)
+        finally:
+            self._bump_version()
+
+        return not self.should_stop
+
+    def _insert_in_batches(self, items: List, insert_batch, progress_callback=None) -> bool:
+        """
+        按GRAPH_BATCH_SIZE分批持锁写入，每批检查一次停止标记，进度经节流后上报
+        """
+        throttle = ProgressThrottle(progress_callback)
+        total = len(items)
+        batch_size = Config.GRAPH_BATCH_SIZE
+        for start in range(0, total, batch_size):
             if self.should_stop:
                 break
-                
-            self.graph.add_edge(relation[0], relation[2], relation=relation[1])
-            
-            if progress_callback:
-                self.progress = (i + 1) / total * 100
-                progress_callback(self.progress)
-        
+            with self.lock:
+                insert_batch(items[start:start + batch_size])
+            self.progress = min(start + batch_size, total) / total * 100
+            throttle.update(self.progress)
         return not self.should_stop
 
+    def _insert_entity_batch(self, entities: List[Dict]):
+        # 已有节点原位合并别名并保留已有类型，新节点(含批内重复的)汇总后一次性写入
+        new_nodes = {}
+        for entity in entities:
+            name = entity['entity']
+            aliases = entity.get('aliases') or []
+            attrs = new_nodes.get(name)
+            if attrs is None:
+                if name not in self.graph:
+                    new_nodes[name] = attrs = {'type': entity['type'], 'aliases': []}
+                else:
+                    attrs = self.graph.nodes[name]
+                    attrs.setdefault('type', entity['type'])
+                    if aliases:
+                        self.alias_updates.append(name)
+            if aliases:
+                merged = dict.fromkeys(attrs.get('aliases', []) + aliases)
+                attrs['aliases'] = [alias for alias in merged if alias != name]
+        self.graph.add_nodes_from(new_nodes.items())
+        self.node_order.extend(new_nodes)
+
+    def _insert_relation_batch(self, relations: List[Tuple]):
+        # 重复出现的边累加权重作为边的置信度，关系名称和方向取最后一次出现的值
+        # 已有边原位更新属性，新边(含批内重复的)汇总后一次性写入
+        new_edges = {}
+        for head, relation, tail in relations:
+            key = (head, tail) if head <= tail else (tail, head)
+            edge = new_edges.get(key)
+            # get_edge_data返回边的属性字典本身，可直接原位修改
+            attrs = edge[2] if edge is not None else self.graph.get_edge_data(head, tail)
+            if attrs is None:
+                new_edges[key] = (head, tail, {'relation': relation, 'weight': 1, 'head': head})
+                continue
+            attrs['relation'] = relation
+            attrs['weight'] = attrs.get('weight', 1) + 1
+            attrs['head'] = head
+        # 关系的端点不存在时由add_edges_from创建，按创建顺序记录
+        self.node_order.extend(name for name in dict.fromkeys(
+            endpoint for head, tail, _ in new_edges.values() for endpoint in (head, tail)
+        ) if name not in self.graph)
+        self.graph.add_edges_from(new_edges.values())
+
+    def node_items(self) -> List[Tuple[str, Dict]]:
+        """
+        返回所有节点及其属性
+        """
+        with self.lock:
+            return list(self.graph.nodes(data=True))
+
+    def node_changes(self, cursor: Tuple[int, int] = None) -> Tuple[List[Tuple[str, Dict]], Tuple[int, int]]:
+        """
+        返回cursor之后新增的节点和别名有变化的已有节点及其属性，以及新的cursor
+        cursor为None时返回全部节点
+        """
+        with self.lock:
+            node_start, log_start = cursor or (0, len(self.alias_updates))
+            names = dict.fromkeys(self._node_names_from(node_start))
+            names.update(dict.fromkeys(self.alias_updates[log_start:]))
+            items = [(name, self._node_attrs_locked(name)) for name in names]
+            return items, (self._node_count_locked(), len(self.alias_updates))
+
+    def _node_names_from(self, start: int) -> List[str]:
+        return self.node_order[start:]
+
+    def _node_count_locked(self) -> int:
+        return self.graph.number_of_nodes()
+
+    def _node_attrs_locked(self, name: str) -> Optional[Dict]:
+        if not self.graph.has_node(name):
+            return None
+        return dict(self.graph.nodes[name])
+
+    def get_node(self, name: str) -> Optional[Dict]:
+        """
+        返回节点属性，节点不存在时返回None
+        """
+        with self.lock:
+            return self._node_attrs_locked(name)
+
+    def number_of_nodes(self) -> int:
+        with self.lock:
+            return self.graph.number_of_nodes()
+
+    def number_of_edges(self) -> int:
+        with self.lock:
+            return self.graph.number_of_edges()
+
+    def csr_snapshot(self) -> CSRSnapshot:
+        """
+        获取当前版本的CSR邻接快照，图未变更时复用缓存
+        """
+        with self.lock:
+            if self._csr_snapshot is None or self._csr_snapshot.version != self.version:
+                self._csr_snapshot = self._build_csr_snapshot()
+            return self._csr_snapshot
+
+    def _build_csr_snapshot(self) -> CSRSnapshot:
+        return CSRSnapshot.from_networkx(self.graph, self.version)
+
+    def communities(self) -> CommunityHierarchy:
+        """
+        获取当前版本的层次社区划分，图未变更时复用缓存
+        社区检测在CSR快照上进行，不持有图的锁
+        """
+        snapshot = self.csr_snapshot()
+        with self.lock:
+            previous = self._communities
+            if previous is not None and previous.version == snapshot.version:
+                return previous
+        # 已有上一版本的划分时增量更新，未受影响的社区保持不变
+        hierarchy = detect_communities(snapshot) if previous is None else update_communities(previous, snapshot)
+        with self.lock:
+            if self._communities is None or self._communities.version < hierarchy.version:
+                self._communities = hierarchy
+        return hierarchy
+
+    def set_node_embeddings(self, names: List[str], embeddings: np.ndarray):
+        """
+        存储节点embedding，已建立的实体索引同步追加新行
+        """
+        with self.lock:
+            count = len(self.embeddings)
+            self.embeddings.add(names, embeddings)
+            if self.entity_index is not None:
+                self.entity_index.add(self.embeddings.matrix[count:])
+
+    def get_entity_index(self):
+        """
+        获取节点embedding上的IVF索引，节点数未达到DEDUP_ANN_MIN_ITEMS时返回None
+        """
+        with self.lock:
+            if self.entity_index is None and len(self.embeddings) >= Config.DEDUP_ANN_MIN_ITEMS:
+                self.entity_index = IVFIndex().fit(self.embeddings.matrix)
+            return self.entity_index
+
+    def _bump_version(self):
+        with self.lock:
+            self.version += 1
+
     def stop_analysis(self):
         with self.lock:
             self.should_stop = True
 
+    def clear_stop(self):
+        """
+        清除停止标记，使已停止的图可以继续增量导入
+        """
+        with self.lock:
+            self.should_stop = False
+
     def get_progress(self):
         with self.lock:
             return self.progress
 
+    def export_arrays(self) -> GraphArrays:
+        """
+        导出图的数组表示，用于保存快照
+        """
+        with self.lock:
+            node_names = NameTable.from_names(self.graph.nodes)
+            type_names = NameTable()
+            aliases = AliasTable()
+            node_types = np.full(len(node_names), -1, dtype=np.int32)
+            for node_id, (name, attrs) in enumerate(self.graph.nodes(data=True)):
+                if attrs.get('type') is not None:
+                    node_types[node_id] = type_names.intern(attrs['type'])
+                if attrs.get('aliases'):
+                    aliases[node_id] = list(attrs['aliases'])
+
+            relation_names = NameTable()
+            edges = []
+            for u, v, attrs in self.graph.edges(data=True):
+                u_id, v_id = node_names.get(u), node_names.get(v)
+                low, high = min(u_id, v_id), max(u_id, v_id)
+                head = node_names.get(attrs.get('head', u))
+                edges.append(((low << 32) | high, relation_names.intern(attrs.get('relation', '')),
+                              attrs.get('weight', 1), head == low))
+            edges.sort()
+            embedding_names = NameTable.from_arrays(self.embeddings.names.to_arrays())
+            embeddings = self.embeddings.matrix.copy()
+            version = self.version
+
+        return GraphArrays(
+            version=version,
+            node_names=node_names,
+            node_types=node_types,
+            type_names=type_names,
+            aliases=aliases,
+            relation_names=relation_names,
+            edge_keys=np.array([edge[0] for edge in edges], dtype=np.int64),
+            edge_relations=np.array([edge[1] for edge in edges], dtype=np.int32),
+            edge_weights=np.array([edge[2] for edge in edges], dtype=np.int32),
+            edge_forward=np.array([edge[3] for edge in edges], dtype=bool),
+            embedding_names=embedding_names,
+            embeddings=embeddings
+        )
+
+    @classmethod
+    def from_arrays(cls, arrays: GraphArrays) -> 'KnowledgeGraph':
+        """
+        由数组表示重建networkx图，耗时与图的规模成正比
+        """
+        graph = cls()
+        graph.version = arrays.version
+        names = list(arrays.node_names)
+        type_names = list(arrays.type_names)
+        relation_names = list(arrays.relation_names)
+        nodes = []
+        for node_id, (name, type_id) in enumerate(zip(names, arrays.node_types.tolist())):
+            # 仅由关系创建的节点没有类型属性，保持与直接写入时一致
+            attrs = {'type': type_names[type_id]} if type_id >= 0 else {}
+            aliases = arrays.aliases.get(node_id)
+            if type_id >= 0 or aliases:
+                attrs['aliases'] = aliases or []
+            nodes.append((name, attrs))
+        graph.graph.add_nodes_from(nodes)
+        graph.node_order = names
+        lows = (arrays.edge_keys >> 32).tolist()
+        highs = (arrays.edge_keys & 0xFFFFFFFF).tolist()
+        graph.graph.add_edges_from(
+            (names[low], names[high], {'relation': relation_names[relation], 'weight': weight,
+                                       'head': names[low if forward else high]})
+            for low, high, relation, weight, forward in zip(lows, highs, arrays.edge_relations.tolist(),
+                                                            arrays.edge_weights.tolist(),
+                                                            arrays.edge_forward.tolist())
+        )
+        graph.embeddings = EmbeddingStore.from_arrays(arrays.embedding_names, arrays.embeddings)
+        return graph
+
     def to_dict(self):
-        return nx.node_link_data(self.graph)
\ No newline at end of file
+        return nx.node_link_data(self.graph, edges="links")
+
+
+def create_knowledge_graph(graph_type: str = None) -> KnowledgeGraph:
+    """
+    按GRAPH_TYPE创建知识图谱，compact为基于NumPy数组的紧凑存储
+    """
+    graph_type = graph_type or Config.GRAPH_TYPE
+    if graph_type == 'networkx':
+        return KnowledgeGraph()
+    if graph_type == 'compact':
+        from compact_graph import CompactKnowledgeGraph
+        return CompactKnowledgeGraph()
+    raise ValueError(f"未知的图类型: {graph_type}")
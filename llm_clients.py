@@ -0,0 +1,99 @@
+import ast
+import json
+import threading
+import openai
+from config import Config
+from rate_limiter import call_with_retry, get_chat_rate_limiter
+from token_utils import estimate_tokens
+
+_shared_clients = {}
+_shared_clients_lock = threading.Lock()
+
+
+def create_chat_client(max_retries: int = 2):
+    """
+    按LLM_BACKEND创建Chat模型客户端，fake为本地确定性替身
+    """
+    if Config.LLM_BACKEND == 'fake':
+        from fake_llm import FakeOpenAI
+        return FakeOpenAI()
+    return openai.OpenAI(
+        api_key=Config.OPENAI_API_KEY,
+        base_url=Config.CHAT_MODEL_HOST,
+        max_retries=max_retries
+    )
+
+
+def create_embedding_client(max_retries: int = 2):
+    """
+    按LLM_BACKEND创建Embedding模型客户端，fake为本地确定性替身
+    """
+    if Config.LLM_BACKEND == 'fake':
+        from fake_llm import FakeOpenAI
+        return FakeOpenAI()
+    return openai.OpenAI(
+        api_key=Config.EMBEDDING_API_KEY,
+        base_url=Config.EMBEDDING_MODEL_HOST,
+        max_retries=max_retries
+    )
+
+
+def get_chat_client():
+    """
+    获取进程内共享的Chat客户端，社区摘要和全局查询等后台任务复用同一个连接池
+    客户端不自动重试，由chat_completion通过call_with_retry统一重试
+    """
+    key = ('chat', Config.LLM_BACKEND)
+    with _shared_clients_lock:
+        client = _shared_clients.get(key)
+        if client is None:
+            client = create_chat_client(max_retries=0)
+            _shared_clients[key] = client
+        return client
+
+
+def get_embedding_client():
+    """
+    获取进程内共享的Embedding客户端，多个请求复用同一个keep-alive连接池
+    客户端不自动重试，由调用方通过call_with_retry统一重试
+    """
+    key = ('embedding', Config.LLM_BACKEND)
+    with _shared_clients_lock:
+        client = _shared_clients.get(key)
+        if client is None:
+            client = create_embedding_client(max_retries=0)
+            _shared_clients[key] = client
+        return client
+
+
+def chat_completion(client, prompt: str, rate_limiter=None) -> str:
+    """
+    经过限流和重试调用Chat模型，返回回复内容
+    Args:
+        rate_limiter: 默认为进程内共享的Chat限流器
+    """
+    rate_limiter = rate_limiter or get_chat_rate_limiter()
+
+    def request():
+        rate_limiter.acquire(estimate_tokens(prompt))
+        response = client.chat.completions.create(
+            model=Config.OPENAI_MODEL,
+            messages=[{"role": "user", "content": prompt}]
+        )
+        return response.choices[0].message.content
+
+    return call_with_retry(request)
+
+
+def parse_json_response(content: str):
+    """
+    解析模型返回的JSON，兼容代码块包裹和Python字面量写法
+    """
+    content = content.strip()
+    if content.startswith('```'):
+        content = content.split('\n', 1)[1] if '\n' in content else ''
+        content = content.rsplit('```', 1)[0]
+    try:
+        return json.loads(content)
+    except json.JSONDecodeError:
+        return ast.literal_eval(content)
@@ -1,97 +1,115 @@
 import threading
-from typing import List, Dict, Tuple
-import openai
-import numpy as np
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Dict, Tuple, Iterable, Iterator, Optional, Union
 from config import Config
+from embedder import Embedder
+from llm_clients import chat_completion, create_chat_client, get_embedding_client, parse_json_response
+from rate_limiter import get_chat_concurrency_limiter, get_chat_rate_limiter
+from token_utils import estimate_tokens
+from chunker import Chunk, iter_chunks
+from dedup import normalize_rows, similarity_groups, best_matches
+from knowledge_graph import KnowledgeGraph
+from extraction_cache import ExtractionCache, get_extraction_cache
+from chunk_store import ChunkStore
+
+# prompt模板版本，修改对应prompt时递增，使抽取结果缓存失效
+ENTITY_PROMPT_VERSION = 1
+RELATION_PROMPT_VERSION = 1
+JOINT_PROMPT_VERSION = 1
+
+
+def _normalize_joint_result(result: Dict) -> Tuple[List[Dict], List[Tuple]]:
+    """
+    将合并抽取结果转换为与extract_entities/extract_relations一致的格式
+    """
+    if not isinstance(result, dict):
+        return [], []
+    entities = [entity for entity in result.get('entities', [])
+                if isinstance(entity, dict) and 'entity' in entity and 'type' in entity]
+    relations = [tuple(relation) for relation in result.get('relations', [])
+                 if isinstance(relation, (list, tuple)) and len(relation) == 3]
+    return entities, relations
 
 class Preprocessor:
-    def __init__(self):
-        self.openai_client = openai.OpenAI(
-            api_key=Config.OPENAI_API_KEY,
-            base_url=Config.CHAT_MODEL_HOST
-        )
-        self.openai_embedding_client = openai.OpenAI(
-            api_key=Config.EMBEDDING_API_KEY,
-            base_url=Config.EMBEDDING_MODEL_HOST
-        )
+    def __init__(self, bypass_cache: bool = False, chunk_store: ChunkStore = None, llm_owner: str = None):
+        """
+        Args:
+            bypass_cache: 为True时不读取抽取结果缓存，总是重新调用LLM（结果仍会写入缓存）
+            chunk_store: 提供时保存每个chunk的原文、偏移和抽取结果，供查询时引用原文
+            llm_owner: LLM并发名额的使用方(如任务ID)，同时运行的多个使用方公平分配并发
+        """
+        # 由call_with_retry统一重试
+        self.openai_client = create_chat_client(max_retries=0)
+        self.openai_embedding_client = get_embedding_client()
+        self.embedder = Embedder(self.openai_embedding_client)
+        self.rate_limiter = get_chat_rate_limiter()
+        self.concurrency_limiter = get_chat_concurrency_limiter()
+        self.llm_owner = llm_owner
+        self.extraction_cache = get_extraction_cache()
+        self.bypass_cache = bypass_cache
+        self.chunk_store = chunk_store
+        self.chunk_ids: List[int] = []  # 本次处理保存到chunk存储中的chunk ID
+        self.document = ''
+        self.chunk_callback = None
         self.should_stop = False
         self.lock = threading.Lock()
         self.progress = 0
         self.total_steps = 4  # 总处理步骤数
 
-    def process(self, text: str, file_data: bytes = None, progress_callback=None) -> Tuple[List[Dict], List[Tuple]]:
+    def process(self, text: Union[str, Iterable[str]], file_data: bytes = None, progress_callback=None,
+                graph: KnowledgeGraph = None, document: str = '',
+                chunk_callback=None, total_chars: Optional[int] = None) -> Tuple[List[Dict], List[Tuple]]:
         """
         完整的预处理流程，支持大文本和文件数据处理
         Args:
-            text: 直接传入的文本内容
+            text: 直接传入的文本内容，或按顺序产出文本片段的可迭代对象(流式读取的文档)
             file_data: 文件数据，如果提供则优先使用
             progress_callback: 进度回调函数
+            graph: 已有的知识图谱，提供时将新实体对齐到图中已有节点（增量导入）
+            document: 文档名称，随chunk一起保存
+            chunk_callback: 每处理完一批chunk时调用 chunk_callback(已完成chunk数, 已处理字符数, 总字符数)
+            total_chars: 流式输入的总字符数，用于计算进度；流式输入未提供时chunk处理阶段按总数未知报告进度
         """
+        self.document = document
+        self.chunk_callback = chunk_callback
         self.progress = 0
         if progress_callback:
             progress_callback(self.progress)
-        
-        def check_should_stop():
-            with self.lock:
-                return self.should_stop
 
         # 如果提供了文件数据，则解码为文本
         if file_data:
             text = file_data.decode('utf-8')
 
-        if check_should_stop():
+        if self._check_should_stop():
             return None
         
-        # 将大文本分割成chunk
-        chunks = self._split_text_into_chunks(text)
+        # 将大文本流式分割成chunk，处理可以在分割完成前开始
+        chunks = iter_chunks(text)
+        if total_chars is None and isinstance(text, str):
+            total_chars = len(text)
         self.progress = 1/self.total_steps
         if progress_callback:
             progress_callback(self.progress * 100)
 
-        if check_should_stop():
+        if self._check_should_stop():
             return None
         
         # 处理每个chunk
+        if Config.EXTRACTION_CONCURRENCY > 1:
+            chunk_results = self._process_chunks_concurrently(chunks, total_chars, progress_callback)
+        else:
+            chunk_results = self._process_chunks_sequentially(chunks, total_chars, progress_callback)
+        if chunk_results is None:
+            return None
+
+        # 按chunk顺序合并结果
         all_entities = []
         all_relations = []
-        chunk_count = len(chunks)
-        for i, chunk in enumerate(chunks):
-            # 提取实体
-            entities = self.extract_entities(chunk)
-            self.progress = (2 + i/chunk_count)/self.total_steps
-            if progress_callback:
-                progress_callback(self.progress * 100)
-            if check_should_stop():
-                return None
-
-            # 去重实体
-            entities = self.deduplicate_entities(entities)
-            self.progress = (2 + i/chunk_count)/self.total_steps
-            if progress_callback:
-                progress_callback(self.progress * 100)
-            if check_should_stop():
-                return None
-                        
-            # 提取关系
-            relations = self.extract_relations(chunk, entities)
-            self.progress = (2 + i/chunk_count)/self.total_steps
-            if progress_callback:
-                progress_callback(self.progress * 100)
-            if check_should_stop():
-                return None
-                          
-            # 去重关系
-            relations = self.deduplicate_relations(relations)
-            self.progress = (2 + i/chunk_count)/self.total_steps
-            if progress_callback:
-                progress_callback(self.progress * 100)
-            if check_should_stop():
-                return None
-                         
+        for entities, relations in chunk_results:
             all_entities.extend(entities)
             all_relations.extend(relations)
         
-        if check_should_stop():
+        if self._check_should_stop():
             return None   
 
         # 最终去重
@@ -99,141 +117,322 @@ class Preprocessor:
         self.progress = 3/self.total_steps
         if progress_callback:
             progress_callback(self.progress * 100)
-        if check_should_stop():
+        if self._check_should_stop():
             return None  
                 
+        # 增量导入时与已有节点对齐
+        if graph is not None:
+            all_entities, all_relations = self.resolve_entities(all_entities, all_relations, graph)
+            if self._check_should_stop():
+                return None
+
         all_relations = self.deduplicate_relations(all_relations)
         self.progress = 4/self.total_steps
         if progress_callback:
             progress_callback(self.progress * 100)
-        if check_should_stop():
+        if self._check_should_stop():
             return None       
          
         return all_entities, all_relations
 
-    def _split_text_into_chunks(self, text: str, max_chunk_size: int = 2000) -> List[str]:
-        """
-        将大文本分割成适当大小的chunk，支持多语言环境
-        """
-        # 多语言句子分隔符
-        sentence_delimiters = [
-            '.', '。', '．',  # 句号
-            '?', '？',       # 问号
-            '!', '！',       # 感叹号
-            ';', '；',       # 分号
-            '\n', '\r\n',    # 换行符
-            '…', '...',      # 省略号
-            '—', '―',        # 破折号
-            '·', '•',        # 项目符号
-            '、', '，',      # 逗号
-            '：', ':'        # 冒号
-        ]
-        
-        chunks = []
-        while len(text) > max_chunk_size:
-            # 找到最后一个句子分隔符的位置
-            split_pos = -1
-            for delimiter in sentence_delimiters:
-                pos = text.rfind(delimiter, 0, max_chunk_size)
-                if pos > split_pos:
-                    split_pos = pos
-            
-            # 如果没有找到合适的分隔符，则在最大长度处分割
-            if split_pos == -1:
-                split_pos = max_chunk_size
-                # 确保不会在多字节字符中间分割
-                while split_pos > 0 and not text[split_pos].isascii():
-                    split_pos -= 1
-            
-            # 添加chunk并移除已处理部分
-            chunks.append(text[:split_pos + 1].strip())
-            text = text[split_pos + 1:].strip()
-        
-        # 添加剩余文本
-        if text:
-            chunks.append(text.strip())
-        
-        return chunks
+    def _check_should_stop(self) -> bool:
+        with self.lock:
+            return self.should_stop
+
+    def _process_chunk(self, chunk: Chunk) -> Tuple[List[Dict], List[Tuple]]:
+        """
+        处理单个chunk：提取实体、去重实体、提取关系、去重关系
+        每一步之后检查是否停止，停止时返回None
+        """
+        # 提取实体
+        entities = self.extract_entities(chunk.text)
+        if self._check_should_stop():
+            return None
+
+        # 去重实体
+        entities = self.deduplicate_entities(entities)
+        if self._check_should_stop():
+            return None
+
+        # 提取关系
+        relations = self.extract_relations(chunk.text, entities)
+        if self._check_should_stop():
+            return None
+
+        # 去重关系
+        relations = self.deduplicate_relations(relations)
+        if self._check_should_stop():
+            return None
+
+        return entities, relations
+
+    def _iter_units(self, chunks: Iterable[Chunk]) -> Iterator[List[Chunk]]:
+        """
+        将chunk组合为处理单元：合并抽取模式下按EXTRACTION_PACK_MAX_TOKENS把相邻的小chunk打包，
+        其余情况每个chunk单独成为一个单元
+        """
+        budget = Config.EXTRACTION_PACK_MAX_TOKENS if Config.EXTRACTION_MODE == 'joint' else 0
+        unit = []
+        unit_tokens = 0
+        for chunk in chunks:
+            tokens = estimate_tokens(chunk.text)
+            if unit and unit_tokens + tokens > budget:
+                yield unit
+                unit = []
+                unit_tokens = 0
+            unit.append(chunk)
+            unit_tokens += tokens
+        if unit:
+            yield unit
+
+    def _process_unit(self, unit: List[Chunk]) -> List[Tuple[List[Dict], List[Tuple]]]:
+        """
+        处理一个单元内的所有chunk，返回与unit逐项对齐的结果，停止时返回None
+        """
+        if Config.EXTRACTION_MODE != 'joint':
+            results = []
+            for chunk in unit:
+                result = self._process_chunk(chunk)
+                if result is None:
+                    return None
+                results.append(result)
+            self._store_chunks(unit, results)
+            return results
+
+        # 合并抽取：一次调用同时返回实体和关系
+        extracted = self.extract_joint_batch([chunk.text for chunk in unit])
+        results = []
+        for entities, relations in extracted:
+            if self._check_should_stop():
+                return None
+            results.append((self.deduplicate_entities(entities), self.deduplicate_relations(relations)))
+        if self._check_should_stop():
+            return None
+        self._store_chunks(unit, results)
+        return results
+
+    def _store_chunks(self, unit: List[Chunk], results: List[Tuple[List[Dict], List[Tuple]]]):
+        """
+        保存chunk原文及其抽取结果，启用时同时保存chunk的embedding
+        """
+        if self.chunk_store is None:
+            return
+        embeddings = self.embedder.embed([chunk.text for chunk in unit]) if Config.CHUNK_EMBEDDING_ENABLED else None
+        chunk_ids = self.chunk_store.add_chunks(self.document, unit, results, embeddings)
+        with self.lock:
+            self.chunk_ids.extend(chunk_ids)
+
+    def _report_chunk_progress(self, done_chunks: int, done_chars: int, total_chars: Optional[int], progress_callback=None):
+        """
+        按已处理的字符数报告chunk处理阶段的进度，总字符数未知(None)时该阶段的进度不推进
+        """
+        fraction = min(1, done_chars / max(total_chars, 1)) if total_chars is not None else 0
+        self.progress = (2 + fraction)/self.total_steps
+        if progress_callback:
+            progress_callback(self.progress * 100)
+        if self.chunk_callback:
+            self.chunk_callback(done_chunks, done_chars, total_chars)
+
+    def _process_chunks_sequentially(self, chunks: Iterable[Chunk], total_chars: Optional[int],
+                                     progress_callback=None) -> List[Tuple[List[Dict], List[Tuple]]]:
+        """
+        逐个处理chunk
+        """
+        results = []
+        done_chars = 0
+        for unit in self._iter_units(chunks):
+            unit_results = self._process_unit(unit)
+            if unit_results is None:
+                return None
+            results.extend(unit_results)
+            done_chars += sum(chunk.end - chunk.start for chunk in unit)
+            self._report_chunk_progress(len(results), done_chars, total_chars, progress_callback)
+        return results
+
+    def _process_chunks_concurrently(self, chunks: Iterable[Chunk], total_chars: Optional[int],
+                                     progress_callback=None) -> List[Tuple[List[Dict], List[Tuple]]]:
+        """
+        使用有界线程池并发处理chunk，边分割边提交，在途chunk数有上限，结果按chunk顺序返回
+        """
+        results = {}
+        pending = {}
+        done_chunks = 0
+        done_chars = 0
+        max_pending = Config.EXTRACTION_CONCURRENCY * 2
+        unit_iter = enumerate(self._iter_units(chunks))
+        exhausted = False
+        executor = ThreadPoolExecutor(max_workers=Config.EXTRACTION_CONCURRENCY)
+        try:
+            while True:
+                while not exhausted and len(pending) < max_pending:
+                    item = next(unit_iter, None)
+                    if item is None:
+                        exhausted = True
+                    else:
+                        pending[executor.submit(self._process_unit, item[1])] = item
+                if not pending:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, unit = pending.pop(future)
+                    unit_results = future.result()
+                    if unit_results is None or self._check_should_stop():
+                        return None
+                    results[index] = unit_results
+                    done_chunks += len(unit)
+                    done_chars += sum(chunk.end - chunk.start for chunk in unit)
+                    self._report_chunk_progress(done_chunks, done_chars, total_chars, progress_callback)
+        finally:
+            # 停止或出错时取消尚未开始的chunk
+            executor.shutdown(wait=False, cancel_futures=True)
+        return [result for i in range(len(results)) for result in results[i]]
 
     def extract_entities(self, text: str) -> List[Dict]:
         """
         使用OpenAI提取实体
         """
+        cache_key = ExtractionCache.make_key('entities', Config.OPENAI_MODEL, ENTITY_PROMPT_VERSION, text)
+        cached = self._get_cached_extraction(cache_key)
+        if cached is not None:
+            return cached
+
         prompt = f"""
         请从以下文本中提取实体，不返回任何提示文本和解释文本：
         {text}
         返回格式：[{{"entity": "实体名称", "type": "实体类型"}}]
         """
-        response = self.openai_client.chat.completions.create(
-            model=Config.OPENAI_MODEL,
-            messages=[{"role": "user", "content": prompt}]
-        )
-        return eval(response.choices[0].message.content)
+        entities = eval(self._chat(prompt))
+        self._put_cached_extraction(cache_key, entities)
+        return entities
     
     def extract_relations(self, text: str, entities: List[Dict]) -> List[Tuple]:
         """
         使用OpenAI提取实体关系
         """
+        cache_key = ExtractionCache.make_key('relations', Config.OPENAI_MODEL, RELATION_PROMPT_VERSION,
+                                             text, entities)
+        cached = self._get_cached_extraction(cache_key)
+        if cached is not None:
+            return [tuple(relation) for relation in cached]
+
         prompt = f"""
         给定文本：{text}
         和实体列表：{entities}
         请提取实体之间的关系，不返回任何提示文本和解释文本
         返回格式：[("实体1","关系","实体2")]
         """
-        response = self.openai_client.chat.completions.create(
-            model=Config.OPENAI_MODEL,
-            messages=[{"role": "user", "content": prompt}]
-        )
-        return eval(response.choices[0].message.content)
+        relations = eval(self._chat(prompt))
+        self._put_cached_extraction(cache_key, relations)
+        return relations
     
+    def extract_joint(self, text: str) -> Tuple[List[Dict], List[Tuple]]:
+        """
+        使用OpenAI在一次调用中同时提取实体和关系
+        """
+        return self.extract_joint_batch([text])[0]
+
+    def extract_joint_batch(self, texts: List[str]) -> List[Tuple[List[Dict], List[Tuple]]]:
+        """
+        对多个文本做合并抽取，未命中缓存的文本打包进同一个prompt
+        Returns:
+            与texts逐项对齐的 (实体列表, 关系列表)
+        """
+        cache_keys = [ExtractionCache.make_key('joint', Config.OPENAI_MODEL, JOINT_PROMPT_VERSION, text)
+                      for text in texts]
+        results = [self._get_cached_extraction(key) for key in cache_keys]
+        missing = [i for i, result in enumerate(results) if result is None]
+
+        if len(missing) == 1:
+            results[missing[0]] = self._extract_joint_single(texts[missing[0]])
+        elif missing:
+            packed = self._extract_joint_packed([texts[i] for i in missing])
+            for i, result in zip(missing, packed):
+                # 打包结果中缺失的片段单独重新抽取
+                results[i] = result if result is not None else self._extract_joint_single(texts[i])
+
+        for i in missing:
+            self._put_cached_extraction(cache_keys[i], results[i])
+        return [_normalize_joint_result(result) for result in results]
+
+    def _extract_joint_single(self, text: str) -> Dict:
+        prompt = f"""
+        请从以下文本中提取实体以及实体之间的关系，不返回任何提示文本和解释文本：
+        {text}
+        返回JSON格式：{{"entities": [{{"entity": "实体名称", "type": "实体类型"}}], "relations": [["实体1", "关系", "实体2"]]}}
+        """
+        return parse_json_response(self._chat(prompt))
+
+    def _extract_joint_packed(self, texts: List[str]) -> List[Dict]:
+        """
+        将多个文本片段打包进一个prompt抽取，返回与texts逐项对齐的结果，缺失的片段为None
+        """
+        sections = '\n'.join(f"【片段{i + 1}】\n{text}" for i, text in enumerate(texts))
+        prompt = f"""
+        以下是多个编号的文本片段，请分别从每个片段中提取实体以及实体之间的关系，不返回任何提示文本和解释文本：
+        {sections}
+        返回JSON格式：[{{"chunk": 片段编号, "entities": [{{"entity": "实体名称", "type": "实体类型"}}], "relations": [["实体1", "关系", "实体2"]]}}]
+        """
+        results = [None] * len(texts)
+        try:
+            items = parse_json_response(self._chat(prompt))
+        except (ValueError, SyntaxError):
+            return results
+        for item in items if isinstance(items, list) else []:
+            index = item.get('chunk') if isinstance(item, dict) else None
+            if isinstance(index, int) and 1 <= index <= len(texts):
+                results[index - 1] = item
+        return results
+
+    def _get_cached_extraction(self, key: str):
+        if self.extraction_cache is None or self.bypass_cache:
+            return None
+        return self.extraction_cache.get(key)
+
+    def _put_cached_extraction(self, key: str, value):
+        if self.extraction_cache is not None:
+            self.extraction_cache.put(key, value)
+
+    def _chat(self, prompt: str) -> str:
+        """
+        经过限流和重试调用Chat模型，返回回复内容
+        """
+        with self.concurrency_limiter.slot(self.llm_owner):
+            return chat_completion(self.openai_client, prompt, self.rate_limiter)
+
     def deduplicate_entities(self, entities: List[Dict]) -> List[Dict]:
         """
         使用余弦相似度去重合并实体
         """
         if not entities:
             return []
-            
-        # 获取所有实体的embedding
-        embeddings = {}
+
+        # 同名实体先合并，保留第一次出现的类型
+        by_name = {}
         for entity in entities:
-            response = self.openai_client.embeddings.create(
-                input=entity['entity'],
-                model=Config.EMBEDDING_MODEL
-            )
-            embeddings[entity['entity']] = np.array(response.data[0].embedding)
-            
-        # 计算余弦相似度并合并相似实体
+            by_name.setdefault(entity['entity'], []).append(entity)
+        names = list(by_name)
+
+        # 批量获取所有实体的embedding并分块计算相似度
+        matrix = normalize_rows(self.embedder.embed(names))
+        groups = similarity_groups(matrix, Config.ENTITY_SIMILARITY_THRESHOLD)
+
+        # 合并相似实体，已有的别名一并保留
         unique_entities = []
-        processed = set()
-        
-        for i, entity in enumerate(entities):
-            if entity['entity'] in processed:
-                continue
-                
-            # 找到相似实体
-            similar_entities = [entity]
-            for j in range(i + 1, len(entities)):
-                if entities[j]['entity'] in processed:
-                    continue
-                    
-                # 计算余弦相似度
-                vec1 = embeddings[entity['entity']]
-                vec2 = embeddings[entities[j]['entity']]
-                similarity = np.dot(vec1, vec2) / (np.linalg.norm(vec1) * np.linalg.norm(vec2))
-                
-                if similarity > Config.ENTITY_SIMILARITY_THRESHOLD:
-                    similar_entities.append(entities[j])
-                    processed.add(entities[j]['entity'])
-                    
-            # 合并相似实体
-            merged_entity = {
-                'entity': entity['entity'],
-                'type': entity['type'],
-                'aliases': [e['entity'] for e in similar_entities[1:]]
-            }
-            unique_entities.append(merged_entity)
-            processed.add(entity['entity'])
-            
+        for group in groups:
+            name = names[group[0]]
+            aliases = []
+            for index in group:
+                for entity in by_name[names[index]]:
+                    if index != group[0]:
+                        aliases.append(entity['entity'])
+                    aliases.extend(entity.get('aliases', []))
+            unique_entities.append({
+                'entity': name,
+                'type': by_name[name][0]['type'],
+                'aliases': [alias for alias in dict.fromkeys(aliases) if alias != name]
+            })
+
         return unique_entities
 
     def deduplicate_relations(self, relations: List[Tuple]) -> List[Tuple]:
@@ -243,47 +442,62 @@ class Preprocessor:
         if not relations:
             return []
 
-        # 获取所有关系的embedding
-        embeddings = {}
+        # 完全相同的关系只保留第一次出现
+        unique_strs = {}
         for relation in relations:
-            relation_str = f"{relation[0]} {relation[1]} {relation[2]}"
-            response = self.openai_embedding_client.embeddings.create(
-                input=relation_str,
-                model=Config.EMBEDDING_MODEL
-            )
-            embeddings[relation_str] = np.array(response.data[0].embedding)
-
-        # 计算余弦相似度并合并相似关系
-        unique_relations = []
-        processed = set()
-
-        for i, relation in enumerate(relations):
-            relation_str = f"{relation[0]} {relation[1]} {relation[2]}"
-            if relation_str in processed:
-                continue
+            unique_strs.setdefault(f"{relation[0]} {relation[1]} {relation[2]}", relation)
+        relation_strs = list(unique_strs)
+
+        # 批量获取所有关系的embedding并分块计算相似度
+        matrix = normalize_rows(self.embedder.embed(relation_strs))
+        groups = similarity_groups(matrix, Config.RELATION_SIMILARITY_THRESHOLD)
+
+        # 选择每组第一个关系作为代表
+        return [unique_strs[relation_strs[group[0]]] for group in groups]
+
+    def embed_entities(self, entities: List[Dict]):
+        """
+        获取实体名称的embedding，与entities逐行对齐
+        """
+        return self.embedder.embed([entity['entity'] for entity in entities])
 
-            # 找到相似关系
-            similar_relations = [relation]
-            for j in range(i + 1, len(relations)):
-                other_relation_str = f"{relations[j][0]} {relations[j][1]} {relations[j][2]}"
-                if other_relation_str in processed:
-                    continue
+    def resolve_entities(self, entities: List[Dict], relations: List[Tuple],
+                         graph: KnowledgeGraph) -> Tuple[List[Dict], List[Tuple]]:
+        """
+        将实体对齐到图中已有节点：同名或embedding相似度超过阈值的实体改用已有节点名称，
+        原名称记为别名，关系中的实体名称同步替换
+        """
+        if not entities or len(graph.embeddings) == 0:
+            return entities, relations
 
-                # 计算余弦相似度
-                vec1 = embeddings[relation_str]
-                vec2 = embeddings[other_relation_str]
-                similarity = np.dot(vec1, vec2) / (np.linalg.norm(vec1) * np.linalg.norm(vec2))
+        index = graph.get_entity_index()
+        with graph.lock:
+            existing_names = list(graph.embeddings.names)
+            existing_matrix = graph.embeddings.matrix
+        matches = best_matches(normalize_rows(self.embed_entities(entities)), existing_matrix,
+                               Config.ENTITY_SIMILARITY_THRESHOLD, index)
 
-                if similarity > Config.RELATION_SIMILARITY_THRESHOLD:
-                    similar_relations.append(relations[j])
-                    processed.add(other_relation_str)
+        canonical = {}
+        resolved = []
+        for entity, match in zip(entities, matches):
+            name = entity['entity']
+            if name in graph.embeddings or match < 0:
+                resolved.append(entity)
+                continue
+            target = existing_names[match]
+            for alias in [name] + entity.get('aliases', []):
+                canonical[alias] = target
+            resolved.append({
+                'entity': target,
+                'type': entity['type'],
+                'aliases': [name] + entity.get('aliases', [])
+            })
 
-            # 选择第一个关系作为代表
-            unique_relations.append(similar_relations[0])
-            processed.add(relation_str)
+        resolved_relations = [(canonical.get(relation[0], relation[0]), relation[1],
+                               canonical.get(relation[2], relation[2]))
+                              for relation in relations]
+        return resolved, resolved_relations
 
-        return unique_relations
-    
     def stop_analysis(self):
         with self.lock:
             self.should_stop = True
\ No newline at end of file
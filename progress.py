@@ -0,0 +1,25 @@
+import time
+from config import Config
+
+
+class ProgressThrottle:
+    """
+    进度回调节流：距上次上报超过min_interval秒或进度增长不少于min_step时才调用回调，
+    首次和到达100时总是上报
+    """
+    def __init__(self, callback=None, min_interval: float = None, min_step: float = None):
+        self.callback = callback
+        self.min_interval = Config.PROGRESS_MIN_INTERVAL if min_interval is None else min_interval
+        self.min_step = Config.PROGRESS_MIN_STEP if min_step is None else min_step
+        self.last_progress = None
+        self.last_time = 0.0
+
+    def update(self, progress: float):
+        if self.callback is None:
+            return
+        now = time.monotonic()
+        if (self.last_progress is None or progress >= 100 or now - self.last_time >= self.min_interval
+                or progress - self.last_progress >= self.min_step):
+            self.last_progress = progress
+            self.last_time = now
+            self.callback(progress)
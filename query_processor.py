@@ -1,48 +1,413 @@
-import openai
+import logging
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 import numpy as np
-from typing import List, Dict
+from typing import Dict, Iterator, List, Tuple
 from config import Config
 from knowledge_graph import KnowledgeGraph
+from embedder import Embedder
+from llm_clients import chat_completion, get_chat_client, get_embedding_client, parse_json_response
+from rate_limiter import get_chat_concurrency_limiter
+from vector_index import get_node_vector_index
+from entity_linker import get_entity_linker, normalize_mention
+from graph_retrieval import expand_subgraph, format_context
+from community_summary import CommunityReport, get_community_index
+from chunk_store import get_chunk_store
+from chunk_index import get_chunk_index
+from token_utils import estimate_tokens
+
+# 全局查询的LLM调用作为一个使用方，与分析任务公平分配CHAT_MAX_CONCURRENCY
+QUERY_LLM_OWNER = 'query'
 
 class QueryProcessor:
-    def __init__(self, graph: KnowledgeGraph):
+    """
+    图的查询服务，线程安全，可在多个请求之间复用：
+    共享keep-alive的embedding客户端和检索索引，并按 (规范化查询, 图版本) 缓存查询结果
+    """
+    def __init__(self, graph: KnowledgeGraph, cache_size: int = None):
         self.graph = graph
-        self.openai_embedding_client = openai.OpenAI(
-            api_key=Config.EMBEDDING_API_KEY,
-            base_url=Config.EMBEDDING_MODEL_HOST
-        )
+        self.openai_embedding_client = get_embedding_client()
+        self.embedder = Embedder(self.openai_embedding_client)
+        self.vector_index = get_node_vector_index(graph, self.embedder)
+        self.entity_linker = get_entity_linker(graph)
+        self.community_index = get_community_index(graph)
+        chunk_store = get_chunk_store()
+        self.chunk_index = get_chunk_index(chunk_store) if chunk_store is not None else None
+        self.chat_client = get_chat_client()
+        self.concurrency_limiter = get_chat_concurrency_limiter()
+        self.cache_size = Config.QUERY_CACHE_SIZE if cache_size is None else cache_size
+        self.cache = OrderedDict()
+        self.cache_version = None
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
         
     def get_query_embedding(self, query: str) -> np.ndarray:
         """
         获取查询的embedding
         """
-        response = self.openai_embedding_client.embeddings.create(
-            input=query,
-            model=Config.EMBEDDING_MODEL
-        )
-        return np.array(response.data[0].embedding)
+        return self.embedder.embed_one(query)
         
-    def search_graph(self, query: str, top_k: int = 5) -> List[Dict]:
+    def search_graph(self, query: str, top_k: int = 5, query_embedding: np.ndarray = None,
+                     vector_matches: List[Tuple[str, float]] = None) -> List[Dict]:
+        """
+        检索与查询相关的节点：先用实体链接找出查询中直接提及的节点(得分1.0)，
+        不足top_k个时按查询与节点名称及别名的余弦相似度补足
+        Args:
+            vector_matches: 批量查询时预先检索到的 (节点, 相似度)，提供时不再单独做向量检索
+        """
+        matches = []
+        if Config.ENTITY_LINK_ENABLED:
+            for mention in self.entity_linker.link(query):
+                matches.extend((entity, 1.0, mention.text) for entity in mention.nodes)
+        if len(dict.fromkeys(entity for entity, _, _ in matches)) < top_k:
+            if vector_matches is None:
+                if query_embedding is None:
+                    query_embedding = self.get_query_embedding(query)
+                vector_matches = self.vector_index.search(query_embedding, top_k)
+            matches.extend((entity, score, None) for entity, score in vector_matches)
+
+        results = []
+        seen = set()
+        for entity, score, mention in matches:
+            if entity in seen:
+                continue
+            seen.add(entity)
+            attrs = self.graph.get_node(entity) or {}
+            results.append({
+                "entity": entity,
+                "type": attrs.get('type'),
+                "aliases": attrs.get('aliases', []),
+                "score": score,
+                "mention": mention
+            })
+            if len(results) == top_k:
+                break
+        return results
+
+    def expand_context(self, results: List[Dict]) -> Dict:
         """
-        在图和向量空间中进行检索
+        以检索到的节点为种子，在图的CSR快照上扩展k跳邻域得到上下文子图
         """
-        # TODO: 实现基于embedding的图检索
-        # 目前先返回简单的图搜索结果
-        entities = list(self.graph.graph.nodes)
-        return [{"entity": entity} for entity in entities[:top_k]]
+        seeds = [(result['entity'], result['score']) for result in results]
+        subgraph = expand_subgraph(self.graph.csr_snapshot(), seeds)
+        subgraph['text'] = format_context(subgraph)
+        return subgraph
         
-    def process_query(self, query: str) -> Dict:
+    def get_evidence(self, query: str, results: List[Dict], query_embedding: np.ndarray = None,
+                     top_k: int = None) -> List[Dict]:
+        """
+        返回支撑回答的原文片段：BM25、向量检索和提及检索到的实体(含别名)的chunk三路排名经RRF融合
+        """
+        if self.chunk_index is None:
+            return []
+        entities = [name for result in results for name in [result['entity']] + list(result['aliases'])]
+        return self.chunk_index.search(query, query_embedding, entities, top_k)
+
+    def warm_up(self):
+        """
+        预先同步向量索引、实体链接索引和CSR快照，避免首个查询承担构建开销
+        """
+        self.vector_index.refresh()
+        self.entity_linker.refresh()
+        self.graph.csr_snapshot()
+        if self.chunk_index is not None:
+            self.chunk_index.refresh()
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        return ' '.join(normalize_mention(query).split())
+
+    def _get_cached(self, key: str, version: int):
+        with self.lock:
+            # 图版本变化后旧版本的结果全部失效
+            if self.cache_version != version:
+                self.cache.clear()
+                self.cache_version = version
+            result = self.cache.get(key)
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.cache.move_to_end(key)
+            return result
+
+    def _put_cached(self, key: str, version: int, result: Dict):
+        with self.lock:
+            if self.cache_size <= 0 or self.cache_version != version:
+                return
+            self.cache[key] = result
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def stats(self) -> Dict:
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "items": len(self.cache),
+                "graph_version": self.cache_version
+            }
+
+    @staticmethod
+    def _cacheable(result: Dict, version: int) -> bool:
+        # 基于空的或旧版本图的社区摘要得到的全局查询结果不缓存，摘要生成后同一图版本的查询可以得到新的回答
+        if result.get('mode') != 'global':
+            return True
+        return result['communities'] > 0 and result['summary_version'] == version
+
+    def process_query(self, query: str, mode: str = 'local') -> Dict:
+        """
+        处理用户查询，图未变化时相同的查询直接返回缓存结果(调用方不应修改返回值)
+        Args:
+            mode: local - 检索相关节点并扩展邻域, global - 对社区摘要做map-reduce，适合关于整个语料的问题
+        """
+        if mode not in ('local', 'global'):
+            raise ValueError(f"未知的查询模式: {mode}")
+        key = f"{mode}|{self.normalize_query(query)}"
+        version = self.graph.version
+        result = self._get_cached(key, version)
+        if result is None:
+            result = self.global_search(query) if mode == 'global' else self._process_query(query)
+            if self._cacheable(result, version):
+                self._put_cached(key, version, result)
+        return result
+
+    def _process_query(self, query: str, query_embedding: np.ndarray = None,
+                       vector_matches: List[Tuple[str, float]] = None, expansions: Dict = None) -> Dict:
         """
-        处理用户查询
+        Args:
+            query_embedding, vector_matches: 批量查询时预先获取的embedding和向量检索结果
+            expansions: 批量查询内共享的 种子 -> 邻域扩展结果
         """
         # 获取查询embedding
-        query_embedding = self.get_query_embedding(query)
+        if query_embedding is None:
+            query_embedding = self.get_query_embedding(query)
         
         # 在图和向量空间中进行检索
-        results = self.search_graph(query)
+        results = self.search_graph(query, top_k=Config.RETRIEVAL_SEED_TOP_K, query_embedding=query_embedding,
+                                    vector_matches=vector_matches)
+
+        # 扩展种子节点的邻域，种子相同的查询复用扩展结果
+        seeds = tuple((result['entity'], result['score']) for result in results)
+        context = expansions.get(seeds) if expansions is not None else None
+        if context is None:
+            context = self.expand_context(results)
+            if expansions is not None:
+                expansions[seeds] = context
+
+        # 检索支撑的原文片段
+        evidence = self.get_evidence(query, results, query_embedding)
         
         return {
             "query": query,
             "embedding": query_embedding.tolist(),
-            "results": results
-        }
\ No newline at end of file
+            "results": results,
+            "context": context,
+            "evidence": evidence
+        }
+
+    def process_queries(self, queries: List[str], mode: str = 'local', timeout: float = None) -> Iterator[Dict]:
+        """
+        批量处理查询，按完成顺序逐条返回 {"index", "query", "result"}，超时的查询返回 {"index", "query", "error"}
+        缓存命中的查询最先返回；其余查询的embedding一次批量获取，向量检索合并为一次矩阵乘法，
+        批内相同的查询只处理一次，种子节点相同的查询共享邻域扩展结果；
+        单个查询出错时该查询返回 {"index", "query", "error"}，其余查询不受影响
+        Args:
+            timeout: 整批的处理时限(秒)，超过后尚未处理的查询返回超时错误；全局查询的map-reduce只使用剩余的时间
+        """
+        if mode not in ('local', 'global'):
+            raise ValueError(f"未知的查询模式: {mode}")
+        deadline = None if timeout is None else time.monotonic() + timeout
+        version = self.graph.version
+
+        # 规范化后相同的查询合并处理
+        pending: Dict[str, List[int]] = {}
+        for index, query in enumerate(queries):
+            key = f"{mode}|{self.normalize_query(query)}"
+            if key in pending:
+                pending[key].append(index)
+                continue
+            result = self._get_cached(key, version)
+            if result is None:
+                pending[key] = [index]
+            else:
+                yield {"index": index, "query": query, "result": result}
+        if not pending:
+            return
+
+        keys = list(pending)
+        # 批量获取embedding之前先检查时限
+        if deadline is not None and time.monotonic() > deadline:
+            for key in keys:
+                for index in pending[key]:
+                    yield {"index": index, "query": queries[index], "error": "timeout"}
+            return
+        if mode == 'local':
+            try:
+                embeddings = self.embedder.embed([queries[pending[key][0]] for key in keys])
+                vector_matches = self.vector_index.search_many(embeddings, Config.RETRIEVAL_SEED_TOP_K)
+            except Exception as e:
+                # 批量embedding失败时所有未处理的查询返回错误，而不是中断已开始的流式响应
+                logging.exception("批量查询的embedding失败")
+                for key in keys:
+                    for index in pending[key]:
+                        yield {"index": index, "query": queries[index], "error": str(e) or type(e).__name__}
+                return
+            expansions = {}
+
+        for i, key in enumerate(keys):
+            indices = pending[key]
+            if deadline is not None and time.monotonic() > deadline:
+                for index in indices:
+                    yield {"index": index, "query": queries[index], "error": "timeout"}
+                continue
+            query = queries[indices[0]]
+            error = None
+            try:
+                if mode == 'local':
+                    result = self._process_query(query, embeddings[i], vector_matches[i], expansions)
+                else:
+                    # 全局查询的map-reduce只使用剩余的时间
+                    result = self.global_search(
+                        query, timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+            except FuturesTimeoutError:
+                error = "timeout"
+            except Exception as e:
+                # 单个查询失败(如LLM接口错误)只影响该查询，其余查询继续返回
+                logging.exception(f"批量查询失败: {query}")
+                error = str(e) or type(e).__name__
+            if error is not None:
+                for index in indices:
+                    yield {"index": index, "query": queries[index], "error": error}
+                continue
+            if self._cacheable(result, version):
+                self._put_cached(key, version, result)
+            for index in indices:
+                yield {"index": index, "query": queries[index], "result": result}
+
+    def global_search(self, query: str, level: int = None, timeout: float = None) -> Dict:
+        """
+        全局查询：不访问图中的节点，只对预先生成的社区摘要做map-reduce
+        map阶段将摘要按token预算分批，并发地从每批中提取与查询相关的要点并打分；
+        reduce阶段按得分汇总要点生成回答
+        Args:
+            timeout: 处理时限(秒)，超时后不再等待进行中的LLM调用并取消尚未开始的调用
+        Raises:
+            concurrent.futures.TimeoutError: 超过处理时限
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        def remaining():
+            return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+        # 摘要由分析任务生成，查询只使用最近一次生成完成的摘要，落后于当前图版本时在后台补生成
+        self.community_index.refresh_in_background()
+        level, reports, summary_version = self.community_index.get_reports(level)
+
+        batches = []
+        budget = Config.GLOBAL_SEARCH_MAP_MAX_TOKENS
+        for report in sorted(reports, key=lambda report: report.size, reverse=True):
+            tokens = estimate_tokens(report.summary)
+            if not batches or batch_tokens + tokens > budget:
+                batches.append([])
+                batch_tokens = 0
+            batches[-1].append(report)
+            batch_tokens += tokens
+
+        points = []
+        executor = ThreadPoolExecutor(max_workers=max(1, min(len(batches), Config.COMMUNITY_SUMMARY_CONCURRENCY)))
+        try:
+            futures = [executor.submit(self._map_reports, query, batch) for batch in batches]
+            for future in futures:
+                points.extend(future.result(timeout=remaining()))
+            points.sort(key=lambda point: point['score'], reverse=True)
+            answer = executor.submit(self._reduce_points, query, points).result(timeout=remaining())
+        finally:
+            # 超时时不等待仍在进行的调用
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        return {
+            "query": query,
+            "mode": "global",
+            "level": level,
+            "communities": len(reports),
+            "summary_version": summary_version,
+            "points": points,
+            "answer": answer
+        }
+
+    def _map_reports(self, query: str, reports: List[CommunityReport]) -> List[Dict]:
+        """
+        从一批社区摘要中提取与查询相关的要点，返回 [{point, score, communities}]
+        """
+        sections = '\n'.join(f"【社区{report.community}】{report.summary}" for report in reports)
+        prompt = f"""
+        以下是知识图谱中若干社区的摘要，请找出其中与问题相关的要点，并为每个要点给出0-100的重要性评分，没有相关内容时返回空列表，不返回任何提示文本和解释文本：
+        问题：{query}
+        {sections}
+        返回JSON格式：{{"points": [{{"point": "要点", "score": 评分, "communities": [社区编号]}}]}}
+        """
+        try:
+            with self.concurrency_limiter.slot(QUERY_LLM_OWNER):
+                response = chat_completion(self.chat_client, prompt)
+            result = parse_json_response(response)
+        except (ValueError, SyntaxError):
+            return []
+        points = []
+        for item in result.get('points', []) if isinstance(result, dict) else []:
+            if not isinstance(item, dict) or not item.get('point'):
+                continue
+            try:
+                score = float(item.get('score', 0))
+            except (TypeError, ValueError):
+                continue
+            if score > 0:
+                points.append({"point": str(item['point']), "score": score,
+                               "communities": item.get('communities', [])})
+        return points
+
+    def _reduce_points(self, query: str, points: List[Dict]) -> str:
+        """
+        按得分从高到低选取不超过token预算的要点生成最终回答，没有要点时返回None
+        """
+        lines = []
+        budget = Config.GLOBAL_SEARCH_REDUCE_MAX_TOKENS
+        for point in points:
+            line = f"- {point['point']}（重要性{point['score']:g}）"
+            budget -= estimate_tokens(line) + 1
+            if budget < 0:
+                break
+            lines.append(line)
+        if not lines:
+            return None
+        points_text = '\n'.join(lines)
+        prompt = f"""
+        请根据以下按重要性排序的要点回答问题，不返回任何提示文本和解释文本：
+        问题：{query}
+        要点：
+        {points_text}
+        """
+        with self.concurrency_limiter.slot(QUERY_LLM_OWNER):
+            return chat_completion(self.chat_client, prompt).strip()
+
+_processors = weakref.WeakKeyDictionary()
+_processors_lock = threading.Lock()
+
+
+def get_query_processor(graph: KnowledgeGraph) -> QueryProcessor:
+    """
+    获取图对应的查询服务，同一个图在多次请求之间复用
+    """
+    with _processors_lock:
+        processor = _processors.get(graph)
+        if processor is None:
+            processor = QueryProcessor(graph)
+            _processors[graph] = processor
+        return processor
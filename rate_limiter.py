@@ -0,0 +1,179 @@
+import itertools
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Hashable, List, Tuple
+import openai
+from config import Config
+
+
+class RateLimiter:
+    """
+    按每分钟请求数(RPM)和每分钟token数(TPM)限流的令牌桶，可在多线程间共享
+    值为0表示不限制
+    """
+    def __init__(self, requests_per_minute: int = 0, tokens_per_minute: int = 0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.request_allowance = float(requests_per_minute)
+        self.token_allowance = float(tokens_per_minute)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.updated
+        self.updated = now
+        if self.requests_per_minute:
+            self.request_allowance = min(self.requests_per_minute,
+                                         self.request_allowance + elapsed * self.requests_per_minute / 60)
+        if self.tokens_per_minute:
+            self.token_allowance = min(self.tokens_per_minute,
+                                       self.token_allowance + elapsed * self.tokens_per_minute / 60)
+
+    def acquire(self, tokens: int = 0):
+        """
+        阻塞直到可以发出一个消耗tokens个token的请求
+        """
+        while True:
+            with self.lock:
+                self._refill()
+                # 单个请求超过TPM上限时按上限计算，避免永久等待
+                tokens_needed = min(tokens, self.tokens_per_minute)
+                wait = 0.0
+                if self.requests_per_minute and self.request_allowance < 1:
+                    wait = (1 - self.request_allowance) * 60 / self.requests_per_minute
+                if self.tokens_per_minute and self.token_allowance < tokens_needed:
+                    wait = max(wait, (tokens_needed - self.token_allowance) * 60 / self.tokens_per_minute)
+                if wait == 0:
+                    if self.requests_per_minute:
+                        self.request_allowance -= 1
+                    if self.tokens_per_minute:
+                        self.token_allowance -= tokens_needed
+                    return
+            time.sleep(wait)
+
+
+class FairConcurrencyLimiter:
+    """
+    在多个使用方(如同时运行的分析任务)之间公平分配的并发上限，可在多线程间共享：
+    满载时释放的名额优先分给当前占用最少的等待方，占用相同时先到先得
+    max_concurrency为0表示不限制
+    """
+    def __init__(self, max_concurrency: int = 0):
+        self.max_concurrency = max_concurrency
+        self.condition = threading.Condition()
+        self.in_use = 0
+        self.active: Dict[Hashable, int] = {}  # 使用方 -> 占用的名额数
+        self.waiting: List[Tuple[Hashable, int]] = []  # (使用方, 排队序号)
+        self.tickets = itertools.count()
+
+    def _can_acquire(self, ticket: Tuple[Hashable, int]) -> bool:
+        if self.in_use >= self.max_concurrency:
+            return False
+        return min(self.waiting, key=lambda waiter: (self.active.get(waiter[0], 0), waiter[1])) is ticket
+
+    def acquire(self, owner: Hashable = None):
+        """
+        阻塞直到owner获得一个名额
+        """
+        if not self.max_concurrency:
+            return
+        with self.condition:
+            ticket = (owner, next(self.tickets))
+            self.waiting.append(ticket)
+            self.condition.wait_for(lambda: self._can_acquire(ticket))
+            self.waiting.remove(ticket)
+            self.in_use += 1
+            self.active[owner] = self.active.get(owner, 0) + 1
+            # 仍有空闲名额时下一个等待方也可以获得
+            self.condition.notify_all()
+
+    def release(self, owner: Hashable = None):
+        if not self.max_concurrency:
+            return
+        with self.condition:
+            self.in_use -= 1
+            self.active[owner] -= 1
+            if not self.active[owner]:
+                del self.active[owner]
+            self.condition.notify_all()
+
+    @contextmanager
+    def slot(self, owner: Hashable = None):
+        self.acquire(owner)
+        try:
+            yield
+        finally:
+            self.release(owner)
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """
+    限流(429)、服务端错误(5xx)和连接错误可以重试
+    """
+    if isinstance(error, openai.APIConnectionError):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+def _retry_after(error: Exception) -> float:
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+def call_with_retry(func, max_retries: int = None, base_delay: float = None, max_delay: float = None):
+    """
+    调用func，遇到可重试错误时按指数退避(带抖动)重试，优先遵循Retry-After响应头
+    """
+    max_retries = Config.LLM_MAX_RETRIES if max_retries is None else max_retries
+    base_delay = base_delay or Config.LLM_RETRY_BASE_DELAY
+    max_delay = max_delay or Config.LLM_RETRY_MAX_DELAY
+    for attempt in range(max_retries + 1):
+        try:
+            return func()
+        except Exception as e:
+            if attempt == max_retries or not is_retryable_error(e):
+                raise
+            delay = _retry_after(e)
+            if delay is None:
+                delay = min(max_delay, base_delay * 2 ** attempt) * (0.5 + random.random() / 2)
+            time.sleep(delay)
+
+
+_chat_rate_limiter = None
+_chat_rate_limiter_lock = threading.Lock()
+
+
+def get_chat_rate_limiter() -> RateLimiter:
+    """
+    获取进程内共享的Chat模型限流器，同一API key的所有请求共用额度
+    """
+    global _chat_rate_limiter
+    with _chat_rate_limiter_lock:
+        if _chat_rate_limiter is None:
+            _chat_rate_limiter = RateLimiter(Config.CHAT_REQUESTS_PER_MINUTE, Config.CHAT_TOKENS_PER_MINUTE)
+        return _chat_rate_limiter
+
+
+_chat_concurrency_limiter = None
+_chat_concurrency_limiter_lock = threading.Lock()
+
+
+def get_chat_concurrency_limiter() -> FairConcurrencyLimiter:
+    """
+    获取进程内共享的抽取LLM并发限制，在同时运行的分析任务之间公平分配
+    """
+    global _chat_concurrency_limiter
+    with _chat_concurrency_limiter_lock:
+        if _chat_concurrency_limiter is None:
+            _chat_concurrency_limiter = FairConcurrencyLimiter(Config.CHAT_MAX_CONCURRENCY)
+        return _chat_concurrency_limiter
@@ -1,9 +1,11 @@
 from networkx import edges
+import json
+import threading
+import time
 import streamlit as st
 import requests
 from pyvis.network import Network
 from streamlit_chat import message
-from streamlit_autorefresh import st_autorefresh
 import networkx as nx
 
 FLASK_APP_PORT = 9200
@@ -15,6 +17,16 @@ FLASK_BASE_PATH = "/graph-rag/api"
 DOMAIN = f"http://localhost:{FLASK_APP_PORT}"
 API_URL = f"{DOMAIN}/{FLASK_BASE_PATH}"
 
+# 图可视化配置
+GRAPH_RENDER_MAX_NODES = 500  # 一次最多渲染的节点数，超出时只显示度数最高的节点
+GRAPH_RENDER_HEIGHT = 600
+GRAPH_RESPONSE_CACHE_SIZE = 8  # 会话内按请求参数保留的图数据条数
+
+# 事件订阅配置
+EVENT_CHECK_INTERVAL = 1  # 页面检查是否有新事件的间隔(秒)，只在有新事件时重新运行整个页面
+EVENT_READ_TIMEOUT = 60  # 事件流的读取超时(秒)，应大于服务端的保活间隔
+EVENT_RECONNECT_DELAY = 3  # 事件流断开后重新连接的等待时间(秒)
+
 def check_analysis_status():
     try:
         response = requests.get(f"{API_URL}/progress")
@@ -24,8 +36,12 @@ def check_analysis_status():
     except:
         return {'is_running': False, 'progress': 0}
 
-def start_analysis(text_input, uploaded_file):
-    data = {'text': text_input}
+def start_analysis(text_input, uploaded_file, incremental=False, bypass_cache=False):
+    data = {
+        'text': text_input,
+        'incremental': 'true' if incremental else 'false',
+        'bypass_cache': 'true' if bypass_cache else 'false'
+    }
     files = None
     
     if uploaded_file is not None:
@@ -39,11 +55,95 @@ def stop_analysis():
     response = requests.post(f"{API_URL}/stop")
     return response.status_code == 200
 
-def get_graph():
-    response = requests.get(f"{API_URL}/graph")
+def get_graph(params=None):
+    """
+    获取图数据，同一请求参数的上一次响应按ETag复用，图未变化时服务端返回304
+    Returns:
+        (ETag, 图数据)，图或节点不存在时返回 (None, None)
+    """
+    params = params or {}
+    cache = st.session_state.setdefault('graph_responses', {})
+    key = tuple(sorted(params.items()))
+    cached = cache.get(key)
+    headers = {'If-None-Match': cached[0]} if cached and cached[0] else {}
+    response = requests.get(f"{API_URL}/graph", params=params, headers=headers)
+    if response.status_code == 304 and cached:
+        return cached
     if response.status_code == 200:
-        return response.json()
-    return None
+        cache.pop(key, None)
+        cache[key] = (response.headers.get('ETag'), response.json())
+        while len(cache) > GRAPH_RESPONSE_CACHE_SIZE:
+            cache.pop(next(iter(cache)))
+        return cache[key]
+    return None, None
+
+class EventListener:
+    """
+    在后台线程中订阅Flask的SSE事件流，保存每种类型的最新事件，断线后按Last-Event-ID重新连接
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.last_id = 0
+        self.events = {}  # 事件类型 -> 最新数据
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                headers = {'Last-Event-ID': str(self.last_id)} if self.last_id else {}
+                with requests.get(f"{API_URL}/events", headers=headers, stream=True,
+                                  timeout=(5, EVENT_READ_TIMEOUT)) as response:
+                    self._consume(response)
+            except (requests.RequestException, ValueError):
+                pass
+            time.sleep(EVENT_RECONNECT_DELAY)
+
+    def _consume(self, response):
+        event_id, event_type, data = None, 'message', []
+        # 事件很小且频率受服务端限制，逐字节读取以便事件到达后立即处理
+        for line in response.iter_lines(chunk_size=1, decode_unicode=True):
+            if line.startswith('id:'):
+                event_id = int(line[3:].strip())
+            elif line.startswith('event:'):
+                event_type = line[6:].strip()
+            elif line.startswith('data:'):
+                data.append(line[5:].strip())
+            elif not line and data:
+                with self.lock:
+                    self.events[event_type] = json.loads('\n'.join(data))
+                    if event_id is not None:
+                        self.last_id = event_id
+                event_id, event_type, data = None, 'message', []
+
+    def snapshot(self):
+        """
+        返回 (最新事件序号, 事件类型 -> 最新数据)
+        """
+        with self.lock:
+            return self.last_id, dict(self.events)
+
+_event_listener = None
+_event_listener_lock = threading.Lock()
+
+def get_event_listener():
+    """
+    获取进程内共享的事件订阅，所有会话共用一个连接
+    """
+    global _event_listener
+    with _event_listener_lock:
+        if _event_listener is None:
+            _event_listener = EventListener()
+        return _event_listener
+
+@st.fragment(run_every=EVENT_CHECK_INTERVAL)
+def watch_events():
+    """
+    定期检查后台订阅收到的事件(不发请求)，有新事件时才重新运行整个页面
+    """
+    event_id, _ = get_event_listener().snapshot()
+    if event_id != st.session_state.get('event_id'):
+        st.rerun()
 
 def query_graph_rag(query):
     response = requests.post(f"{API_URL}/query", json={'query': query})
@@ -51,24 +151,47 @@ def query_graph_rag(query):
         return response.json()['result']
     return None
 
-def visualize_graph(graph_data):
-    if not graph_data:
-        return
-    
-    G = nx.node_link_graph(graph_data, edges="links")
+@st.cache_data(max_entries=16, show_spinner=False)
+def render_graph_html(etag, view, _graph_data):
+    """
+    生成图的HTML，按 (ETag, 视图) 缓存，图版本不变时不重新生成；不写临时文件
+    """
+    G = nx.node_link_graph(_graph_data, edges="links")
     net = Network(
-        height="600px", 
-        width="100%", 
-        notebook=True
+        height=f"{GRAPH_RENDER_HEIGHT}px",
+        width="100%",
+        cdn_resources="in_line"
         )
     net.from_nx(G)
-    
-    net.show("graph.html")
-    st.components.v1.html(open("graph.html", 'r', encoding='utf-8').read(), height=600)
+    return net.generate_html()
+
+def visualize_graph():
+    """
+    大图先显示度数最高的节点概览，输入节点名称后显示该节点的邻域
+    """
+    etag, graph_data = get_graph({'top': GRAPH_RENDER_MAX_NODES})
+    if not graph_data:
+        return
+    st.write("知识图谱可视化")
+
+    view = "overview"
+    focus = st.text_input("查看节点邻域（留空显示概览）:", key="graph_focus").strip()
+    if focus:
+        hops = st.slider("邻域跳数", min_value=1, max_value=3, value=1, key="graph_hops")
+        focus_etag, focus_data = get_graph({'node': focus, 'hops': hops, 'top': GRAPH_RENDER_MAX_NODES})
+        if focus_data:
+            etag, graph_data, view = focus_etag, focus_data, f"{focus}|{hops}"
+        else:
+            st.warning(f"节点不存在: {focus}")
+
+    if graph_data['total_nodes'] < graph_data['graph_nodes']:
+        st.caption(f"显示 {len(graph_data['nodes'])} / {graph_data['graph_nodes']} 个节点")
+    st.components.v1.html(render_graph_html(etag, view, graph_data), height=GRAPH_RENDER_HEIGHT)
 
 def streamlit_ui():
-    count = st_autorefresh(interval=3 * 1000, key="dataframerefresh")
-    st.write(f"最后刷新时间: {count}")
+    # 页面只在服务端推送新事件或用户操作时重新运行
+    event_id, events = get_event_listener().snapshot()
+    st.session_state.event_id = event_id
     st.title("知识图谱分析系统")
 
     if 'user_past' not in st.session_state:
@@ -79,9 +202,11 @@ def streamlit_ui():
     # 文件上传
     uploaded_file = st.file_uploader("上传文件", type=['txt', 'docx', 'xlsx'])
     text_input = st.text_area("或直接输入文本进行分析", height=200)
+    incremental = st.checkbox("增量分析（追加到已有知识图谱）")
+    bypass_cache = st.checkbox("忽略抽取缓存（重新调用LLM）")
 
     # 分析控制
-    status = check_analysis_status()
+    status = events.get('progress') or check_analysis_status()
     if status['is_running']:
         if st.button("停止分析"):
             if stop_analysis():
@@ -90,7 +215,7 @@ def streamlit_ui():
                 st.error("停止分析失败")
     else:
         if st.button("开始分析") and (text_input.strip() or uploaded_file is not None):
-            if start_analysis(text_input=text_input, uploaded_file=uploaded_file):
+            if start_analysis(text_input=text_input, uploaded_file=uploaded_file, incremental=incremental, bypass_cache=bypass_cache):
                 st.success("分析已开始")
             else:
                 st.error("分析启动失败")
@@ -98,16 +223,17 @@ def streamlit_ui():
     # 进度条
     if status['is_running']:
         st.progress(status['progress'] / 100, f"分析进度: {status['progress']:.1f}%")
+        if 'chunks' in events and 'stage' in events:
+            chunks = events['chunks']
+            st.caption(f"阶段: {events['stage']['stage']}，已处理 {chunks['done']} 个chunk "
+                       f"({chunks['done_chars']}/{chunks['total_chars']} 字符)")
     else:
         if status['progress'] == 100:
             st.success("知识图谱分析完成")
             st.balloons()
 
     # 可视化
-    graph_data = get_graph()
-    if graph_data:
-        st.write("知识图谱可视化")
-        visualize_graph(graph_data)
+    visualize_graph()
 
     def on_input_change():
         query = st.session_state.user_input
@@ -135,3 +261,5 @@ def streamlit_ui():
     with st.container():
         st.text_input("输入查询问题:", on_change=on_input_change, key="user_input", )
 
+    watch_events()
+
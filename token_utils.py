@@ -0,0 +1,18 @@
+import numpy as np
+
+
+def char_token_weights(codepoints: np.ndarray) -> np.ndarray:
+    """
+    估算每个字符占用的token数
+    CJK等非ASCII字符通常单独成为一个token，ASCII字符约4个字符一个token
+    """
+    return np.where(codepoints > 127, 1.0, 0.25)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    估算文本的token数，用于批量请求和chunk大小的预算控制
+    """
+    ascii_count = len(text.encode('ascii', 'ignore'))
+    non_ascii_count = len(text) - ascii_count
+    return non_ascii_count + (ascii_count + 3) // 4
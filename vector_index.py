@@ -0,0 +1,162 @@
+import threading
+import weakref
+from typing import List, Tuple
+import numpy as np
+from dedup import normalize_rows
+from embedder import Embedder
+from knowledge_graph import KnowledgeGraph
+
+
+class NodeVectorIndex:
+    """
+    节点向量检索索引：节点名称和别名的embedding存为归一化float32矩阵，
+    每行对应一个名称或别名，row_nodes记录行所属节点，按余弦相似度返回top-k节点
+    图版本变化时自动追加新节点和新别名，节点被删除时全量重建
+    """
+    def __init__(self, graph: KnowledgeGraph, embedder: Embedder):
+        self.graph = graph
+        self.embedder = embedder
+        self.lock = threading.Lock()  # 保护索引的矩阵和行映射，查询只短暂持有
+        self.refresh_lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.version = None
+        self.cursor = None  # 图的node_changes游标
+        self.node_names = []
+        self.node_ids = {}
+        self.indexed_texts = []  # 每个节点已索引的名称和别名
+        self.row_nodes = np.zeros(0, dtype=np.int64)
+        self._matrix = None
+        self.row_count = 0
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return self._matrix[:self.row_count]
+
+    def refresh(self):
+        """
+        图版本变化时同步索引
+        新增文本的embedding(可能需要请求接口)在不持有self.lock时获取，期间查询使用已有的索引；
+        同一时间只有一次同步，由refresh_lock保证
+        """
+        with self.refresh_lock:
+            version = self.graph.version
+            with self.lock:
+                if self.version == version:
+                    return
+            # 节点被删除时在空的状态上全量重建，完成后再替换
+            rebuild = self.graph.number_of_nodes() < len(self.node_names)
+            cursor = None if rebuild else self.cursor
+            node_names = [] if rebuild else self.node_names
+            node_ids = {} if rebuild else self.node_ids
+            indexed_texts = [] if rebuild else self.indexed_texts
+            nodes, cursor = self.graph.node_changes(cursor)
+
+            # 先收集新增的节点和文本，embedding成功后才写入索引状态
+            new_ids = {}  # 新节点名称 -> 节点ID
+            added = {}  # 节点ID -> 本次新增的名称和别名
+            new_texts = []
+            new_rows = []
+            for name, attrs in nodes:
+                node_id = node_ids.get(name, new_ids.get(name))
+                if node_id is None:
+                    node_id = len(node_names) + len(new_ids)
+                    new_ids[name] = node_id
+                indexed = indexed_texts[node_id] if node_id < len(indexed_texts) else ()
+                texts = added.setdefault(node_id, set())
+                for text in [name] + list(attrs.get('aliases', [])):
+                    if text not in indexed and text not in texts:
+                        texts.add(text)
+                        new_texts.append(text)
+                        new_rows.append(node_id)
+            vectors = self._embed(new_texts) if new_texts else None
+
+            with self.lock:
+                if rebuild:
+                    self._reset()
+                    self.node_names, self.node_ids, self.indexed_texts = node_names, node_ids, indexed_texts
+                for name, node_id in new_ids.items():
+                    self.node_ids[name] = node_id
+                    self.node_names.append(name)
+                    self.indexed_texts.append(set())
+                for node_id, texts in added.items():
+                    self.indexed_texts[node_id].update(texts)
+                if vectors is not None:
+                    self._append(vectors, np.asarray(new_rows, dtype=np.int64))
+                self.cursor = cursor
+                # embedding期间图可能又有变化，cursor之后的变化由下一次同步处理
+                self.version = version
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        # 已存储的节点embedding直接复用，其余(主要是别名)通过带缓存的embedder获取
+        vectors = [self.graph.embeddings.get(text) for text in texts]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            for i, vector in zip(missing, self.embedder.embed([texts[i] for i in missing])):
+                vectors[i] = vector
+        return normalize_rows(np.vstack(vectors))
+
+    def _append(self, vectors: np.ndarray, row_nodes: np.ndarray):
+        needed = self.row_count + len(vectors)
+        if self._matrix is None or needed > self._matrix.shape[0] or self._matrix.shape[1] != vectors.shape[1]:
+            capacity = max(needed, 0 if self._matrix is None else self._matrix.shape[0] * 2)
+            grown = np.zeros((capacity, vectors.shape[1]), dtype=np.float32)
+            if self._matrix is not None and self.row_count:
+                grown[:self.row_count] = self.matrix
+            self._matrix = grown
+        self._matrix[self.row_count:needed] = vectors
+        self.row_nodes = np.concatenate([self.row_nodes, row_nodes])
+        self.row_count = needed
+
+    def search(self, query_embedding: np.ndarray, top_k: int = 5) -> List[Tuple[str, float]]:
+        """
+        返回与查询最相似的top_k个节点及相似度，节点得分取其名称和别名中的最大值
+        """
+        return self.search_many(np.asarray(query_embedding)[None, :], top_k)[0]
+
+    def search_many(self, query_embeddings: np.ndarray, top_k: int = 5) -> List[List[Tuple[str, float]]]:
+        """
+        一次矩阵乘法为多个查询检索top_k个节点
+        """
+        self.refresh()
+        with self.lock:
+            if self.row_count == 0 or top_k <= 0:
+                return [[] for _ in range(len(query_embeddings))]
+            sims = normalize_rows(query_embeddings) @ self.matrix.T
+            row_nodes = self.row_nodes
+            node_names = self.node_names
+
+        results = []
+        for row_sims in sims:
+            # 多取一些行，去掉同一节点的重复别名后仍能凑够top_k个节点
+            candidates = min(len(row_sims), top_k * 4)
+            while True:
+                top = np.argpartition(-row_sims, candidates - 1)[:candidates]
+                top = top[np.argsort(-row_sims[top])]
+                seen = {}
+                for row in top:
+                    seen.setdefault(row_nodes[row], row_sims[row])
+                    if len(seen) == top_k:
+                        break
+                if len(seen) == top_k or candidates == len(row_sims):
+                    break
+                candidates = min(len(row_sims), candidates * 4)
+            results.append([(node_names[node], float(score)) for node, score in seen.items()])
+        return results
+
+
+_indexes = weakref.WeakKeyDictionary()
+_indexes_lock = threading.Lock()
+
+
+def get_node_vector_index(graph: KnowledgeGraph, embedder: Embedder) -> NodeVectorIndex:
+    """
+    获取图对应的向量索引，同一个图的索引在多次查询之间复用
+    """
+    with _indexes_lock:
+        index = _indexes.get(graph)
+        if index is None:
+            index = NodeVectorIndex(graph, embedder)
+            _indexes[graph] = index
+        return index